@@ -0,0 +1,562 @@
+"""
+This module benchmarks SakayDB on synthetic ride-hailing data.
+
+
+Commands
+-------
+
+    generate - writes drivers.csv, locations.csv and trips.csv to
+               a data directory at a given scale, e.g.,
+               python benchmark.py generate data_1m --scale 1m
+
+    run - times the public methods of SakayDB on a copy of a data
+          directory and prints the results as JSON, e.g.,
+          python benchmark.py run data_1m --output results.json
+
+
+Main Functions
+-------
+
+    generate_data
+    run_benchmarks
+
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from sakaydb import DATETIME_FORMAT, SakayDB, STORAGE_FORMATS, \
+    TABLE_COLUMNS, TRIP_PARTITIONS
+
+
+SCALES = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+
+GIVEN_NAMES = ['Jose', 'Maria', 'Juan', 'Ana', 'Mark', 'Kristine',
+               'John', 'Angelica', 'Michael', 'Jennifer', 'Paolo',
+               'Patricia', 'Carlo', 'Camille', 'Miguel', 'Andrea',
+               'Rafael', 'Nicole', 'Gabriel', 'Bea', 'Antonio', 'Joy',
+               'Ramon', 'Grace', 'Eduardo', 'Rosario', 'Manuel',
+               'Teresa', 'Ricardo', 'Carmela']
+
+LAST_NAMES = ['Santos', 'Reyes', 'Cruz', 'Bautista', 'Ocampo', 'Garcia',
+              'Mendoza', 'Torres', 'Tomas', 'Andrada', 'Castillo',
+              'Flores', 'Villanueva', 'Ramos', 'Castro', 'Rivera',
+              'Aquino', 'Navarro', 'Salazar', 'Mercado', 'Dela Cruz',
+              'Gonzales', 'Lopez', 'Estrada', 'Lazaro', 'Tibayan',
+              'Catangui', 'Lu', 'Domingo', 'Pascual']
+
+CITIES = ['Makati', 'Taguig', 'Pasig', 'Quezon City', 'Manila',
+          'Mandaluyong', 'San Juan', 'Pasay', 'Paranaque', 'Las Pinas',
+          'Muntinlupa', 'Marikina', 'Caloocan', 'Valenzuela',
+          'Malabon', 'Navotas', 'Pateros']
+
+HOUR_WEIGHTS = [2, 1, 1, 1, 1, 2, 4, 7, 8, 6, 5, 5, 6, 5, 5, 6, 7, 9, 9,
+                8, 6, 5, 4, 3]
+
+PASSENGER_WEIGHTS = [0.02, 0.68, 0.15, 0.06, 0.04, 0.03, 0.02]
+
+
+def driver_name(k):
+    """
+    This function returns the given and last name of the k-th
+    synthetic driver, counting from 0. Names are unique.
+
+    Parameters
+    ----------
+    k : int
+        Driver number
+
+    Returns
+    -------
+    Tuple of the given name and last name
+
+    """
+    given = GIVEN_NAMES[k % len(GIVEN_NAMES)]
+    last = LAST_NAMES[k // len(GIVEN_NAMES) % len(LAST_NAMES)]
+    suffix = k // (len(GIVEN_NAMES) * len(LAST_NAMES))
+    if suffix > 0:
+        last = f'{last} {suffix + 1}'
+    return given, last
+
+
+def location_name(k):
+    """
+    This function returns the name of the k-th synthetic zone,
+    counting from 0. Names are unique.
+
+    Parameters
+    ----------
+    k : int
+        Zone number
+
+    Returns
+    -------
+    str
+
+    """
+    return f'{CITIES[k % len(CITIES)]} District {k // len(CITIES) + 1}'
+
+
+def generate_data(data_dir, trips, drivers=None, locations=265, days=365,
+                  start='2020-01-01', seed=0, text_datetimes=False,
+                  chunksize=1_000_000):
+    """
+    This function writes drivers.csv, locations.csv and trips.csv
+    with synthetic data to data_dir, along with benchmark.json
+    holding the parameters used. The same parameters always give
+    the same data.
+
+    Trips are spread over days starting on start, with more
+    pickups at rush hours. Pickup zones and drivers are drawn with
+    skewed weights, so a few zones and drivers account for most
+    trips, and distances and fares follow the trip duration.
+
+    Parameters
+    ----------
+    data_dir : str
+        Directory to write to, which is created if needed
+
+    trips : int
+        Number of trips
+
+    drivers : int or None
+        Number of drivers. Defaults to None, in which case there is
+        one driver per 500 trips, and at least 100
+
+    locations : int
+        Number of zones. Defaults to 265
+
+    days : int
+        Number of days with pickups. Defaults to 365
+
+    start : str
+        First day with pickups, as YYYY-MM-DD. Defaults to
+        2020-01-01
+
+    seed : int
+        Seed of the random number generator. Defaults to 0
+
+    text_datetimes : bool
+        Whether to write datetimes formatted as
+        "hh:mm:ss,DD-MM-YYYY", as older versions of sakaydb did,
+        instead of seconds since 1970-01-01. Defaults to False
+
+    chunksize : int
+        Number of trips generated at a time. Defaults to 1000000
+
+    Returns
+    -------
+    Dictionary of the parameters, as written to benchmark.json
+
+    """
+    if drivers is None:
+        drivers = max(100, trips // 500)
+    rng = np.random.default_rng(seed)
+    os.makedirs(data_dir, exist_ok=True)
+
+    names = [driver_name(k) for k in range(drivers)]
+    pd.DataFrame({'driver_id': np.arange(1, drivers + 1),
+                  'given_name': [given for given, last in names],
+                  'last_name': [last for given, last in names]})\
+        .to_csv(f'{data_dir}/drivers.csv', index=False)
+
+    pd.DataFrame({'location_id': np.arange(1, locations + 1),
+                  'loc_name': [location_name(k) for k in range(locations)]})\
+        .to_csv(f'{data_dir}/locations.csv', index=False)
+
+    zone_weights = 1 / np.arange(1, locations + 1) ** 0.8
+    zone_weights = rng.permutation(zone_weights / zone_weights.sum())
+    driver_weights = rng.gamma(0.7, size=drivers)
+    driver_weights /= driver_weights.sum()
+    hour_weights = np.array(HOUR_WEIGHTS) / sum(HOUR_WEIGHTS)
+    first_second = int(pd.Timestamp(start).value // 10**9)
+
+    fn = f'{data_dir}/trips.csv'
+    for lo in range(0, trips, chunksize):
+        n = min(chunksize, trips - lo)
+        pickup = (first_second + rng.integers(0, days, n) * 86400 +
+                  rng.choice(24, n, p=hour_weights) * 3600 +
+                  rng.integers(0, 3600, n))
+        duration = np.clip(rng.lognormal(np.log(900), 0.6, n),
+                           60, 3 * 3600).astype('int64')
+        distance = np.round(duration * rng.uniform(2.5, 9, n), 2)
+        fare = np.round(40 + 13.5 * distance / 1000 + 2 * duration / 60, 2)
+
+        df = pd.DataFrame({
+            'trip_id': np.arange(lo + 1, lo + n + 1),
+            'driver_id': rng.choice(drivers, n, p=driver_weights) + 1,
+            'pickup_datetime': pickup,
+            'dropoff_datetime': pickup + duration,
+            'passenger_count': rng.choice(len(PASSENGER_WEIGHTS), n,
+                                          p=PASSENGER_WEIGHTS),
+            'pickup_loc_id': rng.choice(locations, n, p=zone_weights) + 1,
+            'dropoff_loc_id': rng.choice(locations, n, p=zone_weights) + 1,
+            'trip_distance': distance,
+            'fare_amount': fare
+        })
+        if text_datetimes:
+            for col in ['pickup_datetime', 'dropoff_datetime']:
+                df[col] = pd.to_datetime(df[col], unit='s')\
+                    .dt.strftime(DATETIME_FORMAT)
+        df.to_csv(fn, mode='w' if lo == 0 else 'a', header=lo == 0,
+                  index=False)
+
+    if trips == 0:
+        pd.DataFrame(columns=TABLE_COLUMNS['trips']).to_csv(fn, index=False)
+
+    params = {'trips': trips, 'drivers': drivers, 'locations': locations,
+              'days': days, 'start': start, 'seed': seed,
+              'text_datetimes': text_datetimes}
+    with open(f'{data_dir}/benchmark.json', 'w', encoding='utf-8') as f:
+        json.dump(params, f, indent=2)
+    return params
+
+
+def benchmark_cases(params, rng):
+    """
+    This function lists the benchmarked calls. Each case is a
+    method name, a label for the variant, and a function of a
+    SakayDB instance and the call number that makes one call.
+    Read-only cases come first, since the others change the data.
+
+    Parameters
+    ----------
+    params : dict
+        Parameters of the data, as returned by generate_data
+
+    rng : numpy Generator
+        Random number generator for the arguments of the calls
+
+    Returns
+    -------
+    List of tuples (method, variant, call, rows), where rows is a
+    function of the result of a call that returns the number of
+    rows it returned or wrote
+
+    """
+    first_day = pd.Timestamp(params['start'])
+
+    def day(i, hours=0):
+        return (first_day + pd.Timedelta(days=int(i % params['days']),
+                                         hours=hours))\
+            .strftime(DATETIME_FORMAT)
+
+    def new_trip(i, batch=0):
+        hour = 24 * params['days'] + i
+        given, last = driver_name(i % params['drivers'])
+        return dict(driver=f'{last}, {given}', pickup_datetime=day(0, hour),
+                    dropoff_datetime=day(0, hour + 1),
+                    passenger_count=1 + i % 4,
+                    pickup_loc_name=location_name(
+                        (i + batch) % params['locations']),
+                    dropoff_loc_name=location_name(
+                        (7 * i + 3) % params['locations']),
+                    trip_distance=1000.0 + batch, fare_amount=100.0)
+
+    def rows(result):
+        return len(result)
+
+    def export(db, i):
+        path = f'{db.data_dir}/export.csv'
+        db.export_data(path)
+        return path
+
+    def exported(path):
+        with open(path, 'rb') as f:
+            return sum(chunk.count(b'\n') for chunk in
+                       iter(lambda: f.read(1 << 20), b'')) - 1
+
+    trip_ids = rng.permutation(params['trips'])[:10_000] + 1
+    week = 7 * 24
+
+    return [
+        ('search_trips', 'driver_id',
+         lambda db, i: db.search_trips(
+             driver_id=int(rng.integers(1, params['drivers'] + 1))), rows),
+        ('search_trips', 'pickup_day',
+         lambda db, i: db.search_trips(
+             pickup_datetime=(day(i), day(i, 24))), rows),
+        ('search_trips', 'passenger_count',
+         lambda db, i: db.search_trips(passenger_count=6), rows),
+        ('search_trips', 'fare_range',
+         lambda db, i: db.search_trips(
+             fare_amount=(100.0 + i, 101.0 + i)), rows),
+        ('search_trips', 'driver_week',
+         lambda db, i: db.search_trips(
+             driver_id=(1, 10), pickup_datetime=(day(i), day(i, week))),
+         rows),
+        ('export_data', 'csv_file', export, exported),
+        ('generate_statistics', 'trip',
+         lambda db, i: db.generate_statistics('trip'), rows),
+        ('generate_statistics', 'passenger',
+         lambda db, i: db.generate_statistics('passenger'), rows),
+        ('generate_statistics', 'driver',
+         lambda db, i: db.generate_statistics('driver'), rows),
+        ('generate_statistics', 'all',
+         lambda db, i: db.generate_statistics('all'), rows),
+        ('generate_odmatrix', 'all_dates',
+         lambda db, i: db.generate_odmatrix(), rows),
+        ('generate_odmatrix', 'week',
+         lambda db, i: db.generate_odmatrix((day(i), day(i, week))), rows),
+        ('add_trip', 'single',
+         lambda db, i: [db.add_trip(**new_trip(i))], rows),
+        ('add_trips', 'batch_1000',
+         lambda db, i: db.add_trips([new_trip(1_000_000 + i, k)
+                                     for k in range(1000)]), rows),
+        ('delete_trip', 'single',
+         lambda db, i: [db.delete_trip(int(trip_ids[i]))], rows),
+    ]
+
+
+def measure(make_db, call, rows, repeat, memory=True):
+    """
+    This function times one benchmark case. The first call is made
+    on a new SakayDB instance, so it includes reading the tables,
+    and is reported separately from the repeated calls that follow.
+    Peak memory is measured with tracemalloc on one more call on a
+    new instance, so that tracing does not slow the timed calls.
+
+    Parameters
+    ----------
+    make_db : function
+        Returns a new SakayDB instance
+
+    call : function
+        Makes the i-th call on a SakayDB instance
+
+    rows : function
+        Returns the number of rows of the result of a call
+
+    repeat : int
+        Number of calls timed after the first one
+
+    memory : bool
+        Whether to measure peak memory. Defaults to True
+
+    Returns
+    -------
+    Dictionary of results
+
+    """
+    db = make_db()
+    start = time.perf_counter()
+    result = call(db, 0)
+    cold = time.perf_counter() - start
+    n_rows = rows(result)
+
+    latencies = []
+    for i in range(1, repeat + 1):
+        start = time.perf_counter()
+        result = call(db, i)
+        latencies.append(time.perf_counter() - start)
+    if latencies:
+        n_rows = rows(result)
+    else:
+        latencies = [cold]
+    db.close()
+
+    peak = None
+    if memory:
+        db = make_db()
+        tracemalloc.start()
+        try:
+            call(db, repeat + 1)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+            db.close()
+
+    latencies = np.array(latencies)
+    mean = float(latencies.mean())
+    return {
+        'cold_seconds': cold,
+        'calls': len(latencies),
+        'latency_seconds': {
+            'mean': mean,
+            'p50': float(np.percentile(latencies, 50)),
+            'p95': float(np.percentile(latencies, 95)),
+            'min': float(latencies.min()),
+            'max': float(latencies.max())
+        },
+        'calls_per_second': 1 / mean if mean > 0 else None,
+        'rows': n_rows,
+        'rows_per_second': n_rows / mean if mean > 0 else None,
+        'peak_memory_bytes': peak
+    }
+
+
+def run_benchmarks(data_dir, storage='csv', partition=None, repeat=5,
+                   workers=1, result_cache_size=0, memory=True,
+                   only=None, seed=0):
+    """
+    This function times the public methods of SakayDB on a copy of
+    data_dir, which is left unchanged.
+
+    Parameters
+    ----------
+    data_dir : str
+        Directory written by generate_data
+
+    storage : str
+        Storage format to benchmark, either csv, parquet or
+        feather. Defaults to csv
+
+    partition : str or None
+        Partitioning of the trips table, either month or day.
+        Defaults to None
+
+    repeat : int
+        Number of calls timed per case after the first one.
+        Defaults to 5
+
+    workers : int
+        Passed on to SakayDB. Defaults to 1
+
+    result_cache_size : int
+        Passed on to SakayDB. Defaults to 0
+
+    memory : bool
+        Whether to measure peak memory. Defaults to True
+
+    only : list or None
+        Method names to benchmark. Defaults to None, for all
+
+    seed : int
+        Seed for the arguments of the calls. Defaults to 0
+
+    Returns
+    -------
+    Dictionary of the environment, the options, the bytes held in
+    memory per table once loaded, and a list of results per case
+
+    """
+    with open(f'{data_dir}/benchmark.json', encoding='utf-8') as f:
+        params = json.load(f)
+
+    report = {
+        'created': datetime.now(timezone.utc).isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count()
+        },
+        'data': params,
+        'options': {'storage': storage, 'partition': partition,
+                    'repeat': repeat, 'workers': workers,
+                    'result_cache_size': result_cache_size},
+        'results': []
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work = f'{tmp}/data'
+        shutil.copytree(data_dir, work)
+        if storage != 'csv' or partition is not None:
+            SakayDB(work).migrate_storage(storage, partition)
+
+        def make_db():
+            return SakayDB(work, storage=storage, partition=partition,
+                           workers=workers,
+                           result_cache_size=result_cache_size)
+
+        db = make_db()
+        for table in ['drivers', 'locations', 'trips']:
+            db.read_table(table, copy=False)
+        usage = db.memory_usage()['bytes']
+        report['table_bytes'] = usage.groupby(level='table').sum().to_dict()
+        db.close()
+
+        cases = benchmark_cases(params, np.random.default_rng(seed))
+        for method, variant, call, rows in cases:
+            if only is not None and method not in only:
+                continue
+            result = {'method': method, 'variant': variant}
+            with contextlib.redirect_stdout(sys.stderr):
+                result.update(measure(make_db, call, rows, repeat, memory))
+            report['results'].append(result)
+            print(f"{method}[{variant}]: "
+                  f"{result['latency_seconds']['mean']:.4f} s",
+                  file=sys.stderr)
+
+    return report
+
+
+def main():
+    """
+    This function is the command line entry point of the module.
+
+    """
+    parser = argparse.ArgumentParser(
+        description='Benchmark SakayDB on synthetic data.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser(
+        'generate', help='write synthetic tables to a data directory')
+    generate.add_argument('data_dir')
+    size = generate.add_mutually_exclusive_group(required=True)
+    size.add_argument('--scale', choices=SCALES,
+                      help='number of trips: 10k, 1m or 10m')
+    size.add_argument('--trips', type=int, help='number of trips')
+    generate.add_argument('--drivers', type=int,
+                          help='number of drivers (default: trips / 500)')
+    generate.add_argument('--locations', type=int, default=265,
+                          help='number of zones (default: 265)')
+    generate.add_argument('--days', type=int, default=365,
+                          help='number of days with pickups (default: 365)')
+    generate.add_argument('--seed', type=int, default=0)
+    generate.add_argument('--text-datetimes', action='store_true',
+                          help='write datetimes as "hh:mm:ss,DD-MM-YYYY"')
+
+    run = commands.add_parser(
+        'run', help='time the methods of SakayDB and print JSON')
+    run.add_argument('data_dir')
+    run.add_argument('--storage', choices=STORAGE_FORMATS, default='csv')
+    run.add_argument('--partition', choices=list(TRIP_PARTITIONS))
+    run.add_argument('--repeat', type=int, default=5,
+                     help='timed calls per case after the first one '
+                          '(default: 5)')
+    run.add_argument('--workers', type=int, default=1)
+    run.add_argument('--result-cache-size', type=int, default=0)
+    run.add_argument('--only', nargs='+', metavar='METHOD',
+                     help='benchmark only these methods')
+    run.add_argument('--no-memory', action='store_true',
+                     help='skip measuring peak memory')
+    run.add_argument('--output', help='write the JSON here instead of '
+                                      'to standard output')
+
+    args = parser.parse_args()
+    if args.command == 'generate':
+        trips = SCALES[args.scale] if args.scale else args.trips
+        generate_data(args.data_dir, trips, drivers=args.drivers,
+                      locations=args.locations, days=args.days,
+                      seed=args.seed, text_datetimes=args.text_datetimes)
+
+    elif args.command == 'run':
+        report = run_benchmarks(args.data_dir, storage=args.storage,
+                                partition=args.partition,
+                                repeat=args.repeat, workers=args.workers,
+                                result_cache_size=args.result_cache_size,
+                                memory=not args.no_memory, only=args.only)
+        text = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(text + '\n')
+        else:
+            print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -8,6 +8,8 @@ Classes
 
     SakayDB
     SakayDBError
+    AsyncSakayDB
+    SakayDBServer
   
   
 Main Functions
@@ -24,6 +26,24 @@ Main Functions
 
 """
 
+import argparse
+import asyncio
+import contextlib
+import copy
+import functools
+import hmac
+import importlib.util
+import io
+import json
+import multiprocessing
+import secrets
+import signal
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import shutil
 import numpy as np
 import pandas as pd
 import numpy as np
@@ -31,17 +51,296 @@ import os.path
 from pathlib import Path
 import matplotlib.pyplot as plt
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+TABLE_COLUMNS = {
+    'drivers': ['driver_id', 'given_name', 'last_name'],
+    'locations': ['location_id', 'loc_name'],
+    'trips': ['trip_id', 'driver_id', 'pickup_datetime',
+              'dropoff_datetime', 'passenger_count', 'pickup_loc_id',
+              'dropoff_loc_id', 'trip_distance', 'fare_amount'],
+}
+
+TABLE_DTYPES = {
+    'drivers': {'driver_id': 'int64', 'given_name': 'object',
+                'last_name': 'object'},
+    'locations': {'location_id': 'int64', 'loc_name': 'object'},
+    'trips': {'trip_id': 'int64', 'driver_id': 'int64',
+              'pickup_datetime': 'int64', 'dropoff_datetime': 'int64',
+              'passenger_count': 'int64', 'pickup_loc_id': 'Int64',
+              'dropoff_loc_id': 'Int64', 'trip_distance': 'float64',
+              'fare_amount': 'float64'},
+}
+
+COMPACT_DTYPES = {
+    'drivers': {'driver_id': 'int32', 'given_name': 'category',
+                'last_name': 'category'},
+    'locations': {'location_id': 'int32', 'loc_name': 'category'},
+    'trips': {'trip_id': 'int32', 'driver_id': 'int32',
+              'passenger_count': 'uint8', 'pickup_loc_id': 'int32',
+              'dropoff_loc_id': 'int32', 'trip_distance': 'float32',
+              'fare_amount': 'float32'},
+}
+
+EXPORT_COLUMNS = ['driver_lastname', 'driver_givenname', 'pickup_datetime',
+                  'dropoff_datetime', 'passenger_count', 'pickup_loc_name',
+                  'dropoff_loc_name', 'trip_distance', 'fare_amount']
+
+DATETIME_FORMAT = '%H:%M:%S,%d-%m-%Y'
+
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday',
+             'Saturday', 'Sunday']
+
+STAT_COLUMNS = {'trip': None, 'passenger': 'passenger_count',
+                'driver': 'driver_id'}
+
+STORAGE_FORMATS = ['csv', 'parquet', 'feather']
+
+MAX_TABLE_PARTS = 64
+
+TRIP_PARTITIONS = {'month': 'M', 'day': 'D'}
+
+METRIC_PHASES = ['read', 'parse', 'filter', 'aggregate', 'write']
+
+SERVER_METHODS = ['add_trip', 'add_trips', 'delete_trip', 'search_trips',
+                  'export_data', 'generate_statistics', 'generate_odmatrix',
+                  'metrics']
+
+SERVER_PORT = 8765
+
+
+def cached_result(method):
+    """
+    This function wraps a query method of SakayDB so that its
+    results are kept in the result cache of the object. See
+    SakayDB.cached_call.
+
+    Parameters
+    ----------
+    method : function
+        Method to wrap
+
+    Returns
+    -------
+    Function
+
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        return self.cached_call(method, *args, **kwargs)
+    return wrapper
+
+
+def typed_key(value):
+    """
+    This function returns a result cache key for an argument that
+    holds the type of each value along with it, so that arguments
+    that compare equal but have different types, e.g., 3 and 3.0 or
+    1 and True, get different keys.
+
+    Parameters
+    ----------
+    value : object
+        Argument of a query method
+
+    Returns
+    -------
+    Tuple
+
+    """
+    if isinstance(value, (tuple, list)):
+        return type(value), tuple(typed_key(v) for v in value)
+    return type(value), value
+
+
+def instrumented(phase):
+    """
+    This function returns a decorator that wraps a public method of
+    SakayDB so that its calls are recorded when instrumentation is
+    on. Calls made from within a recorded call are counted as part
+    of it. See SakayDB.instrumented_call.
+
+    Parameters
+    ----------
+    phase : str
+        Phase of METRIC_PHASES that the time of the method is
+        counted in, except for the time spent in other phases
+
+    Returns
+    -------
+    Function
+
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not self.instrument or self.metrics_call is not None:
+                return method(self, *args, **kwargs)
+            return self.instrumented_call(phase, method, *args, **kwargs)
+        return wrapper
+    return decorator
+
 
 class SakayDB():
-    def __init__(self, data_dir):
+    def __init__(self, data_dir, compact_threshold=0.25, storage='csv',
+                 result_cache_size=0, workers=1, partition=None,
+                 instrument=False, metrics_callback=None):
         """
         This class initializer accepts a string data_dir which is 
         the directory path to where the data files are located.
 
         Path is stored in the data_dir attribute of the object.
 
+        Tables read from data_dir are kept in the table_cache
+        attribute and reused until the file on disk changes.
+
+        Deleted trips are recorded in a tombstone log and are only
+        removed from trips.csv by compact, once the share of deleted
+        trips reaches compact_threshold (defaults to 0.25).
+
+        Tables are stored as comma-delimited files by default. With
+        storage set to parquet or feather, each table is instead a
+        directory of typed columnar files (e.g., trips.parquet/),
+        which requires pyarrow. See migrate_storage for converting
+        an existing data_dir.
+
+        Trip counts per pickup date, per pickup date and passenger
+        count, and per pickup date and driver are kept in the
+        stats_cache attribute and in trips.stats, and are updated
+        by every write, which logs its change to trips.stats.log,
+        so that generate_statistics does not have to read the
+        trips table. Likewise, trip counts per
+        pickup date and origin-destination pair are kept in the
+        od_cache attribute for generate_odmatrix.
+
+        If result_cache_size is positive, the results of the last
+        result_cache_size calls to search_trips, generate_statistics
+        and generate_odmatrix are kept in the result_cache attribute
+        and returned again, as copies, for calls with the same
+        arguments until the data changes. The data_version attribute
+        counts the writes made through the object, and the
+        result_cache_hits and result_cache_misses attributes count
+        the lookups.
+
+        Writes lock the tables they change (e.g., trips.lock) so
+        that several processes can write to the same data_dir, and
+        are recorded in a journal (e.g., trips.journal) until they
+        complete. A write left unfinished by a crashed process is
+        completed from its journal when data_dir is next opened or
+        the table is next locked.
+
+        With workers above 1, the trip counts and OD counts are
+        computed from the trips table by a pool of that many
+        processes, each counting a range of pickup dates. The pool
+        is started on first use, without forking the caller, and is
+        kept in the pool attribute until close is called; SakayDB
+        can be used in a with statement to close it.
+
+        With partition set to month or day, the trips table is a
+        directory with one file per month or day of pickup_datetime
+        (e.g., trips.month.csv/2020-01.csv); see TRIP_PARTITIONS.
+        Searches on a pickup_datetime range and generate_odmatrix
+        with a date_range only read the partitions in range when
+        the trips table is not cached, and appended trips only
+        touch the partitions they fall in.
+
+        With instrument set to True, or a metrics_callback given,
+        the calls to the main methods are timed and their rows and
+        file bytes counted. See metrics for the totals per method;
+        metrics_callback is called with the record of each call.
+
         """
+        self.check_storage(storage)
+        self.check_partition(partition)
         self.data_dir = data_dir
+        self.compact_threshold = compact_threshold
+        self.storage = storage
+        self.table_cache = dict()
+        self.stats_cache = None
+        self.od_cache = None
+        self.trip_ids = None
+        self.result_cache_size = result_cache_size
+        self.result_cache = OrderedDict()
+        self.result_cache_hits = 0
+        self.result_cache_misses = 0
+        self.data_version = 0
+        self.table_locks = dict()
+        self.workers = workers
+        self.pool = None
+        self.partition = partition
+        self.instrument = instrument or metrics_callback is not None
+        self.metrics_callback = metrics_callback
+        self.metrics_summary = dict()
+        self.metrics_call = None
+        self.metrics_phases = []
+        self.legacy_tables = set()
+        self.recover()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        This method stops the pool of worker processes, if one was
+        started. The object can still be used; a new pool is
+        started when needed.
+
+        Returns
+        -------
+        None
+
+        """
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+            self.pool = None
+
+    def check_storage(self, storage):
+        """
+        This function checks whether the specified storage format
+        is supported and its dependencies are installed.
+
+        Parameters
+        ----------
+        storage : str
+            Either csv, parquet or feather
+
+        Raises
+        -------
+        SakayDBError
+            For unknown storage formats, or if pyarrow is not
+            installed for the columnar formats
+
+        """
+        if storage not in STORAGE_FORMATS:
+            raise SakayDBError('Unknown storage input')
+        if storage != 'csv' and importlib.util.find_spec('pyarrow') is None:
+            raise SakayDBError(f'{storage} storage requires pyarrow')
+
+    def check_partition(self, partition):
+        """
+        This function checks whether the specified partitioning of
+        the trips table is supported.
+
+        Parameters
+        ----------
+        partition : str or None
+            Either month, day or None
+
+        Raises
+        -------
+        SakayDBError
+            For unknown partition inputs
+
+        """
+        if partition is not None and partition not in TRIP_PARTITIONS:
+            raise SakayDBError('Unknown partition input')
 
     def check_create_file(self, filename, columns):
         """
@@ -68,638 +367,3819 @@ class SakayDB():
             with open(filename, mode='w', encoding='utf-8') as f:
                 f.write(','.join(columns) + '\n')
 
-    def get_driver_id(self, driver):
+    def check_create_table(self, table):
         """
-        This function returns the driver_id of the specified
-        trip driver.
+        This function creates an empty drivers, locations or trips
+        table in data_dir if it does not exist yet.
 
         Parameters
         ----------
-        driver : str
-            Trip driver name in formatted as
-            Last name, Given name
+        table : str
+            Either drivers, locations or trips
 
         Returns
         -------
-        driver_id : int
-            Driver id of the trip driver if they are already
-            in the drivers database
-
         None
-            If trip driver is not recorded in the drivers database
 
         """
+        if self.storage == 'csv' and not self.partitioned(table):
+            self.check_create_file(self.table_path(table),
+                                   TABLE_COLUMNS[table])
+        else:
+            os.makedirs(self.table_path(table), exist_ok=True)
 
-        last_name, given_name = [x.strip() for x in driver.split(',')]
+    def table_path(self, table):
+        """
+        This function returns the path of a table in data_dir. For
+        the columnar storage formats and for partitioned trips, this
+        is a directory holding the parts of the table.
 
-        fn = f'{self.data_dir}/drivers.csv'
-        df_drivers = pd.read_csv(fn)
-        cond = ((df_drivers['given_name'].str.lower() == given_name.lower()) &
-                (df_drivers['last_name'].str.lower() == last_name.lower()))
+        Parameters
+        ----------
+        table : str
+            Either drivers, locations or trips
 
-        if cond.any():
-            driver_id = df_drivers[cond]['driver_id'].item()
-            return driver_id
-        else:
-            return None
+        Returns
+        -------
+        str
 
-    def get_loc_id(self, location):
         """
-        This function returns the loc_id of the specified
-        location. This will be used to get loc_id's of
-        specified pickup and dropoff location names.
+        if self.partitioned(table):
+            return f'{self.data_dir}/{table}.{self.partition}.{self.storage}'
+        return f'{self.data_dir}/{table}.{self.storage}'
+
+    def partitioned(self, table):
+        """
+        This function returns whether a table is stored in
+        partitions, which is only the case for trips when the
+        partition attribute is set.
 
         Parameters
         ----------
-        location : str
-            Zone (e.g., Pine View, Legazpi Village)
+        table : str
+            Either drivers, locations or trips
 
         Returns
         -------
-        loc_id : int
-            Location id of the specified pickup or dropoff
-            location if it is in the locations database
+        bool
 
-        None
-            If specified location is not in the database
+        """
+        return table == 'trips' and self.partition is not None
 
+    def table_parts(self, table):
         """
-        fn = f'{self.data_dir}/locations.csv'
-        df_locations = pd.read_csv(fn)
-        cond = (df_locations['loc_name'].str.lower()
-                == location.lower().strip())
+        This function returns the paths of the part files of a
+        table stored in a columnar format, in the order they were
+        written. For partitioned trips, these are the files of all
+        partitions, ordered by partition and then by part.
 
-        if cond.any():
-            loc_id = df_locations[cond]['location_id'].item()
-            return loc_id
-        else:
-            return None
+        Parameters
+        ----------
+        table : str
+            Either drivers, locations or trips
+
+        Returns
+        -------
+        List of paths
 
-    def get_trip_id(self, driver,
-                    pickup_datetime,
-                    dropoff_datetime,
-                    passenger_count,
-                    pickup_loc_name,
-                    dropoff_loc_name,
-                    trip_distance,
-                    fare_amount):
         """
-        This function returns the trip_id of the specified trip if
-        it already exists in the database. This will be used to check
-        for duplicate entries to the database.
+        path = self.table_path(table)
+        if not os.path.isdir(path):
+            return []
+        if self.partitioned(table):
+            return [f'{path}/{x}' for x in sorted(os.listdir(path))
+                    if x.endswith(f'.{self.storage}') and
+                    not x.startswith('.')]
+        return [f'{path}/{x}' for x in sorted(os.listdir(path))
+                if x.startswith('part-')]
+
+    def partition_periods(self, seconds):
+        """
+        This function returns the partition of each pickup_datetime,
+        as the month or day it falls in.
 
         Parameters
         ----------
-        pickup_datetime : str
-            datetime of pickup formatted as "hh:mm:ss,DD-MM-YYYY"
+        seconds : array-like
+            Pickup datetimes in seconds since 1970-01-01
 
-        dropoff_datetime : str
-            Datetime of dropoff formatted as "hh:mm:ss,DD-MM-YYYY"
+        Returns
+        -------
+        Array of numpy datetime64 months or days
 
-        passenger_count : int
-            Number of passengers
+        """
+        return np.asarray(seconds, dtype='int64').astype(
+            'datetime64[s]').astype(
+            f'datetime64[{TRIP_PARTITIONS[self.partition]}]')
 
-        pickup_loc_name : str
-            Zone (e.g., Pine View, Legazpi Village)
+    def partition_files(self, start=None, end=None):
+        """
+        This function returns the files of the partitions of the
+        trips table that hold pickups between start and end.
 
-        dropoff_loc_name : str
-            Zone (e.g., Pine View, Legazpi Village)
+        Parameters
+        ----------
+        start : int or None
+            Lower bound of pickup_datetime, in seconds since
+            1970-01-01. Defaults to None, for no lower bound
 
-        trip_distance : float
-            Distance in meters
+        end : int or None
+            Upper bound, inclusive, of pickup_datetime. Defaults to
+            None, for no upper bound
 
-        fare_amount : float
-            Fare amount
+        Returns
+        -------
+        List of paths, in the order of table_parts
+
+        """
+        files = []
+        for fn in self.table_parts('trips'):
+            period = np.datetime64(os.path.basename(fn).split('.')[0],
+                                   TRIP_PARTITIONS[self.partition])
+            first = int(period.astype('datetime64[s]').astype('int64'))
+            last = int((period + 1).astype('datetime64[s]')
+                       .astype('int64')) - 1
+            if ((start is None or last >= start) and
+                    (end is None or first <= end)):
+                files.append(fn)
+        return files
+
+    def file_signature(self, filename):
+        """
+        This function returns the modification time and size of
+        a file. This is used to tell whether a cached table is
+        still in sync with the file on disk.
+
+        Parameters
+        ----------
+        filename : str
+            Directory path
 
         Returns
         -------
-        trip_id : int
-            Trip id of the specified trip if it is already in
-            the database.
+        signature : tuple
+            Modification time in nanoseconds and size in bytes
 
         None
-            If specified trip is not in the database
+            If the file does not exist
 
         """
-        fn = f'{self.data_dir}/trips.csv'
-        df_trips = pd.read_csv(fn)
-        cond = ((df_trips['driver_id'] == self.get_driver_id(driver)) &
-                (df_trips['pickup_datetime'] == pickup_datetime) &
-                (df_trips['dropoff_datetime'] == dropoff_datetime) &
-                (df_trips['passenger_count'] == passenger_count) &
-                (df_trips['pickup_loc_id'] == self.get_loc_id(pickup_loc_name)) &
-                (df_trips['dropoff_loc_id'] == self.get_loc_id(dropoff_loc_name)) &
-                (df_trips['trip_distance'] == trip_distance) &
-                (df_trips['fare_amount'] == fare_amount))
-
-        if cond.any():
-            trip_id = df_trips[cond]['trip_id'].item()
-            return trip_id
-        else:
+        try:
+            stat = os.stat(filename)
+        except FileNotFoundError:
             return None
+        return (stat.st_mtime_ns, stat.st_size)
 
-    def add_driver(self, driver):
+    def table_signature(self, table):
         """
-        This function updates the database in case specified
-        driver in the main function is not in the database yet.
-        This also handles driver id assignment for new drivers.
+        This function returns the signatures of all the files
+        that make up a table. For trips, this includes the
+        tombstone log of deleted trips.
 
         Parameters
         ----------
-        driver : str
-            Trip driver name in formatted as
-            Last name, Given name
+        table : str
+            Either drivers, locations or trips
 
         Returns
         -------
-        None
+        Tuple of file signatures
 
         """
-        last_name, given_name = [x.strip() for x in driver.split(',')]
+        if self.storage == 'csv' and not self.partitioned(table):
+            files = [self.table_path(table)]
+        else:
+            files = self.table_parts(table)
+        if table == 'trips':
+            files.append(f'{self.data_dir}/trips.tombstones')
+        return tuple((fn, self.file_signature(fn)) for fn in files)
 
-        fn = f'{self.data_dir}/drivers.csv'
-        cols = ['driver_id', 'given_name', 'last_name']
+    def read_tombstones(self):
+        """
+        This function returns the trip ids recorded in the
+        tombstone log of deleted trips.
 
-        self.check_create_file(fn, cols)
+        Returns
+        -------
+        Set of trip ids
 
-        df_drivers = pd.read_csv(fn)
+        """
+        fn = f'{self.data_dir}/trips.tombstones'
+        if not os.path.exists(fn):
+            return set()
+        with self.record_phase('read'), open(fn, encoding='utf-8') as f:
+            self.record_io(bytes_read=os.fstat(f.fileno()).st_size)
+            return {int(line) for line in f if line.strip()}
+
+    def to_epoch(self, value):
+        """
+        This function converts datetimes formatted as
+        "hh:mm:ss,DD-MM-YYYY" to the number of seconds since
+        1970-01-01 00:00:00, which is how the trips table stores
+        pickup_datetime and dropoff_datetime.
 
-        if pd.isnull(df_drivers['driver_id'].max()):
-            driver_id = 1
-        else:
-            driver_id = df_drivers['driver_id'].max() + 1
+        Parameters
+        ----------
+        value : str or Series
+            Datetime or datetimes formatted as "hh:mm:ss,DD-MM-YYYY"
 
-        if self.get_driver_id(driver) is None:
-            data = {
-                'driver_id': [driver_id],
-                'given_name': [given_name],
-                'last_name': [last_name]
-            }
-            pd.DataFrame(data).to_csv(fn, mode='a', index=False, header=False)
+        Returns
+        -------
+        int or Series of int
 
-    def add_trip(self, driver,
-                 pickup_datetime,
-                 dropoff_datetime,
-                 passenger_count,
-                 pickup_loc_name,
-                 dropoff_loc_name,
-                 trip_distance,
-                 fare_amount):
-        """
-        This method appends the specified trip data to the end of
-        the trips database, if it exists, or creates it, otherwise.
+        Raises
+        -------
+        ValueError
+            If a datetime does not follow the format
 
+        """
+        with self.record_phase('parse'):
+            parsed = pd.to_datetime(value, format=DATETIME_FORMAT)
+            seconds = (parsed - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+            if isinstance(seconds, pd.Series):
+                return seconds.astype('int64')
+            return int(seconds)
+
+    def from_epoch(self, values):
+        """
+        This function formats datetimes stored as seconds since
+        1970-01-01 00:00:00 as "hh:mm:ss,DD-MM-YYYY".
 
         Parameters
         ----------
-        driver : str
-            Trip driver name in formatted as
-            Last name, Given name
+        values : Series
+            Seconds since 1970-01-01 00:00:00
 
-        pickup_datetime : str
-            datetime of pickup formatted as
-            "hh:mm:ss,DD-MM-YYYY"
+        Returns
+        -------
+        Series of str
 
-        dropoff_datetime : str
-            Datetime of dropoff formatted as
-            "hh:mm:ss,DD-MM-YYYY"
+        """
+        with self.record_phase('parse'):
+            return pd.to_datetime(values, unit='s')\
+                .dt.strftime(DATETIME_FORMAT)
 
-        passenger_count : int
-            Number of passengers
+    def epoch_column(self, values):
+        """
+        This function returns a pickup_datetime or dropoff_datetime
+        column of the trips table as seconds since 1970-01-01.
+        Values still stored as "hh:mm:ss,DD-MM-YYYY" strings by older
+        versions of this module are converted.
 
-        pickup_loc_name : str
-            Zone (e.g., Pine View, Legazpi Village)
+        Parameters
+        ----------
+        values : Series
+            Column as read from the trips table
 
-        dropoff_loc_name : str
-            Zone (e.g., Pine View, Legazpi Village)
+        Returns
+        -------
+        Series of int
 
-        trip_distance : float
-            Distance in meters
+        """
+        if pd.api.types.is_numeric_dtype(values):
+            return values.astype('int64')
 
-        fare_amount : float
-            Fare amount
+        seconds = pd.to_numeric(values, errors='coerce')
+        legacy = seconds.isnull()
+        if legacy.any():
+            seconds = seconds.astype('float64')
+            seconds[legacy] = self.to_epoch(values[legacy])
+        return seconds.astype('int64')
+
+    def load_table(self, table, columns=None, files=None):
+        """
+        This function parses a table from data_dir in the
+        configured storage format, bypassing the cache. Partitioned
+        trips are returned in trip_id order, as they would be read
+        from an unpartitioned table.
+
+        Parameters
+        ----------
+        table : str
+            Either drivers, locations or trips
+
+        columns : list or None
+            Columns to read. Defaults to None, in which case all
+            columns are read
 
+        files : list or None
+            Part files to read, e.g., from partition_files. Defaults
+            to None, in which case the whole table is read
 
         Returns
         -------
-        Generated trip id of successfully added trip 
-
+        DataFrame
 
         Raises
         -------
-        SakayDBError
-            For wrong input formats or when the specified
-            trip already exists
+        FileNotFoundError
+            If the table does not exist in data_dir
 
         """
-        try:
-            drv_check = driver.split(',')
-            p_datetime = pd.to_datetime(
-                pickup_datetime, format='%H:%M:%S,%d-%m-%Y')
-            d_datetime = pd.to_datetime(
-                dropoff_datetime, format='%H:%M:%S,%d-%m-%Y')
-            trip_distance = float(trip_distance)
-            fare_amount = float(fare_amount)
-
-        except Exception as e:
-            raise SakayDBError(f'Wrong input format: {e}')
-
-        if isinstance(pickup_loc_name, str) and isinstance(dropoff_loc_name, str) and isinstance(passenger_count, int):
-            pass
+        path = self.table_path(table)
+        if self.storage == 'csv' and not self.partitioned(table):
+            files = [path]
+        elif not os.path.isdir(path):
+            raise FileNotFoundError(f'No such table: {path}')
+        elif files is None:
+            files = self.table_parts(table)
+
+        with self.record_phase('read'):
+            if self.storage == 'csv':
+                frames = [pd.read_csv(fn, usecols=columns) for fn in files]
+            elif self.storage == 'parquet':
+                frames = [pd.read_parquet(fn, columns=columns)
+                          for fn in files]
+            else:
+                frames = [pd.read_feather(fn, columns=columns)
+                          for fn in files]
+        self.record_io(bytes_read=sum(map(os.path.getsize, files)))
+
+        if columns is None:
+            columns = TABLE_COLUMNS[table]
+        if not frames:
+            frames = [pd.DataFrame({col: pd.Series(
+                dtype=TABLE_DTYPES[table][col]) for col in columns})]
+
+        if len(frames) == 1:
+            df = self.normalize_table(table, frames[0])
         else:
-            raise SakayDBError('Wrong input format.')
+            df = self.normalize_table(table, pd.concat(frames,
+                                                       ignore_index=True))
+        if self.partitioned(table) and 'trip_id' in df.columns:
+            df = df.sort_values(by='trip_id', kind='stable',
+                                ignore_index=True)
+        return df
+
+    def normalize_table(self, table, df):
+        """
+        This function converts the columns of a table read from
+        data_dir to the types used in memory. Datetimes become
+        seconds since 1970-01-01, and nullable integer columns of
+        the columnar formats become int64, or float64 when they
+        have missing values, as they would when read from CSV.
+        Columns are then narrowed by compact_table.
 
-        fn = f'{self.data_dir}/trips.csv'
-        cols = ['trip_id', 'driver_id', 'pickup_datetime',
-                'dropoff_datetime', 'passenger_count', 'pickup_loc_id',
-                'dropoff_loc_id', 'trip_distance', 'fare_amount']
+        Parameters
+        ----------
+        table : str
+            Either drivers, locations or trips
 
-        self.check_create_file(fn, cols)
+        df : DataFrame
+            Rows of the table as read from data_dir
 
-        df_trips = pd.read_csv(fn)
+        Returns
+        -------
+        DataFrame
 
-        self.add_driver(driver)
+        """
+        with self.record_phase('parse'):
+            for col in df.columns:
+                if str(df[col].dtype) == 'Int64':
+                    if df[col].isnull().any():
+                        df[col] = df[col].astype('float64')
+                    else:
+                        df[col] = df[col].astype('int64')
+                elif table == 'trips' and col in ['pickup_datetime',
+                                                  'dropoff_datetime']:
+                    if not pd.api.types.is_numeric_dtype(df[col]):
+                        self.legacy_tables.add(table)
+                    df[col] = self.epoch_column(df[col])
+            return self.compact_table(table, df)
+
+    def compact_table(self, table, df):
+        """
+        This function narrows the columns of a table held in memory
+        to the types in COMPACT_DTYPES where no value changes:
+        integer columns whose values fit the smaller integer type,
+        float columns whose values are all exact in float32, and
+        text columns, which become categorical. Other columns, e.g.,
+        ids with missing values or fares with cents, keep their
+        type. See widen_table for the reverse.
 
-        if pd.isnull(df_trips['trip_id'].max()):
-            trip_id = 1
-        else:
-            trip_id = df_trips['trip_id'].max() + 1
-
-        if self.get_trip_id(driver, pickup_datetime, dropoff_datetime, passenger_count,
-                            pickup_loc_name, dropoff_loc_name, trip_distance, fare_amount) is None:
-            trip_data = {
-                'trip_id': [trip_id],
-                'driver_id': [self.get_driver_id(driver)],
-                'pickup_datetime': pickup_datetime,
-                'dropoff_datetime': dropoff_datetime,
-                'passenger_count': [passenger_count],
-                'pickup_loc_id': [self.get_loc_id(pickup_loc_name)],
-                'dropoff_loc_id': [self.get_loc_id(dropoff_loc_name)],
-                'trip_distance': [trip_distance],
-                'fare_amount': [fare_amount]
-            }
+        Parameters
+        ----------
+        table : str
+            Either drivers, locations or trips
 
-            pd.DataFrame(trip_data).to_csv(fn, encoding='utf-8',
-                                           mode='a', index=False, header=False)
-            return trip_id
-        else:
-            raise SakayDBError('Trip exists in the database')
+        df : DataFrame
+            Rows of the table, which are converted in place
+
+        Returns
+        -------
+        DataFrame
 
-    def add_trips(self, trips_list):
         """
-        This method accepts a list of trips in the
-        form of dictionaries. It will add each trip
-        to the database and return a list of trip_ids
-        of successfully added trips.
+        for col, dtype in COMPACT_DTYPES[table].items():
+            if col not in df.columns or df[col].dtype == dtype:
+                continue
+            values = df[col].to_numpy()
+            if dtype == 'category':
+                if values.dtype == object:
+                    df[col] = df[col].astype('category')
+            elif np.dtype(dtype).kind in 'iu':
+                info = np.iinfo(dtype)
+                if values.dtype.kind in 'iu' and (
+                        len(values) == 0 or
+                        info.min <= values.min() and
+                        values.max() <= info.max):
+                    df[col] = values.astype(dtype)
+            elif values.dtype.kind == 'f':
+                with np.errstate(over='ignore'):
+                    narrow = values.astype(dtype)
+                if np.array_equal(narrow, values, equal_nan=True):
+                    df[col] = narrow
+        return df
+
+    def widen_table(self, table, df):
+        """
+        This function returns a copy of a table held in memory with
+        the columns narrowed by compact_table converted back to
+        int64, float64 or object, the types they have when read
+        with pandas defaults. Results and CSV files are written
+        with these types.
 
-        If a trip is already in the database, it will
-        skip it and print a warning instead.
+        Parameters
+        ----------
+        table : str
+            Either drivers, locations or trips
+
+        df : DataFrame
+            Rows of the table
+
+        Returns
+        -------
+        DataFrame
+
+        """
+        wide = {'i': 'int64', 'u': 'int64', 'f': 'float64'}
+        dtypes = dict()
+        for col in COMPACT_DTYPES[table]:
+            if col not in df.columns:
+                continue
+            if isinstance(df[col].dtype, pd.CategoricalDtype):
+                dtypes[col] = 'object'
+            elif df[col].dtype.kind in wide:
+                dtypes[col] = wide[df[col].dtype.kind]
+        return df.astype(dtypes)
+
+    def iter_table(self, table, chunksize, columns=None, files=None):
+        """
+        This function reads a table from data_dir in chunks of at
+        most chunksize rows, bypassing the cache, so that only one
+        chunk is held in memory at a time.
 
         Parameters
         ----------
-        trips_list : list
-            List of dictionaries with the following keys
-            and values
+        table : str
+            Either drivers, locations or trips
 
-            * driver - str, trip driver name in formatted
-                       as Last name, Given name
-            * pickup_datetime - str, datetime of pickup
-                       formatted as "hh:mm:ss,DD-MM-YYYY"
-            * dropoff_datetime - str, datetime of dropoff
-                       formatted as "hh:mm:ss,DD-MM-YYYY"
+        chunksize : int
+            Maximum number of rows per chunk
+
+        columns : list or None
+            Columns to read. Defaults to None, in which case all
+            columns are read
+
+        files : list or None
+            Part files to read, e.g., from partition_files. Defaults
+            to None, in which case the whole table is read
+
+        Yields
+        -------
+        DataFrame
+
+        Raises
+        -------
+        FileNotFoundError
+            If the table does not exist in data_dir
+
+        """
+        path = self.table_path(table)
+        if self.storage == 'csv' and not self.partitioned(table):
+            files = [path]
+        elif not os.path.isdir(path):
+            raise FileNotFoundError(f'No such table: {path}')
+        elif files is None:
+            files = self.table_parts(table)
+
+        if self.storage == 'csv':
+            for fn in files:
+                self.record_io(bytes_read=os.path.getsize(fn))
+                with pd.read_csv(fn, usecols=columns,
+                                 chunksize=chunksize) as reader:
+                    while True:
+                        with self.record_phase('read'):
+                            chunk = next(reader, None)
+                        if chunk is None:
+                            break
+                        yield self.normalize_table(table, chunk)
+            return
+
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        for fn in files:
+            self.record_io(bytes_read=os.path.getsize(fn))
+            if self.storage == 'parquet':
+                batches = pq.ParquetFile(fn).iter_batches(
+                    batch_size=chunksize, columns=columns)
+            else:
+                reader = pa.ipc.open_file(pa.memory_map(fn))
+                batches = (reader.get_batch(i)
+                           for i in range(reader.num_record_batches))
+
+            while True:
+                with self.record_phase('read'):
+                    batch = next(batches, None)
+                if batch is None:
+                    break
+                for start in range(0, batch.num_rows, chunksize):
+                    with self.record_phase('read'):
+                        chunk = batch.slice(start, chunksize).to_pandas()
+                        if columns is not None:
+                            chunk = chunk[list(columns)]
+                    yield self.normalize_table(table, chunk)
+
+    def write_part(self, table, df, path=None, prefix=''):
+        """
+        This function writes a dataframe as a new part file of a
+        table stored in a columnar format, with the column types
+        in TABLE_DTYPES.
+
+        Parameters
+        ----------
+        table : str
+            Either drivers, locations or trips
+
+        df : DataFrame
+            Rows to write, with the columns of the table in order
+
+        path : str or None
+            Directory to write the part in. Defaults to None, in
+            which case the directory of the table is used
+
+        prefix : str
+            Prefix of the part file name, which is the partition
+            name and a period for partitioned trips (e.g.,
+            2020-01.part-000000.parquet). Defaults to no prefix
+
+        Returns
+        -------
+        Path of the new part
+
+        """
+        if path is None:
+            path = self.table_path(table)
+        parts = sorted(x for x in os.listdir(path)
+                       if x.startswith(f'{prefix}part-'))
+
+        if parts:
+            n = int(parts[-1].rsplit('part-', 1)[1].split('.')[0]) + 1
+        else:
+            n = 0
+
+        df = df.astype(TABLE_DTYPES[table]).reset_index(drop=True)
+        tmp = f'{path}/.{prefix}part-{n:06d}.tmp'
+        if self.storage == 'parquet':
+            df.to_parquet(tmp, index=False)
+        else:
+            df.to_feather(tmp)
+        self.sync_file(tmp)
+        fn = f'{path}/{prefix}part-{n:06d}.{self.storage}'
+        os.replace(tmp, fn)
+        self.sync_file(path)
+        self.record_io(bytes_written=os.path.getsize(fn))
+        return fn
+
+    def iter_sorted_trips(self, chunksize, files=None):
+        """
+        This function reads the trips table in trip_id order, in
+        chunks of chunksize rows but for the last, bypassing the
+        cache. The partitions of partitioned trips are each in
+        trip_id order, and are merged: every round takes the
+        buffered rows of all partitions up to the smallest last
+        trip_id among their buffered chunks, so at most one chunk
+        per partition is held in memory.
+
+        Parameters
+        ----------
+        chunksize : int
+            Maximum number of rows per chunk
+
+        files : list or None
+            Part files to read, e.g., from partition_files. Defaults
+            to None, in which case the whole table is read
+
+        Yields
+        -------
+        DataFrame
+
+        """
+        if not self.partitioned('trips'):
+            yield from self.iter_table('trips', chunksize, files=files)
+            return
+
+        if files is None:
+            files = self.table_parts('trips')
+        streams = [self.iter_table('trips', chunksize, files=[fn])
+                   for fn in files]
+        buffers = [next(stream, None) for stream in streams]
+        rest = None
+
+        while True:
+            active = [i for i, buf in enumerate(buffers) if buf is not None]
+            if not active:
+                if rest is not None and len(rest) > 0:
+                    yield rest
+                return
+            bound = min(buffers[i]['trip_id'].iloc[-1] for i in active)
+
+            parts = []
+            for i in active:
+                buf = buffers[i]
+                k = np.searchsorted(buf['trip_id'].values, bound,
+                                    side='right')
+                parts.append(buf.iloc[:k])
+                if k < len(buf):
+                    buffers[i] = buf.iloc[k:]
+                else:
+                    buffers[i] = next(streams[i], None)
+
+            df = pd.concat(parts, ignore_index=True)
+            df = df.sort_values(by='trip_id', kind='stable',
+                                ignore_index=True)
+            if rest is not None:
+                df = pd.concat([rest, df], ignore_index=True)
+            end = len(df) - len(df) % chunksize
+            for start in range(0, end, chunksize):
+                yield df.iloc[start:start + chunksize]
+            rest = df.iloc[end:]
+
+    def trip_positions(self, trip_ids):
+        """
+        This function returns the row numbers that trips have in
+        the trips table read whole by read_table, i.e., their
+        positions in trip_id order among the trips not deleted. It
+        gives trips read from some of the partitions the index they
+        would have when the whole table is read. The sorted trip ids
+        are kept on the instance until the table or the tombstone
+        log changes.
+
+        Parameters
+        ----------
+        trip_ids : Series
+            Trip ids of trips that are not deleted
+
+        Returns
+        -------
+        Array of int
+
+        """
+        tombstones = self.read_tombstones()
+        key = (self.table_signature('trips'), len(tombstones))
+        if self.trip_ids is None or self.trip_ids[0] != key:
+            ids = self.load_table('trips', columns=['trip_id'])['trip_id']
+            if tombstones:
+                ids = ids[~ids.isin(tombstones)]
+            self.trip_ids = (key, ids.values)
+        return np.searchsorted(self.trip_ids[1], trip_ids.values)
+
+    def write_partitions(self, table, df, path=None):
+        """
+        This function appends trips to the partitions of the trips
+        table they fall in, creating the partitions that do not
+        exist yet. Comma-delimited partitions are appended to, and
+        columnar partitions get a new part.
+
+        Parameters
+        ----------
+        table : str
+            Table to write, which is trips
+
+        df : DataFrame
+            Rows to write, with the columns of the table in order
+
+        path : str or None
+            Directory of the partitions. Defaults to None, in which
+            case the directory of the table is used
+
+        Returns
+        -------
+        List of the partition names written to
+
+        """
+        if path is None:
+            path = self.table_path(table)
+        periods = self.partition_periods(df['pickup_datetime'])
+        order = np.argsort(periods, kind='stable')
+        uniques, starts = np.unique(periods[order], return_index=True)
+        bounds = list(starts[1:]) + [len(order)]
+
+        names = []
+        for period, lo, hi in zip(uniques, starts, bounds):
+            name = str(period)
+            rows = df.iloc[order[lo:hi]]
+            if self.storage == 'csv':
+                fn = f'{path}/{name}.csv'
+                text = self.widen_table(table, rows).to_csv(
+                    index=False, header=not os.path.exists(fn))
+                with open(fn, mode='a', encoding='utf-8', newline='') as f:
+                    f.write(text)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self.record_io(bytes_written=len(text))
+            else:
+                self.write_part(table, rows, path=path, prefix=f'{name}.')
+            names.append(name)
+        return names
+
+    def merge_partition(self, table, name):
+        """
+        This function merges the parts of a columnar partition of
+        the trips table into a single part, once it has more than
+        MAX_TABLE_PARTS parts. The rows and their order are kept,
+        so the cached table and the trip counts stay valid.
+
+        Parameters
+        ----------
+        table : str
+            Table to write, which is trips
+
+        name : str
+            Partition name, e.g., 2020-01
+
+        Returns
+        -------
+        None
+
+        """
+        parts = [fn for fn in self.table_parts(table)
+                 if os.path.basename(fn).startswith(f'{name}.')]
+        if len(parts) <= MAX_TABLE_PARTS:
+            return
+
+        signature = self.table_signature(table)
+        n = int(parts[-1].rsplit('part-', 1)[1].split('.')[0]) + 1
+        path = self.table_path(table)
+        merged = f'{path}/{name}.part-{n:06d}.{self.storage}'
+        self.write_journal(table, {'op': 'merge', 'parts': parts,
+                                   'merged': merged})
+        self.write_part(table, self.load_table(table, files=parts),
+                        prefix=f'{name}.')
+        for fn in parts:
+            os.remove(fn)
+        self.clear_journal(table)
+
+        entry = self.table_cache.get(table)
+        if entry is not None and entry['signature'] == signature:
+            entry['signature'] = self.table_signature(table)
+        self.carry_stats(signature)
+
+    def table_entry(self, table):
+        """
+        This function returns the cache entry of the drivers,
+        locations or trips table, parsing the file again only if
+        its modification time or size changed since it was cached.
+
+        Parameters
+        ----------
+        table : str
+            Either drivers, locations or trips
+
+        Returns
+        -------
+        Dictionary
+            Cached table with the following keys
+
+            * signature - tuple, table_signature when cached
+            * frame - DataFrame, parsed table including deleted
+                      trips
+            * pending - list, dataframes of rows appended by this
+                        instance that are not in frame yet
+            * tombstones - set, trip ids of deleted trips
+            * live - DataFrame or None, frame without deleted
+                     trips, computed on demand
+            * index - dict or None, lookup index of the table
+            * sorted - dict, sorted values and row order of live
+                       per column, built on demand by sorted_rows
+            * legacy - bool, whether the file still holds datetimes
+                       as "hh:mm:ss,DD-MM-YYYY" strings; they are
+                       converted in memory only, and the file is
+                       rewritten by the next write, compact or
+                       migrate_storage
+
+        Raises
+        -------
+        FileNotFoundError
+            If the table does not exist in data_dir
+
+        """
+        signature = self.table_signature(table)
+        entry = self.table_cache.get(table)
+
+        if entry is None or entry['signature'] != signature:
+            if table == 'trips':
+                tombstones = self.read_tombstones()
+            else:
+                tombstones = set()
+
+            self.legacy_tables.discard(table)
+            entry = {
+                'signature': signature,
+                'frame': self.load_table(table),
+                'pending': [],
+                'tombstones': tombstones,
+                'live': None,
+                'index': None,
+                'sorted': dict(),
+                'legacy': table in self.legacy_tables
+            }
+            self.table_cache[table] = entry
+        return entry
+
+    def table_cached(self, table):
+        """
+        This function returns whether a table is cached and in sync
+        with data_dir, i.e., whether read_table can return it
+        without reading data_dir.
+
+        Parameters
+        ----------
+        table : str
+            Either drivers, locations or trips
+
+        Returns
+        -------
+        bool
+
+        """
+        entry = self.table_cache.get(table)
+        return (entry is not None and
+                entry['signature'] == self.table_signature(table))
+
+    def read_partitions(self, start=None, end=None, columns=None):
+        """
+        This function reads the trips in the partitions of the
+        trips table that hold pickups between start and end,
+        leaving out deleted trips, bypassing the cache. Trips of
+        these partitions outside of start and end are included.
+
+        Parameters
+        ----------
+        start : int or None
+            Lower bound of pickup_datetime, in seconds since
+            1970-01-01. Defaults to None, for no lower bound
+
+        end : int or None
+            Upper bound, inclusive, of pickup_datetime. Defaults to
+            None, for no upper bound
+
+        columns : list or None
+            Columns to read, which must include trip_id. Defaults to
+            None, in which case all columns are read
+
+        Returns
+        -------
+        DataFrame
+
+        """
+        df = self.load_table('trips', columns=columns,
+                             files=self.partition_files(start, end))
+        tombstones = self.read_tombstones()
+        if tombstones:
+            df = df[~df['trip_id'].isin(tombstones)].reset_index(drop=True)
+        return df
+
+    def read_table(self, table, copy=True, columns=None):
+        """
+        This function returns the contents of the drivers,
+        locations or trips table, leaving out deleted trips.
+
+        The parsed table is cached on the instance and is only
+        read again when the modification time or size of the
+        file changes. Rows appended by this instance are added
+        to the cached table without parsing the file again.
+
+        Parameters
+        ----------
+        table : str
+            Either drivers, locations or trips
+
+        copy : bool
+            Whether to return a copy of the cached table. Callers
+            that do not modify the returned dataframe can set
+            this to False. Defaults to True
+
+        columns : list or None
+            Columns to return. A table that is not cached yet is
+            read with only these columns (and trip_id) and is not
+            cached. Defaults to None, in which case all columns are
+            returned
+
+        Returns
+        -------
+        DataFrame
+
+        Raises
+        -------
+        FileNotFoundError
+            If the table does not exist in data_dir
+
+        """
+        if columns is not None:
+            if not self.table_cached(table):
+                load_cols = list(columns)
+                if table == 'trips' and 'trip_id' not in load_cols:
+                    load_cols.append('trip_id')
+                df = self.load_table(table, columns=load_cols)
+                if table == 'trips':
+                    df = df[~df['trip_id'].isin(self.read_tombstones())]
+                    df = df.reset_index(drop=True)
+                return df[list(columns)]
+            return self.read_table(table, copy=False)[list(columns)].copy()
+
+        entry = self.table_entry(table)
+
+        if entry['pending']:
+            frames = [df for df in [entry['frame']] + entry['pending']
+                      if len(df) > 0]
+            if frames:
+                entry['frame'] = self.compact_table(
+                    table, pd.concat(frames, ignore_index=True))
+            entry['pending'] = []
+            entry['live'] = None
+
+        if entry['live'] is None:
+            df = entry['frame']
+            if entry['tombstones']:
+                df = df[~df['trip_id'].isin(entry['tombstones'])]
+                df = df.reset_index(drop=True)
+            entry['live'] = df
+            entry['sorted'] = dict()
+
+        if copy:
+            return entry['live'].copy()
+        return entry['live']
+
+    def trip_key(self, driver_id,
+                 pickup_datetime,
+                 dropoff_datetime,
+                 passenger_count,
+                 pickup_loc_id,
+                 dropoff_loc_id,
+                 trip_distance,
+                 fare_amount):
+        """
+        This function returns the normalized key of a trip which
+        is used to check for duplicate entries to the database.
+
+        Parameters
+        ----------
+        driver_id : int
+            Driver id of the trip driver
+
+        pickup_datetime : int
+            Datetime of pickup in seconds since 1970-01-01
+
+        dropoff_datetime : int
+            Datetime of dropoff in seconds since 1970-01-01
+
+        passenger_count : int
+            Number of passengers
+
+        pickup_loc_id : int
+            Location id of the pickup location
+
+        dropoff_loc_id : int
+            Location id of the dropoff location
+
+        trip_distance : float
+            Distance in meters
+
+        fare_amount : float
+            Fare amount
+
+        Returns
+        -------
+        key : tuple
+            Trip values with numbers converted to float
+
+        None
+            If any of the numeric values is missing, in which case
+            the trip can never match another trip
+
+        """
+        numbers = [driver_id, passenger_count, pickup_loc_id,
+                   dropoff_loc_id, trip_distance, fare_amount]
+        if any(x is None or pd.isnull(x) for x in numbers):
+            return None
+
+        driver_id, passenger_count, pickup_loc_id, dropoff_loc_id, \
+            trip_distance, fare_amount = [float(x) for x in numbers]
+        return (driver_id, int(pickup_datetime), int(dropoff_datetime),
+                passenger_count, pickup_loc_id, dropoff_loc_id,
+                trip_distance, fare_amount)
+
+    def trip_keys(self, df):
+        """
+        This function returns the trip_key of every row of a
+        dataframe with the columns of the trips table.
+
+        Parameters
+        ----------
+        df : DataFrame
+            Trips with at least the columns of the trips table
+            except trip_id
+
+        Returns
+        -------
+        List of tuples, with None for rows that have a missing
+        id or number
+
+        """
+        numbers = ['driver_id', 'passenger_count', 'pickup_loc_id',
+                   'dropoff_loc_id', 'trip_distance', 'fare_amount']
+        missing = df[numbers].isnull().any(axis=1).tolist()
+        keys = zip(*[df[col].astype(float).tolist() if col in numbers
+                     else df[col].astype('int64').tolist()
+                     for col in TABLE_COLUMNS['trips'][1:]])
+        return [None if m else key for m, key in zip(missing, keys)]
+
+    def index_rows(self, table, df, index):
+        """
+        This function adds the rows of a dataframe to the lookup
+        index of the specified table. Drivers are keyed by their
+        case-folded "Last name, Given name", locations by their
+        case-folded loc_name and trips by their trip_key. The
+        first row with a given key wins.
+
+        Parameters
+        ----------
+        table : str
+            Either drivers, locations or trips
+
+        df : DataFrame
+            Rows of the table to index
+
+        index : dict
+            Lookup index to update in place
+
+        Returns
+        -------
+        None
+
+        """
+        if table == 'drivers':
+            for driver_id, given_name, last_name in zip(df['driver_id'],
+                                                        df['given_name'],
+                                                        df['last_name']):
+                if isinstance(given_name, str) and isinstance(last_name, str):
+                    key = f'{last_name}, {given_name}'.casefold()
+                    index.setdefault(key, int(driver_id))
+
+        elif table == 'locations':
+            for loc_id, loc_name in zip(df['location_id'], df['loc_name']):
+                if isinstance(loc_name, str):
+                    index.setdefault(loc_name.casefold(), int(loc_id))
+
+        elif table == 'trips':
+            for key, trip_id in zip(self.trip_keys(df), df['trip_id']):
+                if key is not None:
+                    index.setdefault(key, int(trip_id))
+
+    def table_index(self, table):
+        """
+        This function returns the lookup index of the specified
+        table. The index is built once from the cached table and
+        is kept up to date as rows are appended by this instance.
+
+        Parameters
+        ----------
+        table : str
+            Either drivers, locations or trips
+
+        Returns
+        -------
+        Dictionary
+
+        Raises
+        -------
+        FileNotFoundError
+            If the table does not exist in data_dir
+
+        """
+        entry = self.table_entry(table)
+        if entry['index'] is None:
+            index = dict()
+            self.index_rows(table, self.read_table(table, copy=False), index)
+            entry['index'] = index
+        return entry['index']
+
+    def sorted_rows(self, col, start=None, end=None,
+                    include_start=True, include_end=True):
+        """
+        This function returns the positions of the trips whose
+        value of a column falls within a range. The sorted values
+        of the column are kept with the cached trips table, so a
+        range resolves to a slice found by binary search.
+
+        Parameters
+        ----------
+        col : str
+            Column of the trips table, e.g., pickup_datetime
+
+        start : int or None
+            Start of the range. Defaults to None, in which case
+            the range has no lower bound
+
+        end : int or None
+            End of the range. Defaults to None, in which case the
+            range has no upper bound
+
+        include_start : bool
+            Whether the range includes start. Defaults to True
+
+        include_end : bool
+            Whether the range includes end. Defaults to True
+
+        Returns
+        -------
+        Array of row positions in read_table('trips'), in
+        ascending order of col
+
+        """
+        df = self.read_table('trips', copy=False)
+        entry = self.table_entry('trips')
+
+        if col not in entry['sorted']:
+            values = df[col].to_numpy()
+            order = np.argsort(values, kind='stable')
+            entry['sorted'][col] = (values[order], order)
+        values, order = entry['sorted'][col]
+
+        lo, hi = 0, len(values)
+        if start is not None:
+            lo = np.searchsorted(values, start,
+                                 side='left' if include_start else 'right')
+        if end is not None:
+            hi = np.searchsorted(values, end,
+                                 side='right' if include_end else 'left')
+        return order[lo:max(lo, hi)]
+
+    def recover(self):
+        """
+        This method completes the writes left unfinished in data_dir
+        by a crashed process, by replaying their journals.
+
+        Returns
+        -------
+        None
+
+        """
+        for table in TABLE_COLUMNS:
+            if os.path.exists(f'{self.data_dir}/{table}.journal'):
+                with self.table_lock(table):
+                    pass
+
+    @contextlib.contextmanager
+    def table_lock(self, table):
+        """
+        This function locks a table against writes from other
+        processes for the duration of a with block, using an
+        exclusive lock on a sidecar file (e.g., trips.lock). Any
+        unfinished write in the journal of the table is replayed
+        once the lock is acquired. The lock is reentrant within an
+        instance; when several tables are locked, trips is locked
+        before drivers.
+
+        Parameters
+        ----------
+        table : str
+            Either drivers, locations or trips
+
+        """
+        held = self.table_locks.get(table)
+        if held is not None:
+            held[1] += 1
+            try:
+                yield
+            finally:
+                held[1] -= 1
+            return
+
+        f = open(f'{self.data_dir}/{table}.lock', mode='a+')
+        try:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            self.table_locks[table] = [f, 1]
+            self.replay_journal(table)
+            yield
+        finally:
+            self.table_locks.pop(table, None)
+            f.close()
+
+    def write_journal(self, table, record):
+        """
+        This function records a write to a table in its journal
+        before the write is made. The journal is synced to disk.
+
+        Parameters
+        ----------
+        table : str
+            Either drivers, locations or trips
+
+        record : dict
+            Description of the write, see replay_journal
+
+        Returns
+        -------
+        None
+
+        """
+        fn = f'{self.data_dir}/{table}.journal'
+        text = json.dumps(record) + '\n'
+        with self.record_phase('write'), \
+                open(fn, mode='w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        self.record_io(bytes_written=len(text))
+
+    def sync_file(self, path):
+        """
+        This function syncs a file, or a directory after files in
+        it were renamed, to disk, so that a write is durable before
+        its journal is cleared. Directories cannot be opened for
+        syncing on Windows, where they are skipped.
+
+        Parameters
+        ----------
+        path : str
+            Path to the file or directory
+
+        Returns
+        -------
+        None
+
+        """
+        if os.name == 'nt' and os.path.isdir(path):
+            return
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def clear_journal(self, table):
+        """
+        This function marks the write recorded in the journal of a
+        table as complete by removing the journal.
+
+        Parameters
+        ----------
+        table : str
+            Either drivers, locations or trips
+
+        Returns
+        -------
+        None
+
+        """
+        fn = f'{self.data_dir}/{table}.journal'
+        if os.path.exists(fn):
+            os.remove(fn)
+
+    def repair_table(self, table):
+        """
+        This function undoes the partial effects of a write that
+        was interrupted: a row or trip id cut off at the end of a
+        comma-delimited file, or a table left in its temporary
+        directory by write_table. A partition of trips whose header
+        was cut off is removed, as none of its rows were written.
+
+        Parameters
+        ----------
+        table : str
+            Either drivers, locations or trips
+
+        Returns
+        -------
+        None
+
+        """
+        files = []
+        partitions = []
+        path = self.table_path(table)
+        if not os.path.exists(path) and os.path.isdir(f'{path}.tmp'):
+            os.replace(f'{path}.tmp', path)
+            shutil.rmtree(f'{path}.old', ignore_errors=True)
+        if self.storage == 'csv' and self.partitioned(table):
+            partitions = self.table_parts(table)
+            files.extend(partitions)
+        elif self.storage == 'csv':
+            files.append(path)
+        if table == 'trips':
+            files.append(f'{self.data_dir}/trips.tombstones')
+
+        for fn in files:
+            if not os.path.exists(fn):
+                continue
+            with open(fn, mode='rb+') as f:
+                size = f.seek(0, os.SEEK_END)
+                if size == 0:
+                    continue
+                f.seek(size - 1)
+                if f.read(1) == b'\n':
+                    continue
+                f.seek(0)
+                size = f.read().rfind(b'\n') + 1
+                f.truncate(size)
+            if size == 0 and fn in partitions:
+                os.remove(fn)
+
+    def replay_journal(self, table):
+        """
+        This function completes the write recorded in the journal
+        of a table, if any. Records are either
+
+            * {'op': 'append', 'rows': ...} - rows, as comma-delimited
+                text, appended with append_rows
+            * {'op': 'tombstones', 'trip_ids': [...]} - trips deleted
+                with append_tombstones
+            * {'op': 'rewrite'} - table directory swapped in by
+                write_table, which repair_table completes
+            * {'op': 'merge', 'parts': [...], 'merged': ...} - parts
+                of a partition merged by merge_partition; the parts
+                are removed if the merged part was written
+
+        Rows and trip ids that did reach the table are skipped, so
+        replaying a completed write has no effect. A journal that
+        was itself cut off is discarded, as its write never started.
+
+        Parameters
+        ----------
+        table : str
+            Either drivers, locations or trips
+
+        Returns
+        -------
+        None
+
+        """
+        fn = f'{self.data_dir}/{table}.journal'
+        try:
+            with open(fn, encoding='utf-8') as f:
+                record = json.loads(f.read())
+        except FileNotFoundError:
+            return
+        except ValueError:
+            self.clear_journal(table)
+            return
+
+        self.repair_table(table)
+        self.table_cache.pop(table, None)
+
+        if record['op'] == 'merge' and os.path.exists(record['merged']):
+            for fn in record['parts']:
+                if os.path.exists(fn):
+                    os.remove(fn)
+
+        if record['op'] == 'append':
+            rows = pd.read_csv(io.StringIO(record['rows']), header=None,
+                               names=TABLE_COLUMNS[table],
+                               dtype=TABLE_DTYPES[table])
+            id_col = TABLE_COLUMNS[table][0]
+            entry = self.table_entry(table)
+            written = pd.concat([df[id_col] for df in
+                                 [entry['frame']] + entry['pending']])
+            rows = rows[~rows[id_col].isin(written)]
+            if len(rows) > 0:
+                self.append_rows(table, rows.reset_index(drop=True))
+
+        elif record['op'] == 'tombstones':
+            df = self.read_table('trips', copy=False)
+            df = df[df['trip_id'].isin(record['trip_ids'])]
+            if len(df) > 0:
+                self.append_tombstones(df)
+
+        self.clear_journal(table)
+
+    def append_rows(self, table, df):
+        """
+        This function appends the rows of a dataframe to the end
+        of the specified table and keeps the cached table in sync.
+        Partitioned trips are appended to the end of the partitions
+        they fall in and are cached in trip_id order; the cached
+        table is dropped when the rows do not follow it in that
+        order.
+
+        Parameters
+        ----------
+        table : str
+            Either drivers, locations or trips
+
+        df : DataFrame
+            Rows to append, with the columns of the table in order
+
+        Returns
+        -------
+        None
+
+        """
+        signature = self.table_signature(table)
+        self.data_version += 1
+
+        with self.record_phase('write'):
+            text = df.to_csv(index=False, header=False)
+            self.write_journal(table, {'op': 'append', 'rows': text})
+
+            if self.partitioned(table):
+                names = self.write_partitions(table, df)
+            elif self.storage == 'csv':
+                with open(self.table_path(table), mode='a', encoding='utf-8',
+                          newline='') as f:
+                    f.write(text)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self.record_io(bytes_written=len(text))
+            else:
+                self.write_part(table, df)
+
+        if self.storage == 'csv':
+            rows = self.compact_table(table, pd.read_csv(
+                io.StringIO(text), header=None, names=TABLE_COLUMNS[table]))
+        else:
+            rows = self.normalize_table(
+                table, df.astype(TABLE_DTYPES[table]).reset_index(drop=True))
+
+        entry = self.table_cache.get(table)
+        in_order = True
+        if (entry is not None and self.partitioned(table) and
+                len(rows) > 0):
+            last = [df['trip_id'].iloc[-1] for df in
+                    [entry['frame']] + entry['pending'] if len(df) > 0]
+            in_order = (rows['trip_id'].is_monotonic_increasing and
+                        (not last or last[-1] < rows['trip_id'].iloc[0]))
+        if (entry is not None and entry['signature'] == signature and
+                in_order):
+            entry['pending'].append(rows)
+            entry['signature'] = self.table_signature(table)
+            if entry['index'] is not None:
+                self.index_rows(table, rows, entry['index'])
+        else:
+            self.table_cache.pop(table, None)
+
+        if table == 'trips':
+            self.update_stats(rows, 1, signature)
+            self.update_od(rows, 1, signature)
+
+        if self.partitioned(table) and self.storage != 'csv':
+            for name in names:
+                self.merge_partition(table, name)
+        elif (self.storage != 'csv' and
+                len(self.table_parts(table)) > MAX_TABLE_PARTS):
+            signature = self.table_signature(table)
+            self.write_table(table, self.read_table(table, copy=False))
+            if table == 'trips':
+                self.carry_stats(signature)
+
+        self.clear_journal(table)
+        if table in self.legacy_tables:
+            self.compact()
+
+    def write_table(self, table, df):
+        """
+        This function overwrites the specified table with the
+        contents of a dataframe and keeps the cached table in sync.
+        The table is written next to the old one and then swapped
+        in, so readers never see a partially written table.
+        Overwriting trips also clears the tombstone log, since df
+        holds the live trips only. Partitioned trips are written to
+        their partitions, and cached, in trip_id order.
+
+        Parameters
+        ----------
+        table : str
+            Either drivers, locations or trips
+
+        df : DataFrame
+            New contents of the table
+
+        Returns
+        -------
+        None
+
+        """
+        path = self.table_path(table)
+        self.data_version += 1
+        with self.record_phase('write'):
+            if self.storage == 'csv' and not self.partitioned(table):
+                self.widen_table(table, df).to_csv(
+                    f'{path}.tmp', encoding='utf-8', index=False)
+                self.record_io(bytes_written=os.path.getsize(f'{path}.tmp'))
+                self.sync_file(f'{path}.tmp')
+                os.replace(f'{path}.tmp', path)
+                self.sync_file(self.data_dir)
+            else:
+                shutil.rmtree(f'{path}.tmp', ignore_errors=True)
+                os.makedirs(f'{path}.tmp')
+                if self.partitioned(table):
+                    df = df.sort_values(by='trip_id', kind='stable')
+                    self.write_partitions(table, df, path=f'{path}.tmp')
+                else:
+                    self.write_part(table, df, path=f'{path}.tmp')
+                self.write_journal(table, {'op': 'rewrite'})
+                if os.path.exists(path):
+                    os.replace(path, f'{path}.old')
+                os.replace(f'{path}.tmp', path)
+                self.sync_file(self.data_dir)
+                shutil.rmtree(f'{path}.old', ignore_errors=True)
+                self.clear_journal(table)
+
+        tombstone_fn = f'{self.data_dir}/trips.tombstones'
+        if table == 'trips' and os.path.exists(tombstone_fn):
+            os.remove(tombstone_fn)
+        self.legacy_tables.discard(table)
+
+        self.table_cache[table] = {
+            'signature': self.table_signature(table),
+            'frame': self.compact_table(table, df.reset_index(drop=True)),
+            'pending': [],
+            'tombstones': set(),
+            'live': None,
+            'index': None,
+            'sorted': dict()
+        }
+
+    def append_tombstones(self, df):
+        """
+        This function records trips as deleted by appending their
+        trip ids to the tombstone log, and drops them from the
+        cached trips table and its duplicate index.
+
+        Parameters
+        ----------
+        df : DataFrame
+            Rows of the trips table to delete
+
+        Returns
+        -------
+        None
+
+        """
+        entry = self.table_entry('trips')
+        signature = entry['signature']
+        trip_ids = [int(x) for x in df['trip_id']]
+        self.data_version += 1
+
+        self.write_journal('trips', {'op': 'tombstones',
+                                     'trip_ids': trip_ids})
+
+        fn = f'{self.data_dir}/trips.tombstones'
+        text = ''.join(f'{x}\n' for x in trip_ids)
+        with self.record_phase('write'), \
+                open(fn, mode='a', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        self.record_io(bytes_written=len(text))
+
+        entry['tombstones'].update(trip_ids)
+        entry['live'] = None
+        entry['signature'] = self.table_signature('trips')
+        self.update_stats(df, -1, signature)
+        self.update_od(df, -1, signature)
+
+        if entry['index'] is not None:
+            for key, trip_id in zip(self.trip_keys(df), trip_ids):
+                if key is not None and entry['index'].get(key) == trip_id:
+                    del entry['index'][key]
+
+        self.clear_journal('trips')
+        if 'trips' in self.legacy_tables:
+            self.compact()
+
+    @instrumented('write')
+    def compact(self, threshold=None):
+        """
+        This method rewrites trips.csv without the deleted trips
+        and clears the tombstone log, if the share of deleted trips
+        in the file is at least the given threshold. The file is
+        also rewritten if it still holds datetimes as strings, so
+        that they are not parsed again on every load.
+
+        Parameters
+        ----------
+        threshold : float or None
+            Minimum share of deleted trips, between 0 and 1, for
+            the file to be rewritten. Defaults to None, in which
+            case compact_threshold is used. Use 0 to always
+            rewrite the file when there are deleted trips
+
+        Returns
+        -------
+        True if trips.csv was rewritten, False otherwise
+
+        """
+        if threshold is None:
+            threshold = self.compact_threshold
+
+        with self.table_lock('trips'):
+            entry = self.table_entry('trips')
+            deleted = len(entry['tombstones'])
+            total = sum(len(df) for df in [entry['frame']] + entry['pending'])
+
+            if not entry.get('legacy') and (
+                    deleted == 0 or deleted < threshold * total):
+                return False
+
+            signature = entry['signature']
+            self.write_table('trips', self.read_table('trips', copy=False))
+            self.carry_stats(signature)
+            return True
+
+    def reserve_ids(self, table, count=1):
+        """
+        This function hands out new ids for the drivers or trips
+        table from a sequence persisted in a sidecar file next to
+        the table (e.g., trips.seq), which holds the next free id.
+
+        The sidecar is locked while it is updated so concurrent
+        writers never get the same id. If it does not exist yet,
+        the sequence starts after the largest id stored in the
+        table, counting deleted trips, so that a deleted trip_id is
+        never handed out again while its tombstone exists.
+
+        Parameters
+        ----------
+        table : str
+            Either drivers or trips
+
+        count : int
+            Number of contiguous ids to reserve. Defaults to 1
+
+        Returns
+        -------
+        First reserved id; the reserved ids are this value up to
+        this value plus count minus one
+
+        """
+        id_col = {'drivers': 'driver_id', 'trips': 'trip_id'}[table]
+        fn = f'{self.data_dir}/{table}.seq'
+
+        with open(fn, mode='a+', encoding='utf-8') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            text = f.read().strip()
+
+            if text:
+                next_id = int(text)
+            else:
+                entry = self.table_entry(table)
+                ids = [df[id_col].max() for df in
+                       [entry['frame']] + entry['pending'] if len(df) > 0]
+                ids = [int(x) for x in ids if not pd.isnull(x)]
+                ids.extend(entry['tombstones'])
+                next_id = max(ids, default=0) + 1
+
+            f.seek(0)
+            f.truncate()
+            f.write(f'{next_id + count}\n')
+        return next_id
+
+    def migrate_storage(self, storage, partition=None):
+        """
+        This method copies the drivers, locations and trips tables
+        of data_dir to another storage format, or another
+        partitioning of trips, and switches this instance to it.
+        Deleted trips are carried over through the tombstone log,
+        and the original files are left in place. Migrating to the
+        current format rewrites a trips table that still holds
+        datetimes as strings, e.g., python sakaydb.py migrate data
+        csv.
+
+        Parameters
+        ----------
+        storage : str
+            Either csv, parquet or feather
+
+        partition : str or None
+            Partitioning of the trips table, either month or day.
+            Defaults to None, for a single trips table
+
+        Returns
+        -------
+        None
+
+        Raises
+        -------
+        SakayDBError
+            For unknown storage formats or partitions, or if a table
+            already exists in the target format
+
+        """
+        self.check_storage(storage)
+        self.check_partition(partition)
+
+        with self.table_lock('trips'), self.table_lock('drivers'), \
+                self.table_lock('locations'):
+            self.copy_tables(storage, partition)
+
+        self.storage = storage
+        self.partition = partition
+        self.table_cache = dict()
+        self.data_version += 1
+
+    def copy_tables(self, storage, partition=None):
+        """
+        This function is the part of migrate_storage run while the
+        tables are locked; it copies the tables to the given storage
+        format and partitioning. Tables already stored that way are
+        left as they are, unless trips still holds datetimes as
+        strings, in which case it is rewritten.
+
+        """
+        frames = dict()
+        for table in TABLE_COLUMNS:
+            try:
+                self.read_table(table, copy=False)
+            except FileNotFoundError:
+                continue
+            frames[table] = self.table_entry(table)['frame']
+
+        target = SakayDB(self.data_dir, self.compact_threshold, storage,
+                         partition=partition)
+        for table in list(frames):
+            if target.table_path(table) == self.table_path(table):
+                del frames[table]
+                if self.table_entry(table).get('legacy'):
+                    self.compact()
+            elif os.path.exists(target.table_path(table)):
+                raise SakayDBError(
+                    f'{target.table_path(table)} already exists')
+
+        for table, df in frames.items():
+            path = target.table_path(table)
+            if target.partitioned(table):
+                os.makedirs(path)
+                target.write_partitions(table, df)
+            elif storage == 'csv':
+                self.widen_table(table, df).to_csv(path, encoding='utf-8',
+                                                   index=False)
+            else:
+                os.makedirs(path)
+                target.write_part(table, df)
+
+    def cached_call(self, method, *args, **kwargs):
+        """
+        This function calls a query method through the result
+        cache. Results are keyed by method, arguments and their
+        types (see typed_key) and data_version, and are only reused
+        while the tables on disk are unchanged. Keyword arguments are
+        keyed in call order, as search_trips sorts by the last one.
+        The least recently used result is dropped once the cache
+        holds result_cache_size results.
+
+        Parameters
+        ----------
+        method : function
+            Query method to call
+
+        *args, **kwargs
+            Arguments of the query method
+
+        Returns
+        -------
+        A copy of the result of the query method
+
+        """
+        if self.result_cache_size <= 0:
+            return method(self, *args, **kwargs)
+
+        key = (method.__name__, typed_key(args),
+               typed_key(tuple(kwargs.items())), self.data_version)
+        try:
+            hash(key)
+        except TypeError:
+            return method(self, *args, **kwargs)
+
+        signature = tuple(self.table_signature(table)
+                          for table in ['drivers', 'locations', 'trips'])
+        cached = self.result_cache.get(key)
+        if cached is not None and cached[0] == signature:
+            self.result_cache.move_to_end(key)
+            self.result_cache_hits += 1
+            return copy.deepcopy(cached[1])
+
+        self.result_cache_misses += 1
+        result = method(self, *args, **kwargs)
+
+        self.result_cache[key] = (signature, copy.deepcopy(result))
+        self.result_cache.move_to_end(key)
+        while len(self.result_cache) > self.result_cache_size:
+            self.result_cache.popitem(last=False)
+        return result
+
+    def instrumented_call(self, phase, method, *args, **kwargs):
+        """
+        This function calls a public method and records the call:
+        its wall time, the time spent in each phase of METRIC_PHASES,
+        the rows scanned and returned, and the file bytes read and
+        written. The record is added to the totals returned by
+        metrics and passed to metrics_callback, also when the call
+        raises.
+
+        Parameters
+        ----------
+        phase : str
+            Phase that the time of the method is counted in, except
+            for the time spent in other phases
+
+        method : function
+            Public method to call
+
+        *args, **kwargs
+            Arguments of the method
+
+        Returns
+        -------
+        The result of the method
+
+        """
+        record = {
+            'method': method.__name__,
+            'seconds': 0.0,
+            'phases': dict.fromkeys(METRIC_PHASES, 0.0),
+            'rows_scanned': 0,
+            'rows_returned': 0,
+            'bytes_read': 0,
+            'bytes_written': 0,
+            'error': None
+        }
+        self.metrics_call = record
+        self.metrics_phases = []
+        start = time.perf_counter()
+        try:
+            with self.record_phase(phase):
+                result = method(self, *args, **kwargs)
+            if isinstance(result, (pd.DataFrame, list, dict)):
+                record['rows_returned'] = len(result)
+            elif isinstance(result, int) and not isinstance(result, bool):
+                record['rows_returned'] = 1
+            return result
+        except Exception as e:
+            record['error'] = type(e).__name__
+            raise
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            self.metrics_call = None
+            self.record_metrics(record)
+
+    @contextlib.contextmanager
+    def record_phase(self, phase):
+        """
+        This function times a with block as a phase of the call
+        being recorded, if any. Time spent in a phase nested in
+        another is only counted for the inner phase.
+
+        Parameters
+        ----------
+        phase : str
+            One of METRIC_PHASES
+
+        """
+        record = self.metrics_call
+        if record is None:
+            yield
+            return
+
+        self.metrics_phases.append([phase, time.perf_counter(), 0.0])
+        try:
+            yield
+        finally:
+            phase, start, nested = self.metrics_phases.pop()
+            elapsed = time.perf_counter() - start
+            record['phases'][phase] += elapsed - nested
+            if self.metrics_phases:
+                self.metrics_phases[-1][2] += elapsed
+
+    def record_io(self, **counts):
+        """
+        This function adds to the counts of the call being
+        recorded, if any.
+
+        Parameters
+        ----------
+        **counts
+            Any of rows_scanned, rows_returned, bytes_read and
+            bytes_written
+
+        Returns
+        -------
+        None
+
+        """
+        record = self.metrics_call
+        if record is not None:
+            for key, n in counts.items():
+                record[key] += int(n)
+
+    def record_metrics(self, record):
+        """
+        This function adds the record of a call to the totals of
+        its method, and passes it to metrics_callback.
+
+        Parameters
+        ----------
+        record : dict
+            Record made by instrumented_call
+
+        Returns
+        -------
+        None
+
+        """
+        totals = self.metrics_summary.get(record['method'])
+        if totals is None:
+            totals = {
+                'calls': 0,
+                'errors': 0,
+                'seconds': 0.0,
+                'max_seconds': 0.0,
+                'phases': dict.fromkeys(record['phases'], 0.0),
+                'rows_scanned': 0,
+                'rows_returned': 0,
+                'bytes_read': 0,
+                'bytes_written': 0
+            }
+            self.metrics_summary[record['method']] = totals
+
+        totals['calls'] += 1
+        totals['errors'] += record['error'] is not None
+        totals['seconds'] += record['seconds']
+        totals['max_seconds'] = max(totals['max_seconds'], record['seconds'])
+        for phase, seconds in record['phases'].items():
+            totals['phases'][phase] += seconds
+        for key in ['rows_scanned', 'rows_returned', 'bytes_read',
+                    'bytes_written']:
+            totals[key] += record[key]
+
+        if self.metrics_callback is not None:
+            self.metrics_callback(dict(record, phases=dict(record['phases'])))
+
+    def metrics(self, reset=False):
+        """
+        This method returns the totals of the calls recorded since
+        instrumentation was turned on, or since the last reset.
+
+        Rows scanned are the rows of the tables that were filtered,
+        counted or exported. Rows returned are the rows of a result
+        dataframe, the entries of a statistics dictionary, the trip
+        ids added, or the rows exported to a file. File bytes of
+        comma-delimited text are counted as characters.
+
+        Parameters
+        ----------
+        reset : bool
+            Whether to clear the totals after returning them.
+            Defaults to False
+
+        Returns
+        -------
+        Dictionary with method names as keys and dictionaries with
+        the following keys as values
+
+            * calls - int, number of calls
+            * errors - int, number of calls that raised
+            * seconds - float, total wall time
+            * mean_seconds - float, wall time per call
+            * max_seconds - float, longest wall time
+            * phases - dict, total time in each of METRIC_PHASES
+            * rows_scanned, rows_returned - int, total rows
+            * bytes_read, bytes_written - int, total file bytes
+
+        """
+        summary = copy.deepcopy(self.metrics_summary)
+        for totals in summary.values():
+            totals['mean_seconds'] = totals['seconds'] / totals['calls']
+        if reset:
+            self.metrics_summary = dict()
+        return summary
+
+    def memory_usage(self):
+        """
+        This method reports the memory used by the tables held in
+        the table_cache attribute, per column, and by the arrays of
+        OD counts held in the od_cache attribute. Tables that are
+        not cached are left out.
+
+        Returns
+        -------
+        DataFrame indexed by table and column, with the following
+        columns
+
+            * dtype - str, type of the column in memory
+            * rows - int, number of rows held, including deleted
+                     trips and rows appended since the table was
+                     read
+            * bytes - int, bytes used, including the strings of
+                      object columns
+
+        """
+        records = []
+        for table in TABLE_COLUMNS:
+            entry = self.table_cache.get(table)
+            if entry is None:
+                continue
+            frames = [entry['frame']] + entry['pending']
+            rows = sum(len(df) for df in frames)
+            if entry['live'] is not None and entry['live'] is not frames[0]:
+                frames.append(entry['live'])
+            for col in entry['frame'].columns:
+                records.append({
+                    'table': table,
+                    'column': col,
+                    'dtype': str(entry['frame'][col].dtype),
+                    'rows': rows,
+                    'bytes': sum(int(df[col].memory_usage(index=False,
+                                                           deep=True))
+                                 for df in frames)
+                })
+
+        if self.od_cache is not None:
+            for key, value in self.od_cache.items():
+                if isinstance(value, np.ndarray):
+                    records.append({'table': 'od_cache', 'column': key,
+                                    'dtype': str(value.dtype),
+                                    'rows': len(value),
+                                    'bytes': value.nbytes})
+
+        return pd.DataFrame(records,
+                            columns=['table', 'column', 'dtype', 'rows',
+                                     'bytes']).set_index(['table', 'column'])
+
+    def get_driver_id(self, driver):
+        """
+        This function returns the driver_id of the specified
+        trip driver.
+
+        Parameters
+        ----------
+        driver : str
+            Trip driver name in formatted as
+            Last name, Given name
+
+        Returns
+        -------
+        driver_id : int
+            Driver id of the trip driver if they are already
+            in the drivers database
+
+        None
+            If trip driver is not recorded in the drivers database
+
+        """
+
+        last_name, given_name = [x.strip() for x in driver.split(',')]
+
+        drivers_index = self.table_index('drivers')
+        return drivers_index.get(f'{last_name}, {given_name}'.casefold())
+
+    def get_loc_id(self, location):
+        """
+        This function returns the loc_id of the specified
+        location. This will be used to get loc_id's of
+        specified pickup and dropoff location names.
+
+        Parameters
+        ----------
+        location : str
+            Zone (e.g., Pine View, Legazpi Village)
+
+        Returns
+        -------
+        loc_id : int
+            Location id of the specified pickup or dropoff
+            location if it is in the locations database
+
+        None
+            If specified location is not in the database
+
+        """
+        locations_index = self.table_index('locations')
+        return locations_index.get(location.strip().casefold())
+
+    def get_trip_id(self, driver,
+                    pickup_datetime,
+                    dropoff_datetime,
+                    passenger_count,
+                    pickup_loc_name,
+                    dropoff_loc_name,
+                    trip_distance,
+                    fare_amount):
+        """
+        This function returns the trip_id of the specified trip if
+        it already exists in the database. This will be used to check
+        for duplicate entries to the database. With partitioned trips
+        that are not cached, only the partition of pickup_datetime
+        is read.
+
+        Parameters
+        ----------
+        pickup_datetime : str
+            datetime of pickup formatted as "hh:mm:ss,DD-MM-YYYY"
+
+        dropoff_datetime : str
+            Datetime of dropoff formatted as "hh:mm:ss,DD-MM-YYYY"
+
+        passenger_count : int
+            Number of passengers
+
+        pickup_loc_name : str
+            Zone (e.g., Pine View, Legazpi Village)
+
+        dropoff_loc_name : str
+            Zone (e.g., Pine View, Legazpi Village)
+
+        trip_distance : float
+            Distance in meters
+
+        fare_amount : float
+            Fare amount
+
+        Returns
+        -------
+        trip_id : int
+            Trip id of the specified trip if it is already in
+            the database.
+
+        None
+            If specified trip is not in the database
+
+        """
+        try:
+            pickup_datetime = self.to_epoch(pickup_datetime)
+            dropoff_datetime = self.to_epoch(dropoff_datetime)
+        except Exception:
+            return None
+
+        key = self.trip_key(self.get_driver_id(driver),
+                            pickup_datetime,
+                            dropoff_datetime,
+                            passenger_count,
+                            self.get_loc_id(pickup_loc_name),
+                            self.get_loc_id(dropoff_loc_name),
+                            trip_distance,
+                            fare_amount)
+
+        if key is None:
+            return None
+
+        if self.partition is not None and not self.table_cached('trips'):
+            index = dict()
+            self.index_rows('trips', self.read_partitions(
+                pickup_datetime, pickup_datetime), index)
+            return index.get(key)
+        return self.table_index('trips').get(key)
+
+    def add_driver(self, driver):
+        """
+        This function updates the database in case specified
+        driver in the main function is not in the database yet.
+        This also handles driver id assignment for new drivers.
+
+        Parameters
+        ----------
+        driver : str
+            Trip driver name in formatted as
+            Last name, Given name
+
+        Returns
+        -------
+        None
+
+        """
+        last_name, given_name = [x.strip() for x in driver.split(',')]
+
+        self.check_create_table('drivers')
+
+        with self.table_lock('drivers'):
+            if self.get_driver_id(driver) is None:
+                data = {
+                    'driver_id': [self.reserve_ids('drivers')],
+                    'given_name': [given_name],
+                    'last_name': [last_name]
+                }
+                self.append_rows('drivers', pd.DataFrame(data))
+
+    @instrumented('write')
+    def add_trip(self, driver,
+                 pickup_datetime,
+                 dropoff_datetime,
+                 passenger_count,
+                 pickup_loc_name,
+                 dropoff_loc_name,
+                 trip_distance,
+                 fare_amount):
+        """
+        This method appends the specified trip data to the end of
+        the trips database, if it exists, or creates it, otherwise.
+
+
+        Parameters
+        ----------
+        driver : str
+            Trip driver name in formatted as
+            Last name, Given name
+
+        pickup_datetime : str
+            datetime of pickup formatted as
+            "hh:mm:ss,DD-MM-YYYY"
+
+        dropoff_datetime : str
+            Datetime of dropoff formatted as
+            "hh:mm:ss,DD-MM-YYYY"
+
+        passenger_count : int
+            Number of passengers
+
+        pickup_loc_name : str
+            Zone (e.g., Pine View, Legazpi Village)
+
+        dropoff_loc_name : str
+            Zone (e.g., Pine View, Legazpi Village)
+
+        trip_distance : float
+            Distance in meters
+
+        fare_amount : float
+            Fare amount
+
+
+        Returns
+        -------
+        Generated trip id of successfully added trip 
+
+
+        Raises
+        -------
+        SakayDBError
+            For wrong input formats or when the specified
+            trip already exists
+
+        """
+        try:
+            driver.split(',')
+            p_datetime = self.to_epoch(pickup_datetime)
+            d_datetime = self.to_epoch(dropoff_datetime)
+            trip_distance = float(trip_distance)
+            fare_amount = float(fare_amount)
+
+        except Exception as e:
+            raise SakayDBError(f'Wrong input format: {e}')
+
+        if isinstance(pickup_loc_name, str) and isinstance(dropoff_loc_name, str) and isinstance(passenger_count, int):
+            pass
+        else:
+            raise SakayDBError('Wrong input format.')
+
+        self.check_create_table('trips')
+
+        with self.table_lock('trips'):
+            self.add_driver(driver)
+
+            if self.get_trip_id(driver, pickup_datetime, dropoff_datetime, passenger_count,
+                                pickup_loc_name, dropoff_loc_name, trip_distance, fare_amount) is None:
+                trip_id = self.reserve_ids('trips')
+                trip_data = {
+                    'trip_id': [trip_id],
+                    'driver_id': [self.get_driver_id(driver)],
+                    'pickup_datetime': [p_datetime],
+                    'dropoff_datetime': [d_datetime],
+                    'passenger_count': [passenger_count],
+                    'pickup_loc_id': [self.get_loc_id(pickup_loc_name)],
+                    'dropoff_loc_id': [self.get_loc_id(dropoff_loc_name)],
+                    'trip_distance': [trip_distance],
+                    'fare_amount': [fare_amount]
+                }
+
+                self.append_rows('trips', pd.DataFrame(trip_data))
+                return trip_id
+            else:
+                raise SakayDBError('Trip exists in the database')
+
+    @instrumented('write')
+    def add_trips(self, trips_list):
+        """
+        This method accepts a list of trips in the
+        form of dictionaries. It will add each trip
+        to the database and return a list of trip_ids
+        of successfully added trips.
+
+        If a trip is already in the database, it will
+        skip it and print a warning instead.
+
+        Parameters
+        ----------
+        trips_list : list
+            List of dictionaries with the following keys
+            and values
+
+            * driver - str, trip driver name in formatted
+                       as Last name, Given name
+            * pickup_datetime - str, datetime of pickup
+                       formatted as "hh:mm:ss,DD-MM-YYYY"
+            * dropoff_datetime - str, datetime of dropoff
+                       formatted as "hh:mm:ss,DD-MM-YYYY"
+            * passenger_count - int, number of passengers
+            * pickup_loc_name - str, zone
+                       (e.g., Pine View, Legazpi Village)
+            * dropoff_loc_name - str, zone
+                       (e.g., Pine View, Legazpi Village)
+            * trip_distance - float, distance in meters
+            * fare_amount - float, fare amount
+
+
+        Returns
+        -------
+        List of trip ids successfully added to the database
+
+
+        Prints
+        -------
+        Warning
+             If a trip is already in the database or if
+             a trip has invalid or incomplete information.
+             Note: Both of these cases are skipped.
+
+        """
+        fields = ['driver', 'pickup_datetime', 'dropoff_datetime',
+                  'passenger_count', 'pickup_loc_name', 'dropoff_loc_name',
+                  'trip_distance', 'fare_amount']
+        warnings = dict()
+        rows = []
+        positions = []
+        for i, row in enumerate(trips_list):
+            try:
+                rows.append([row[k] for k in fields])
+                positions.append(i)
+            except Exception:
+                warnings[i] = (f'Warning: trip index {i} has invalid or '
+                               'incomplete information. Skipping...')
+
+        trips = pd.DataFrame(rows, columns=fields, index=positions,
+                             dtype=object)
+        valid = self.validate_trips(trips)
+
+        for i in trips.index[~valid]:
+            warnings[i] = (f'Warning: trip index {i} is already in the '
+                           'database. Skipping...')
+
+        trip_ids = []
+        trips = trips[valid]
+        if len(trips) > 0:
+            trip_ids = self.insert_trips(trips, warnings)
+
+        for i in sorted(warnings):
+            print(warnings[i])
+
+        return trip_ids
+
+    def validate_trips(self, trips):
+        """
+        This function checks the format of a batch of trips the
+        same way add_trip checks a single trip. Datetimes, distances
+        and fares are converted in place to the types that add_trip
+        stores.
+
+        Parameters
+        ----------
+        trips : DataFrame
+            Trips with the keys accepted by add_trips as columns
+
+        Returns
+        -------
+        Boolean Series which is True for trips with a valid format
+
+        """
+        def to_float(x):
+            try:
+                return float(x)
+            except Exception:
+                return np.nan
+
+        def is_driver(x):
+            return isinstance(x, str) and len(x.split(',')) == 2
+
+        valid = trips['driver'].map(is_driver)
+        for col in ['pickup_datetime', 'dropoff_datetime']:
+            parsed = pd.to_datetime(trips[col], format=DATETIME_FORMAT,
+                                    errors='coerce')
+            trips[col] = (parsed - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+            valid &= parsed.notnull()
+        for col in ['trip_distance', 'fare_amount']:
+            trips[col] = trips[col].map(to_float)
+            valid &= trips[col].notnull()
+        for col in ['pickup_loc_name', 'dropoff_loc_name']:
+            valid &= trips[col].map(lambda x: isinstance(x, str))
+        valid &= trips['passenger_count'].map(lambda x: isinstance(x, int))
+
+        return valid.astype(bool)
+
+    def insert_trips(self, trips, warnings):
+        """
+        This function adds a batch of trips that passed
+        validate_trips to the database. New drivers are registered
+        in a single append, duplicates of existing trips or of
+        earlier trips in the batch are skipped, and the remaining
+        trips get contiguous trip ids and are written at once.
+
+        Parameters
+        ----------
+        trips : DataFrame
+            Validated trips with the keys accepted by add_trips
+            as columns, indexed by position in the input list
+
+        warnings : dict
+            Warnings keyed by position in the input list; a warning
+            is added for every skipped duplicate
+
+        Returns
+        -------
+        List of trip ids successfully added to the database
+
+        """
+        self.check_create_table('drivers')
+        self.check_create_table('trips')
+
+        with self.table_lock('trips'):
+            return self.insert_locked_trips(trips, warnings)
+
+    def insert_locked_trips(self, trips, warnings):
+        """
+        This function is the part of insert_trips run while the
+        trips table is locked; it takes the same parameters and
+        returns the same value.
+
+        """
+        names = trips['driver'].map(
+            lambda x: [part.strip() for part in x.split(',')])
+        driver_keys = names.map(lambda x: f'{x[0]}, {x[1]}'.casefold())
+
+        with self.table_lock('drivers'):
+            drivers_index = self.table_index('drivers')
+            new_drivers = dict()
+            for key, (last_name, given_name) in zip(driver_keys, names):
+                if key not in drivers_index and key not in new_drivers:
+                    new_drivers[key] = (given_name, last_name)
+
+            if new_drivers:
+                driver_id = self.reserve_ids('drivers', len(new_drivers))
+                data = {
+                    'driver_id': range(driver_id,
+                                       driver_id + len(new_drivers)),
+                    'given_name': [x[0] for x in new_drivers.values()],
+                    'last_name': [x[1] for x in new_drivers.values()]
+                }
+                self.append_rows('drivers', pd.DataFrame(data))
+                drivers_index = self.table_index('drivers')
+
+        try:
+            locations_index = self.table_index('locations')
+        except FileNotFoundError:
+            for i in trips.index:
+                warnings[i] = (f'Warning: trip index {i} is already in '
+                               'the database. Skipping...')
+            return []
+
+        def loc_ids(names):
+            return pd.Series([locations_index.get(x.strip().casefold())
+                              for x in names], index=names.index,
+                             dtype=object)
+
+        trip_data = pd.DataFrame({
+            'driver_id': driver_keys.map(drivers_index),
+            'pickup_datetime': trips['pickup_datetime'].astype('int64'),
+            'dropoff_datetime': trips['dropoff_datetime'].astype('int64'),
+            'passenger_count': trips['passenger_count'],
+            'pickup_loc_id': loc_ids(trips['pickup_loc_name']),
+            'dropoff_loc_id': loc_ids(trips['dropoff_loc_name']),
+            'trip_distance': trips['trip_distance'],
+            'fare_amount': trips['fare_amount']
+        }, dtype=object)
+
+        trips_index = self.table_index('trips')
+        batch_keys = set()
+        keep = []
+        for i, key in zip(trip_data.index, self.trip_keys(trip_data)):
+            if key is not None and (key in trips_index or key in batch_keys):
+                warnings[i] = (f'Warning: trip index {i} is already in '
+                               'the database. Skipping...')
+                keep.append(False)
+            else:
+                batch_keys.add(key)
+                keep.append(True)
+
+        trip_data = trip_data[keep]
+        if len(trip_data) == 0:
+            return []
+
+        trip_id = self.reserve_ids('trips', len(trip_data))
+        trip_ids = list(range(trip_id, trip_id + len(trip_data)))
+        trip_data.insert(0, 'trip_id', trip_ids)
+        self.append_rows('trips', trip_data)
+        return trip_ids
+
+    @instrumented('write')
+    def delete_trip(self, tr_id):
+        """
+        This method accepts a trip id to delete then removes
+        it from the trips database. 
+
+        The trip is recorded in the tombstone log instead of
+        rewriting trips.csv. The deleted trips are only removed
+        from the file by a separate call to compact, which checks
+        the share of deleted trips against compact_threshold.
+
+        Parameters
+        ----------
+        tr_id : int
+            Trip id to delete from the database
+
+        Raises
+        -------
+        SakayDBError
+            If the trip_id is not found
+
+        """
+        try:
+            self.table_entry('trips')
+        except Exception as e:
+            raise SakayDBError(f'{e}')
+
+        with self.table_lock('trips'):
+            entry = self.table_entry('trips')
+            frames = [entry['frame']] + entry['pending']
+            tr_id_check = pd.concat([df.loc[df['trip_id'] == tr_id, :]
+                                     for df in frames])
+
+            if len(tr_id_check) == 0 or tr_id in entry['tombstones']:
+                raise SakayDBError('trip_id cannot be found')
+            else:
+                self.append_tombstones(tr_id_check)
+
+    def search_input_check(self, k, v):
+        """
+        This function is used to check the inputs of the
+        search_trips function.
+
+        Parameters
+        ----------
+        k : str
+            Variable to check format for;
+            Expects either driver_id, passenger_count, pickup
+            or dropoff datetime, trip_distance, fare_amount
+
+        v : str, int, or float
+            Corresponding value of specified variable for
+            format checking
+
+        Raises
+        -------
+        SakayDBError
+            If expected format is not followed
+
+        """
+        if k == 'driver_id' or k == 'passenger_count':
+            if isinstance(v, int):
+                pass
+            else:
+                raise SakayDBError(f'{k} must be an integer')
+        elif k == 'pickup_datetime' or k == 'dropoff_datetime':
+            try:
+                pd.to_datetime(v, format='%H:%M:%S,%d-%m-%Y')
+            except Exception as e:
+                raise SakayDBError(f'Wrong input format: {e}')
+        elif k == 'trip_distance' or k == 'fare_amount':
+            if isinstance(v, int) or isinstance(v, float):
+                pass
+            else:
+                raise SakayDBError(f'{k} must be a number')
+
+    @instrumented('filter')
+    @cached_result
+    def search_trips(self, **kwargs):
+        """
+        This method looks for specific trips in the database
+        that matches the specified criteria. This accepts
+        keyworded arguments.
+
+
+        Parameters
+        ----------
+        driver_id : int or tuple
+            Driver id
+
+        pickup_datetime : str or tuple
+            Datetime of pickup formatted as
+            "hh:mm:ss,DD-MM-YYYY"
+
+        dropoff_datetime : str or tuple
+            Datetime of dropoff formatted as
+            "hh:mm:ss,DD-MM-YYYY"
+
+        passenger_count : int or tuple
+            Number of passengers as integer
+
+        trip_distance : float or tuple
+            Distance in meters
+
+        fare_amount : float or tuple
+            fare amount
+
+
+        Note: Tuple inputs can follow any of the
+        following cases
+
+        * Case 1: tuple like (value,None) - returns all
+                  entries from value (end inclusive)
+                  
+        * Case 2: tuple like (None,value) returns all
+                  entries up to value (end inclusive)
+                  
+        * Case 3: tuple like (value1,value2) returns values
+                  between value1 and value2 (end inclusive)
+
+
+        Returns
+        -------
+        Dataframe with all the entries aligned with
+        search key and values. Partitioned trips give
+        the same rows and index as unpartitioned ones
+
+
+        Raises
+        -------
+        SakayDBError
+            For invalid keyword arguments, wrong input
+            formats, and when no input is provided.
+
+        """
+        valid_args = ['driver_id', 'pickup_datetime', 'dropoff_datetime',
+                      'passenger_count', 'trip_distance', 'fare_amount']
+
+        if len(kwargs.keys()) == 0:
+            raise SakayDBError('No input provided')
+        elif any(x not in valid_args for x in kwargs.keys()):
+            raise SakayDBError('Invalid argument keyword')
+        else:
+            self.check_create_table('trips')
+
+            bounds = []
+            if self.partition is not None and not self.table_cached('trips'):
+                predicates = self.parse_search(kwargs)
+                bounds = [(start, end) for k, start, end in predicates
+                          if k == 'pickup_datetime']
+
+            if bounds:
+                if not self.table_parts('trips'):
+                    return []
+                df_trips = self.read_partitions(*bounds[0])
+                plan = self.plan_search(predicates, use_index=False)
+            else:
+                df_trips = self.read_table('trips', copy=False)
+
+                if len(df_trips) == 0:
+                    return []
+
+                predicates = self.parse_search(kwargs)
+                plan = self.plan_search(predicates)
+
+            rows = self.search_rows(df_trips, plan)
+            df_trips = df_trips.iloc[rows]
+            if bounds:
+                df_trips.index = self.trip_positions(df_trips['trip_id'])
+            df_trips = self.widen_table('trips', df_trips)
+
+            sort_keys = [k for k, start, end in predicates
+                         if k != 'pickup_datetime' and k != 'dropoff_datetime']
+            if sort_keys:
+                df_trips = df_trips.sort_values(by=sort_keys[-1],
+                                                ascending=True, kind='stable')
+
+            df_trips['pickup_datetime'] = self.from_epoch(
+                df_trips['pickup_datetime'])
+            df_trips['dropoff_datetime'] = self.from_epoch(
+                df_trips['dropoff_datetime'])
+            return df_trips
+
+    def iter_search_trips(self, chunksize=100000, **kwargs):
+        """
+        This method looks for trips the same way search_trips does,
+        but reads the trips table in chunks instead of loading it
+        whole, so memory use is bounded by chunksize rather than by
+        the size of the table.
+
+        Parameters
+        ----------
+        chunksize : int
+            Number of rows of the trips table read at a time.
+            Defaults to 100000
+
+        **kwargs
+            Search criteria, as accepted by search_trips
+
+
+        Returns
+        -------
+        Iterator of dataframes with the matching trips of each
+        chunk, in trip_id order. Rows within a batch are sorted the
+        same way as in search_trips, and have the same index. With
+        partitioned trips, only the partitions in range of a
+        pickup_datetime criterion are read. Chunks without matches
+        are skipped.
+
+
+        Raises
+        -------
+        SakayDBError
+            For invalid keyword arguments, wrong input
+            formats, and when no input is provided.
+
+        """
+        valid_args = ['driver_id', 'pickup_datetime', 'dropoff_datetime',
+                      'passenger_count', 'trip_distance', 'fare_amount']
+
+        if len(kwargs.keys()) == 0:
+            raise SakayDBError('No input provided')
+        elif any(x not in valid_args for x in kwargs.keys()):
+            raise SakayDBError('Invalid argument keyword')
+
+        self.check_create_table('trips')
+        predicates = self.parse_search(kwargs)
+        plan = self.plan_search(predicates, use_index=False)
+        sort_keys = [k for k, start, end in predicates
+                     if k != 'pickup_datetime' and k != 'dropoff_datetime']
+
+        files = None
+        if self.partition is not None:
+            bounds = [(start, end) for k, start, end in predicates
+                      if k == 'pickup_datetime']
+            if bounds:
+                files = self.partition_files(*bounds[0])
+
+        def batches():
+            tombstones = self.read_tombstones()
+            offset = 0
+            for chunk in self.iter_sorted_trips(chunksize, files=files):
+                if tombstones:
+                    chunk = chunk[~chunk['trip_id'].isin(tombstones)]
+                if files is None:
+                    chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+                    offset += len(chunk)
+
+                rows = self.search_rows(chunk, plan)
+                if len(rows) == 0:
+                    continue
+
+                batch = chunk.iloc[rows]
+                if files is not None:
+                    batch.index = self.trip_positions(batch['trip_id'])
+                batch = self.widen_table('trips', batch)
+                if sort_keys:
+                    batch = batch.sort_values(by=sort_keys[-1],
+                                              ascending=True, kind='stable')
+                batch['pickup_datetime'] = self.from_epoch(
+                    batch['pickup_datetime'])
+                batch['dropoff_datetime'] = self.from_epoch(
+                    batch['dropoff_datetime'])
+                yield batch
+
+        return batches()
+
+    def parse_search(self, kwargs):
+        """
+        This function checks the keyword arguments of search_trips
+        and converts each of them to a predicate on one column.
+
+        Parameters
+        ----------
+        kwargs : dict
+            Keyword arguments passed to search_trips
+
+        Returns
+        -------
+        List of tuples (column, start, end) in the order of kwargs,
+        where start and end are inclusive bounds or None for an
+        open end. Datetimes are converted to seconds since
+        1970-01-01. An exact datetime does not filter trips, and
+        (None, value) on a datetime keeps trips from value onwards.
+
+        Raises
+        -------
+        SakayDBError
+            For wrong input formats
+
+        """
+        predicates = []
+        for k, v in kwargs.items():
+            if isinstance(v, tuple):
+                inp_check = len(v)
+                if inp_check > 2:
+                    raise SakayDBError('Invalid tuple input')
+                elif v[1] is None:
+                    self.search_input_check(k, v[0])
+                    start, end = v[0], None
+                elif v[0] is None:
+                    self.search_input_check(k, v[1])
+                    start, end = None, v[1]
+                else:
+                    self.search_input_check(k, v[0])
+                    self.search_input_check(k, v[1])
+                    start, end = v[0], v[1]
+            else:
+                self.search_input_check(k, v)
+                start, end = v, v
+
+            if k == 'pickup_datetime' or k == 'dropoff_datetime':
+                if not isinstance(v, tuple):
+                    continue
+                if start is None:
+                    start, end = end, None
+                start, end = [None if x is None else self.to_epoch(x)
+                              for x in [start, end]]
+            predicates.append((k, start, end))
+        return predicates
+
+    def plan_search(self, predicates, use_index=True):
+        """
+        This function orders the predicates of a search from the
+        most to the least selective. Datetime predicates, and any
+        column that already has a sorted index, are counted
+        exactly with sorted_rows; the others are estimated.
+
+        Parameters
+        ----------
+        predicates : list
+            Predicates returned by parse_search
+
+        use_index : bool
+            Whether to count predicates with the sorted indexes of
+            the cached trips table. Defaults to True; when False,
+            every predicate is estimated and the table is not read
+
+        Returns
+        -------
+        List of tuples (estimated rows, column, start, end, rows),
+        where rows holds the matching row positions for indexed
+        columns and is None otherwise
+
+        """
+        if use_index:
+            n = len(self.read_table('trips', copy=False))
+            indexed = self.table_entry('trips')['sorted']
+        else:
+            n = 1
+
+        plan = []
+        for col, start, end in predicates:
+            rows = None
+            if use_index and (col == 'pickup_datetime' or
+                              col == 'dropoff_datetime' or col in indexed):
+                rows = self.sorted_rows(col, start, end)
+                estimate = len(rows)
+            elif start is not None and start == end:
+                estimate = 0.05 * n
+            elif start is not None and end is not None:
+                estimate = 0.25 * n
+            else:
+                estimate = 0.5 * n
+            plan.append((estimate, col, start, end, rows))
+
+        return sorted(plan, key=lambda x: x[0])
+
+    def search_rows(self, df, plan, rows=None):
+        """
+        This function returns the positions of the rows of a trips
+        dataframe that satisfy every predicate of a plan. The first
+        predicate selects the candidate rows, from its index if it
+        has one, and each following predicate only looks at the
+        remaining candidates.
+
+        Parameters
+        ----------
+        df : DataFrame
+            Trips with datetimes as seconds since 1970-01-01
+
+        plan : list
+            Predicates as returned by plan_search; the rows element
+            is only used for the first predicate
+
+        rows : array or None
+            Candidate row positions. Defaults to None, in which
+            case all rows are candidates
+
+        Returns
+        -------
+        Array of row positions in ascending order
+
+        """
+        self.record_io(rows_scanned=len(df))
+
+        def in_range(values, start, end):
+            mask = np.ones(len(values), dtype=bool)
+            if start is not None:
+                mask &= values >= start
+            if end is not None:
+                mask &= values <= end
+            return mask
+
+        for i, (estimate, col, start, end, col_rows) in enumerate(plan):
+            if rows is None and col_rows is not None and i == 0:
+                rows = np.sort(col_rows)
+            elif rows is None:
+                rows = np.flatnonzero(in_range(df[col].to_numpy(),
+                                               start, end))
+            else:
+                values = df[col].to_numpy()[rows]
+                rows = rows[in_range(values, start, end)]
+
+        if rows is None:
+            return np.arange(len(df))
+        return rows
+
+    @instrumented('aggregate')
+    def export_data(self, path_or_buf=None, chunksize=100000):
+        """
+        This method returns a formatted dataframe that
+        is ready for export. If path_or_buf is given, the
+        data is instead written there as CSV, chunk by chunk,
+        without holding the whole table in memory.
+
+        Parameters
+        ----------
+        path_or_buf : str, path object, file-like object or None
+            Where to write the CSV export. Defaults to None, in
+            which case the dataframe is returned
+
+        chunksize : int
+            Number of trips written at a time when path_or_buf is
+            given. Defaults to 100000
+
+        Returns
+        -------
+        None if path_or_buf is given, otherwise a
+        Dataframe with the following columns
+
+            * driver_lastname - str, trip driver last name
+            * driver_givenname - str, trip driver last name
+            * pickup_datetime - str, datetime of pickup formatted
+                                as "hh:mm:ss,DD-MM-YYYY"
+            * dropoff_datetime - str, datetime of dropoff formatted
+                                as "hh:mm:ss,DD-MM-YYYY"
             * passenger_count - int, number of passengers
             * pickup_loc_name - str, zone
-                       (e.g., Pine View, Legazpi Village)
+                                (e.g., Pine View, Legazpi Village)
             * dropoff_loc_name - str, zone
-                       (e.g., Pine View, Legazpi Village)
+                                (e.g., Pine View, Legazpi Village)
             * trip_distance - float, distance in meters
             * fare_amount - float, fare amount
 
+        """
+        self.check_create_table('drivers')
+        self.check_create_table('locations')
+        self.check_create_table('trips')
+
+        if path_or_buf is not None:
+            self.write_export(path_or_buf, chunksize)
+            return None
+
+        drivers = self.read_table('drivers')
+        locations = self.read_table('locations')
+        trips = self.read_table('trips')
+        self.record_io(rows_scanned=len(trips))
+
+        for col in ['last_name', 'given_name']:
+            drivers[col] = drivers[col].astype('object').str.capitalize()
+        drivers = self.compact_table('drivers', drivers)
+
+        trips = trips.merge(locations, left_on='pickup_loc_id',
+                            right_on='location_id', how="left")
+
+        trips.rename(columns={'loc_name': 'pickup_loc_name'}, inplace=True)
+
+        trips = trips.merge(locations, left_on='dropoff_loc_id',
+                            right_on='location_id', how="left")
+
+        trips.rename(columns={'loc_name': 'dropoff_loc_name'}, inplace=True)
+
+        merged_df = trips.merge(drivers, left_on='driver_id',
+                                right_on='driver_id', how="outer")
+        merged_df = merged_df[merged_df['trip_id'].notnull()]
+
+        merged_df = merged_df.sort_values(by='trip_id')
+        merged_df['pickup_datetime'] = self.from_epoch(
+            merged_df['pickup_datetime'])
+        merged_df['dropoff_datetime'] = self.from_epoch(
+            merged_df['dropoff_datetime'])
+        merged_df.rename(columns={'given_name': 'driver_givenname',
+                                  'last_name': 'driver_lastname'}, inplace=True)
+
+        merged_df['passenger_count'] = merged_df['passenger_count'].astype(
+            'int64')
+        merged_df['trip_distance'] = merged_df['trip_distance'].astype(
+            'float64')
+        merged_df['fare_amount'] = merged_df['fare_amount'].astype('float64')
+
+        merged_df = merged_df.sort_values(by='trip_id',
+                                          ascending=True)
+
+        df_export = merged_df[EXPORT_COLUMNS].astype({
+            'driver_lastname': 'object', 'driver_givenname': 'object',
+            'pickup_loc_name': 'object', 'dropoff_loc_name': 'object'})
+
+        return df_export
+
+    def write_export(self, path_or_buf, chunksize):
+        """
+        This function writes the rows of export_data as CSV, reading
+        the trips table in chunks and looking up driver and location
+        names in maps held in memory. Trips are written in trip_id
+        order, merging the partitions of partitioned trips.
+
+        Parameters
+        ----------
+        path_or_buf : str, path object or file-like object
+            Where to write the CSV export
+
+        chunksize : int
+            Number of trips written at a time
+
+        """
+        drivers = self.read_table('drivers')
+        drivers = drivers[~drivers['driver_id'].duplicated()]
+        last_names = pd.Series(drivers['last_name'].str.capitalize().values,
+                               index=drivers['driver_id'].values)
+        given_names = pd.Series(
+            drivers['given_name'].str.capitalize().values,
+            index=drivers['driver_id'].values)
+
+        locations = self.read_table('locations')
+        locations = locations[~locations['location_id'].duplicated()]
+        loc_names = pd.Series(locations['loc_name'].values,
+                              index=locations['location_id'].values)
+
+        if hasattr(path_or_buf, 'write'):
+            buf = path_or_buf
+        else:
+            buf = open(path_or_buf, 'w', encoding='utf-8', newline='')
+
+        try:
+            header = True
+            tombstones = self.read_tombstones()
+            for trips in self.iter_sorted_trips(chunksize):
+                self.record_io(rows_scanned=len(trips))
+                if tombstones:
+                    trips = trips[~trips['trip_id'].isin(tombstones)]
+                if len(trips) == 0:
+                    continue
+
+                chunk = pd.DataFrame({
+                    'driver_lastname': trips['driver_id'].map(last_names),
+                    'driver_givenname': trips['driver_id'].map(given_names),
+                    'pickup_datetime': self.from_epoch(
+                        trips['pickup_datetime']),
+                    'dropoff_datetime': self.from_epoch(
+                        trips['dropoff_datetime']),
+                    'passenger_count': trips['passenger_count'].astype(
+                        'int64'),
+                    'pickup_loc_name': trips['pickup_loc_id'].map(loc_names),
+                    'dropoff_loc_name': trips['dropoff_loc_id'].map(
+                        loc_names),
+                    'trip_distance': trips['trip_distance'].astype(
+                        'float64'),
+                    'fare_amount': trips['fare_amount'].astype('float64'),
+                })
+                with self.record_phase('write'):
+                    text = chunk.to_csv(header=header, index=False)
+                    buf.write(text)
+                header = False
+                self.record_io(rows_returned=len(chunk),
+                               bytes_written=len(text))
+
+            if header:
+                pd.DataFrame(columns=EXPORT_COLUMNS).to_csv(buf, index=False)
+        finally:
+            if buf is not path_or_buf:
+                buf.close()
+
+    @staticmethod
+    def count_trips(df, days=None):
+        """
+        This function counts trips per pickup date, per pickup
+        date and passenger count, and per pickup date and driver.
+        Dates are kept as days since 1970-01-01.
+
+        Parameters
+        ----------
+        df : DataFrame
+            Rows of the trips table
+
+        days : ndarray or None
+            Pickup date of each row, in days since 1970-01-01.
+            Defaults to None, in which case it is computed from
+            pickup_datetime in seconds
+
+        Returns
+        -------
+        Dictionary with the stats of STAT_COLUMNS as keys, and as
+        values dictionaries with the number of trips per day for
+        trip, or per (day, passenger_count) and (day, driver_id)
+
+        """
+        if days is None:
+            days = df['pickup_datetime'].to_numpy(dtype='int64') // 86400
+        counts = dict()
+        for name, col in STAT_COLUMNS.items():
+            if col is None:
+                size = pd.Series(days).value_counts(sort=False)
+            else:
+                size = pd.DataFrame({
+                    'day': days,
+                    col: df[col].to_numpy(dtype='int64')
+                }).groupby(['day', col], sort=False).size()
+            counts[name] = dict(zip(size.index.tolist(), size.tolist()))
+        return counts
+
+    @staticmethod
+    def first_trips(df, col):
+        """
+        This function finds the first trip, by trip_id, of each
+        value of a column of the trips table.
+
+        Parameters
+        ----------
+        df : DataFrame
+            Rows of the trips table
+
+        col : str
+            Either passenger_count or driver_id
+
+        Returns
+        -------
+        Dictionary with the column value as key and trip_id as value
+
+        """
+        first = df.groupby(col, sort=False)['trip_id'].min()
+        return {int(key): int(trip_id) for key, trip_id in first.items()}
+
+    @staticmethod
+    def stats_partition(trip_id, days, passenger_count, driver_id):
+        """
+        This function computes the trip counts of trip_stats for
+        part of the trips table. It runs in the worker processes,
+        so it takes the columns it needs as arrays.
+
+        Parameters
+        ----------
+        trip_id, passenger_count, driver_id : ndarray
+            Columns of the rows of the trips table
+
+        days : ndarray
+            Pickup date of each row, in days since 1970-01-01
+
+        Returns
+        -------
+        Tuple of the results of count_trips, and of first_trips by
+        passenger_count and by driver_id
+
+        """
+        df = pd.DataFrame({'trip_id': trip_id,
+                           'passenger_count': passenger_count,
+                           'driver_id': driver_id})
+        return (SakayDB.count_trips(df, days),
+                SakayDB.first_trips(df, 'passenger_count'),
+                SakayDB.first_trips(df, 'driver_id'))
+
+    def day_partitions(self, days):
+        """
+        This function splits trips into one part per worker, each
+        with a contiguous range of pickup days and about the same
+        number of trips. The ranges cover all days from the first
+        to the last, without overlapping.
+
+        Parameters
+        ----------
+        days : ndarray
+            Pickup day of each trip, in days since 1970-01-01
+
+        Returns
+        -------
+        List of tuples of the first day and last day of each part,
+        and the positions in days of its trips
+
+        """
+        first_day, last_day = int(days.min()), int(days.max())
+        if self.workers <= 1:
+            return [(first_day, last_day, np.arange(len(days)))]
+
+        bounds = np.quantile(days, np.linspace(0, 1, self.workers + 1)[1:-1])
+        bounds = np.unique(bounds.astype('int64'))
+        bounds = bounds[(bounds > first_day) & (bounds <= last_day)]
+
+        part = np.searchsorted(bounds, days, side='right')
+        order = np.argsort(part, kind='stable')
+        positions = np.split(order, np.searchsorted(
+            part[order], np.arange(1, len(bounds) + 1)))
+
+        edges = [first_day] + [int(x) for x in bounds] + [last_day + 1]
+        return [(edges[k], edges[k + 1] - 1, pos)
+                for k, pos in enumerate(positions)]
+
+    def map_workers(self, func, *iterables):
+        """
+        This function applies func to each set of arguments, in the
+        pool of worker processes if workers is above 1. The pool is
+        started on first use with the forkserver start method, or
+        spawn where it is not available, so the workers do not
+        inherit the locks and caches of the caller.
+
+        Parameters
+        ----------
+        func : function
+            Function to apply, defined at module level or as a
+            static method so it can be sent to the processes
+
+        *iterables
+            Arguments of func, as in map
+
+        Returns
+        -------
+        List of results, in order
+
+        """
+        if self.workers <= 1 or len(iterables[0]) <= 1:
+            return list(map(func, *iterables))
+        if self.pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            method = 'forkserver' if 'forkserver' in methods else 'spawn'
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(method))
+        return list(self.pool.map(func, *iterables))
+
+    def partition_stats(self, df):
+        """
+        This function computes the trip counts of trip_stats for
+        the whole trips table, by pickup date range in parallel.
+        Only the columns counted are sent to the workers. Since the
+        ranges do not overlap, the counts of the parts are merged
+        exactly.
+
+        Parameters
+        ----------
+        df : DataFrame
+            Live rows of the trips table
+
+        Returns
+        -------
+        Tuple of the results of count_trips, and of first_trips by
+        passenger_count and by driver_id
+
+        """
+        self.record_io(rows_scanned=len(df))
+        columns = [df['trip_id'].to_numpy(),
+                   df['pickup_datetime'].to_numpy(dtype='int64') // 86400,
+                   df['passenger_count'].to_numpy(),
+                   df['driver_id'].to_numpy()]
+        if len(df) == 0:
+            return self.stats_partition(*columns)
+
+        parts = self.day_partitions(columns[1])
+        results = self.map_workers(
+            self.stats_partition,
+            *[[col[pos] for _, _, pos in parts] for col in columns])
+
+        counts = {name: dict() for name in STAT_COLUMNS}
+        first_passenger, first_driver = dict(), dict()
+        for part_counts, part_passenger, part_driver in results:
+            for name, part in part_counts.items():
+                counts[name].update(part)
+            for first, part in [(first_passenger, part_passenger),
+                                (first_driver, part_driver)]:
+                for key, trip_id in part.items():
+                    first[key] = min(first.get(key, trip_id), trip_id)
+        return counts, first_passenger, first_driver
+
+    def trip_stats(self):
+        """
+        This function returns the trip counts of the trips table,
+        from stats_cache, from trips.stats, or counted from the
+        table itself when neither matches the table on disk.
+
+        Returns
+        -------
+        Dictionary with the following keys
+
+            * signature - table_signature of trips when counted
+            * counts - result of count_trips
+            * weekly - totals of counts per day name, see
+                       add_counts
+            * first_passenger - result of first_trips by
+                                passenger_count, or None if stale
+            * first_driver - result of first_trips by driver_id,
+                             or None if stale
+
+        """
+        signature = self.table_signature('trips')
+        stats = self.stats_cache
+        if stats is None or stats['signature'] != signature:
+            stats = self.load_stats()
+
+        if stats is None or stats['signature'] != signature:
+            counts, first_passenger, first_driver = self.partition_stats(
+                self.read_table('trips', copy=False))
+            stats = self.new_stats(signature, counts)
+            stats['first_passenger'] = first_passenger
+            stats['first_driver'] = first_driver
+            self.stats_cache = stats
+            self.save_stats()
+
+        if stats['first_passenger'] is None or stats['first_driver'] is None:
+            df = self.read_table('trips', copy=False,
+                                 columns=['trip_id', 'passenger_count',
+                                          'driver_id'])
+            stats['first_passenger'] = self.first_trips(df,
+                                                        'passenger_count')
+            stats['first_driver'] = self.first_trips(df, 'driver_id')
+            self.save_stats()
+
+        return stats
+
+    @staticmethod
+    def new_stats(signature, counts):
+        """
+        This function builds the trip counts of trip_stats from the
+        result of count_trips, with first_passenger and
+        first_driver left stale.
+
+        Parameters
+        ----------
+        signature : tuple
+            table_signature of trips when counted
+
+        counts : dict
+            Result of count_trips
+
+        Returns
+        -------
+        Dictionary, see trip_stats
+
+        """
+        stats = {
+            'signature': signature,
+            'counts': {name: dict() for name in STAT_COLUMNS},
+            'weekly': {name: dict() for name in STAT_COLUMNS},
+            'first_passenger': None,
+            'first_driver': None
+        }
+        SakayDB.add_counts(stats, counts)
+        return stats
+
+    @staticmethod
+    def add_counts(stats, changes):
+        """
+        This function adds changes in trip counts to the counts of
+        trip_stats, and keeps the totals of the counts per day name
+        in sync. For each stat, the weekly totals hold the number of
+        trips and of dates with at least one trip, per day name for
+        trip, or per passenger_count or driver_id and day name.
+
+        Parameters
+        ----------
+        stats : dict
+            Trip counts, see trip_stats, which are updated in place
+
+        changes : dict
+            Result of count_trips, with the counts negated for
+            deleted trips
 
         Returns
         -------
-        List of trip ids successfully added to the database
-
+        None
 
-        Prints
-        -------
-        Warning
-             If a trip is already in the database or if
-             a trip has invalid or incomplete information.
-             Note: Both of these cases are skipped.
+        """
+        for name, change in changes.items():
+            counts = stats['counts'][name]
+            weekly = stats['weekly'][name]
+            for key, n in change.items():
+                old = counts.get(key, 0)
+                new = max(old + n, 0)
+                if new > 0:
+                    counts[key] = new
+                else:
+                    counts.pop(key, None)
 
+                if STAT_COLUMNS[name] is None:
+                    day, totals = key, weekly
+                else:
+                    day, value = key
+                    totals = weekly.setdefault(value, dict())
+                weekday = (day + 3) % 7
+                total = totals.setdefault(weekday, [0, 0])
+                total[0] += new - old
+                total[1] += (new > 0) - (old > 0)
+                if total[1] == 0:
+                    del totals[weekday]
+                    if not totals and totals is not weekly:
+                        del weekly[value]
+
+    @staticmethod
+    def dump_counts(counts):
         """
-        trip_ids = []
-        for i, row in enumerate(trips_list):
-            try:
-                driver = row['driver']
-                pickup_datetime = row['pickup_datetime']
-                dropoff_datetime = row['dropoff_datetime']
-                passenger_count = row['passenger_count']
-                pickup_loc_name = row['pickup_loc_name']
-                dropoff_loc_name = row['dropoff_loc_name']
-                trip_distance = row['trip_distance']
-                fare_amount = row['fare_amount']
-
-                try:
-                    trip_id = self.add_trip(driver, pickup_datetime, dropoff_datetime, passenger_count,
-                                            pickup_loc_name, dropoff_loc_name, trip_distance, fare_amount)
-                    trip_ids.append(trip_id)
-                except:
-                    print(
-                        f'Warning: trip index {i} is already in the database. Skipping...'
-                    )
+        This function converts trip counts to lists for JSON.
 
-            except:
-                print(
-                    f'Warning: trip index {i} has invalid or incomplete information. Skipping...'
-                )
+        Parameters
+        ----------
+        counts : dict
+            Result of count_trips
 
-        return trip_ids
+        Returns
+        -------
+        Dictionary with the stats as keys and lists of [day, count]
+        for trip, or of [day, value, count], as values
 
-    def delete_trip(self, tr_id):
         """
-        This method accepts a trip id to delete then removes
-        it from the trips database. 
+        data = dict()
+        for name, change in counts.items():
+            if STAT_COLUMNS[name] is None:
+                data[name] = [[day, n] for day, n in change.items()]
+            else:
+                data[name] = [[day, value, n]
+                              for (day, value), n in change.items()]
+        return data
+
+    @staticmethod
+    def parse_counts(data):
+        """
+        This function converts trip counts read from JSON back into
+        the dictionaries of count_trips.
 
         Parameters
         ----------
-        tr_id : int
-            Trip id to delete from the database
+        data : dict
+            Trip counts as written by dump_counts
 
-        Raises
+        Returns
         -------
-        SakayDBError
-            If the trip_id is not found
+        Dictionary, see count_trips
 
         """
-        try:
-            fn = f'{self.data_dir}/trips.csv'
-            df_trips = pd.read_csv(fn)
-        except Exception as e:
-            raise SakayDBError(f'{e}')
+        return {name: {(row[0] if len(row) == 2 else (row[0], row[1])):
+                       row[-1] for row in rows}
+                for name, rows in data.items()}
 
-        tr_id_check = df_trips.loc[df_trips['trip_id'] == tr_id, :]
+    def load_stats(self):
+        """
+        This function reads trips.stats into stats_cache, and
+        applies the changes logged to trips.stats.log since, see
+        log_stats.
 
-        if len(tr_id_check) == 0:
-            raise SakayDBError(f'trip_id cannot be found')
-        else:
-            df_trips = df_trips.loc[df_trips['trip_id'] != tr_id, :]
-            df_trips.to_csv(fn, encoding='utf-8', index=False)
+        Returns
+        -------
+        The loaded stats, or None if trips.stats is missing or
+        cannot be read
 
-    def search_input_check(self, k, v):
         """
-        This function is used to check the inputs of the
-        search_trips function.
+        fn = f'{self.data_dir}/trips.stats'
+        try:
+            with self.record_phase('read'), open(fn, encoding='utf-8') as f:
+                text = f.read()
+                self.record_io(bytes_read=len(text))
+                data = json.loads(text)
+
+            stats = self.new_stats(self.stats_signature(data['signature']),
+                                   self.parse_counts(data['counts']))
+            if data['first_passenger'] is not None:
+                stats['first_passenger'] = dict(data['first_passenger'])
+                stats['first_driver'] = dict(data['first_driver'])
+
+            if os.path.exists(f'{fn}.log'):
+                with self.record_phase('read'), \
+                        open(f'{fn}.log', encoding='utf-8') as f:
+                    lines = f.read().splitlines()
+                    self.record_io(bytes_read=sum(map(len, lines)))
+                for line in lines:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    if (self.stats_signature(record['signature']) ==
+                            stats['signature']):
+                        self.apply_stats(stats, record)
+            self.stats_cache = stats
+        except (OSError, ValueError, KeyError, TypeError):
+            self.stats_cache = None
+        return self.stats_cache
+
+    def stats_signature(self, data):
+        """
+        This function converts a table_signature read from JSON
+        back into tuples, with the paths of the files, which are
+        stored relative to data_dir, in data_dir.
 
         Parameters
         ----------
-        k : str
-            Variable to check format for;
-            Expects either driver_id, passenger_count, pickup
-            or dropoff datetime, trip_distance, fare_amount
-
-        v : str, int, or float
-            Corresponding value of specified variable for
-            format checking
+        data : list
+            Signature as written to trips.stats
 
-        Raises
+        Returns
         -------
-        SakayDBError
-            If expected format is not followed
+        Tuple
 
         """
-        if k == 'driver_id' or k == 'passenger_count':
-            if isinstance(v, int):
-                pass
-            else:
-                raise SakayDBError(f'{k} must be an integer')
-        elif k == 'pickup_datetime' or k == 'dropoff_datetime':
-            try:
-                datetime_check = pd.to_datetime(v, format='%H:%M:%S,%d-%m-%Y')
-            except Exception as e:
-                raise SakayDBError(f'Wrong input format: {e}')
-        elif k == 'trip_distance' or k == 'fare_amount':
-            if isinstance(v, int) or isinstance(v, float):
-                pass
-            else:
-                raise SakayDBError(f'{k} must be a number')
+        return tuple((f'{self.data_dir}/{fn}',
+                      None if sig is None else tuple(sig))
+                     for fn, sig in data)
 
-    def search_trips(self, **kwargs):
+    def relative_signature(self, signature):
         """
-        This method looks for specific trips in the database
-        that matches the specified criteria. This accepts
-        keyworded arguments.
-
+        This function converts a table_signature for trips.stats,
+        with the paths of the files relative to data_dir, so that
+        the stats still match when data_dir is moved or is opened
+        through another path.
 
         Parameters
         ----------
-        driver_id : int or tuple
-            Driver id
+        signature : tuple
+            Result of table_signature
 
-        pickup_datetime : str or tuple
-            Datetime of pickup formatted as
-            "hh:mm:ss,DD-MM-YYYY"
+        Returns
+        -------
+        List of [path, file signature]
 
-        dropoff_datetime : str or tuple
-            Datetime of dropoff formatted as
-            "hh:mm:ss,DD-MM-YYYY"
+        """
+        start = len(self.data_dir) + 1
+        return [[fn[start:], sig] for fn, sig in signature]
 
-        passenger_count : int or tuple
-            Number of passengers as integer
+    def apply_stats(self, stats, record):
+        """
+        This function applies a change logged by log_stats to trip
+        counts read from trips.stats.
 
-        trip_distance : float or tuple
-            Distance in meters
+        Parameters
+        ----------
+        stats : dict
+            Trip counts, see trip_stats, which are updated in place
 
-        fare_amount : float or tuple
-            fare amount
+        record : dict
+            Logged change
 
+        Returns
+        -------
+        None
 
-        Note: Tuple inputs can follow any of the
-        following cases
+        """
+        self.add_counts(stats, self.parse_counts(record['counts']))
 
-        * Case 1: tuple like (value,None) - returns all
-                  entries from value (end inclusive)
-                  
-        * Case 2: tuple like (None,value) returns all
-                  entries up to value (end inclusive)
-                  
-        * Case 3: tuple like (value1,value2) returns values
-                  between value1 and value2 (end inclusive)
+        for name in ['first_passenger', 'first_driver']:
+            if record[name] is None:
+                stats[name] = None
+            elif stats[name] is not None:
+                stats[name].update(record[name])
+
+        stats['signature'] = self.stats_signature(record['next'])
 
+    def save_stats(self):
+        """
+        This function writes stats_cache to trips.stats. The file
+        is written next to the old one and then swapped in, and
+        trips.stats.log is cleared. The trips table is locked while
+        the file is written, and stats_cache is only written if it
+        still matches the table, since trips.stats is also saved
+        by reads.
 
         Returns
         -------
-        Dataframe with all the entries aligned with
-        search key and values
+        None
 
+        """
+        fn = f'{self.data_dir}/trips.stats'
+        with self.table_lock('trips'):
+            stats = self.stats_cache
+            if (stats is None or
+                    stats['signature'] != self.table_signature('trips')):
+                return
 
-        Raises
+            data = {
+                'signature': self.relative_signature(stats['signature']),
+                'counts': self.dump_counts(stats['counts']),
+                'first_passenger': list(
+                    (stats['first_passenger'] or {}).items()),
+                'first_driver': list((stats['first_driver'] or {}).items())
+            }
+            if (stats['first_passenger'] is None or
+                    stats['first_driver'] is None):
+                data['first_passenger'] = data['first_driver'] = None
+
+            with self.record_phase('write'), \
+                    open(f'{fn}.tmp', mode='w', encoding='utf-8') as f:
+                text = json.dumps(data, separators=(',', ':'))
+                f.write(text)
+                self.record_io(bytes_written=len(text))
+            os.replace(f'{fn}.tmp', fn)
+            if os.path.exists(f'{fn}.log'):
+                os.remove(f'{fn}.log')
+
+    def log_stats(self, record):
+        """
+        This function appends the change made to stats_cache by a
+        write to trips.stats.log, so that a write does not have to
+        rewrite trips.stats. The log is folded into trips.stats by
+        save_stats once it is larger than trips.stats.
+
+        Parameters
+        ----------
+        record : dict
+            Change to log, with the following keys
+
+            * signature - table_signature of trips before the write,
+                          see relative_signature
+            * next - table_signature of trips after the write
+            * counts - changes in the counts of count_trips, see
+                       dump_counts
+            * first_passenger, first_driver - list of [key,
+                       trip_id] to update, or None if stale
+
+        Returns
         -------
-        SakayDBError
-            For invalid keyword arguments, wrong input
-            formats, and when no input is provided.
+        None
 
         """
-        valid_args = ['driver_id', 'pickup_datetime', 'dropoff_datetime',
-                      'passenger_count', 'trip_distance', 'fare_amount']
+        fn = f'{self.data_dir}/trips.stats'
+        if not os.path.exists(fn):
+            self.save_stats()
+            return
 
-        if len(kwargs.keys()) == 0:
-            raise SakayDBError('No input provided')
-        elif any(x not in valid_args for x in kwargs.keys()):
-            raise SakayDBError('Invalid argument keyword')
-        else:
-            fn = f'{self.data_dir}/trips.csv'
-            cols = ['trip_id', 'driver_id', 'pickup_datetime',
-                    'dropoff_datetime', 'passenger_count', 'pickup_loc_id',
-                    'dropoff_loc_id', 'trip_distance', 'fare_amount']
-
-            self.check_create_file(fn, cols)
-            df_trips = pd.read_csv(fn)
-
-            if len(df_trips) == 0:
-                return []
-
-            df_trips['pickup_datetime'] = pd.to_datetime(
-                df_trips['pickup_datetime'], format='%H:%M:%S,%d-%m-%Y')
-            df_trips['dropoff_datetime'] = pd.to_datetime(
-                df_trips['dropoff_datetime'], format='%H:%M:%S,%d-%m-%Y')
-
-            for k, v in kwargs.items():
-                if isinstance(v, tuple):
-                    inp_check = len(v)
-                    if inp_check > 2:
-                        raise SakayDBError('Invalid tuple input')
-                    else:
-                        if v[1] is None:
-                            self.search_input_check(k, v[0])
-                            if k == 'pickup_datetime' or k == 'dropoff_datetime':
-                                v_0 = pd.to_datetime(
-                                    v[0], format='%H:%M:%S,%d-%m-%Y')
-                                df_trips = df_trips[df_trips[k] >= v_0]
-                            else:
-                                df_trips = df_trips[df_trips[k] >= v[0]]
-                                df_trips = df_trips.sort_values(
-                                    by=k, ascending=True)
-
-                        elif v[0] is None:
-                            self.search_input_check(k, v[1])
-                            if k == 'pickup_datetime' or k == 'dropoff_datetime':
-                                v_1 = pd.to_datetime(
-                                    v[1], format='%H:%M:%S,%d-%m-%Y')
-                                df_trips = df_trips[df_trips[k] >= v_1]
-                            else:
-                                df_trips = df_trips[df_trips[k] <= v[1]]
-                                df_trips = df_trips.sort_values(
-                                    by=k, ascending=True)
-
-                        elif v[0] is not None and v[1] is not None:
-                            self.search_input_check(k, v[0])
-                            self.search_input_check(k, v[1])
-                            if k == 'pickup_datetime' or k == 'dropoff_datetime':
-                                v_0 = pd.to_datetime(
-                                    v[0], format='%H:%M:%S,%d-%m-%Y')
-                                v_1 = pd.to_datetime(
-                                    v[1], format='%H:%M:%S,%d-%m-%Y')
-                                df_trips = df_trips[(df_trips[k] >= v_0) & (
-                                    df_trips[k] <= v_1)]
-                            else:
-                                df_trips = df_trips[(df_trips[k] >= v[0]) & (
-                                    df_trips[k] <= v[1])]
-                                df_trips = df_trips.sort_values(
-                                    by=k, ascending=True)
+        with self.record_phase('write'), \
+                open(f'{fn}.log', mode='a', encoding='utf-8') as f:
+            text = json.dumps(record, separators=(',', ':')) + '\n'
+            f.write(text)
+            self.record_io(bytes_written=len(text))
 
-                else:
-                    self.search_input_check(k, v)
-                    if k == 'pickup_datetime' or k == 'dropoff_datetime':
-                        v = pd.to_datetime(v, format='%H:%M:%S,%d-%m-%Y')
-                    else:
-                        df_trips = df_trips[df_trips[k] == v]
-                        df_trips = df_trips.sort_values(by=k, ascending=True)
+        if os.path.getsize(f'{fn}.log') > os.path.getsize(fn):
+            self.save_stats()
 
-            df_trips['pickup_datetime'] = df_trips['pickup_datetime']\
-                .dt.strftime('%H:%M:%S,%d-%m-%Y')
-            df_trips['dropoff_datetime'] = df_trips['dropoff_datetime']\
-                .dt.strftime('%H:%M:%S,%d-%m-%Y')
+    def update_stats(self, df, sign, signature):
+        """
+        This function adds trips to, or removes them from, the trip
+        counts after a write to the trips table. The counts are only
+        updated if they matched the table before the write; they are
+        otherwise counted again by the next trip_stats.
 
-            return df_trips
+        Parameters
+        ----------
+        df : DataFrame
+            Rows of the trips table that were written
 
-    def export_data(self):
-        """
-        This method returns a formatted dataframe that
-        is ready for export.
+        sign : int
+            1 if the rows were added, -1 if they were deleted
+
+        signature : tuple
+            table_signature of trips before the write
 
         Returns
         -------
-        Dataframe with the following columns
-
-            * driver_lastname - str, trip driver last name
-            * driver_givenname - str, trip driver last name
-            * pickup_datetime - str, datetime of pickup formatted
-                                as "hh:mm:ss,DD-MM-YYYY"
-            * dropoff_datetime - str, datetime of dropoff formatted
-                                as "hh:mm:ss,DD-MM-YYYY"
-            * passenger_count - int, number of passengers
-            * pickup_loc_name - str, zone
-                                (e.g., Pine View, Legazpi Village)
-            * dropoff_loc_name - str, zone
-                                (e.g., Pine View, Legazpi Village)
-            * trip_distance - float, distance in meters
-            * fare_amount - float, fare amount
+        None
 
         """
-        dr_fn = f'{self.data_dir}/drivers.csv'
-        loc_fn = f'{self.data_dir}/locations.csv'
-        tr_fn = f'{self.data_dir}/trips.csv'
+        stats = self.stats_cache
+        if stats is None or stats['signature'] != signature:
+            stats = self.load_stats()
+        if stats is None or stats['signature'] != signature:
+            self.stats_cache = None
+            return
+
+        changes = self.count_trips(df)
+        if sign < 0:
+            changes = {name: {key: -n for key, n in change.items()}
+                       for name, change in changes.items()}
+        self.add_counts(stats, changes)
+        record = {'signature': self.relative_signature(signature),
+                  'counts': self.dump_counts(changes)}
+
+        for col, name in [('passenger_count', 'first_passenger'),
+                          ('driver_id', 'first_driver')]:
+            first = stats[name]
+            record[name] = None
+            if first is None:
+                continue
+            record[name] = []
+            for key, trip_id in self.first_trips(df, col).items():
+                if sign > 0 and first.get(key, trip_id) >= trip_id:
+                    first[key] = trip_id
+                    record[name].append([key, trip_id])
+                elif sign < 0 and first.get(key) == trip_id:
+                    stats[name] = record[name] = None
+                    break
+
+        stats['signature'] = self.table_signature('trips')
+        record['next'] = self.relative_signature(stats['signature'])
+        self.log_stats(record)
+
+    def carry_stats(self, signature):
+        """
+        This function keeps the trip counts, and the OD counts,
+        after the trips table is rewritten with the same live trips,
+        e.g., by compact.
 
-        dr_cols = ['driver_id', 'given_name', 'last_name']
-        loc_cols = ['location_id', 'loc_name']
-        tr_cols = ['trip_id', 'driver_id', 'pickup_datetime',
-                   'dropoff_datetime', 'passenger_count', 'pickup_loc_id',
-                   'dropoff_loc_id', 'trip_distance', 'fare_amount']
+        Parameters
+        ----------
+        signature : tuple
+            table_signature of trips before it was rewritten
 
-        self.check_create_file(dr_fn, dr_cols)
-        self.check_create_file(loc_fn, loc_cols)
-        self.check_create_file(tr_fn, tr_cols)
+        Returns
+        -------
+        None
 
-        drivers = pd.read_csv(dr_fn)
-        locations = pd.read_csv(loc_fn)
-        trips = pd.read_csv(tr_fn)
+        """
+        stats = self.stats_cache
+        if stats is not None and stats['signature'] == signature:
+            stats['signature'] = self.table_signature('trips')
+            self.save_stats()
 
-        drivers['last_name'] = drivers['last_name'].str.capitalize()
-        drivers['given_name'] = drivers['given_name'].str.capitalize()
+        store = self.od_cache
+        if store is not None and store['signature'] == signature:
+            store['signature'] = self.table_signature('trips')
 
-        trips = trips.merge(locations, left_on='pickup_loc_id',
-                            right_on='location_id', how="left")
+    def pickup_days(self, df_trips):
+        """
+        This function returns the pickup dates of trips as days
+        since 1970-01-01.
 
-        trips.rename(columns={'loc_name': 'pickup_loc_name'}, inplace=True)
+        Parameters
+        ----------
+        df_trips : DataFrame
+            Trips database, with pickup_datetime either in seconds
+            since 1970-01-01 or as datetime64
 
-        trips = trips.merge(locations, left_on='dropoff_loc_id',
-                            right_on='location_id', how="left")
+        Returns
+        -------
+        Series
 
-        trips.rename(columns={'loc_name': 'dropoff_loc_name'}, inplace=True)
+        """
+        pickup = df_trips['pickup_datetime']
+        if pd.api.types.is_datetime64_any_dtype(pickup):
+            pickup = (pickup - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+        return pickup // 86400
 
-        merged_df = trips.merge(drivers, left_on='driver_id',
-                                right_on='driver_id', how="outer")
+    def frame_stats(self, df_trips):
+        """
+        This function computes the trip counts of trip_stats for a
+        trips DataFrame instead of the trips table, for stat_trips,
+        stat_passenger and stat_driver. Passenger counts and
+        drivers are ordered by their first row in df_trips.
 
-        merged_df = merged_df.sort_values(by='trip_id')
-        merged_df.rename(columns={'given_name': 'driver_givenname',
-                                  'last_name': 'driver_lastname'}, inplace=True)
+        Parameters
+        ----------
+        df_trips : DataFrame
+            Trips database
 
-        merged_df['passenger_count'] = merged_df['passenger_count'].astype(
-            'int64')
-        merged_df['trip_distance'] = merged_df['trip_distance'].astype(
-            'float64')
-        merged_df['fare_amount'] = merged_df['fare_amount'].astype('float64')
+        Returns
+        -------
+        Dictionary, see trip_stats
 
-        merged_df = merged_df.sort_values(by='trip_id',
-                                          ascending=True)
+        """
+        days = self.pickup_days(df_trips).to_numpy(dtype='int64')
+        stats = self.new_stats(None, self.count_trips(df_trips, days))
+        for col, name in [('passenger_count', 'first_passenger'),
+                          ('driver_id', 'first_driver')]:
+            values = pd.unique(df_trips[col].to_numpy(dtype='int64'))
+            stats[name] = {int(value): k for k, value in enumerate(values)}
+        return stats
+
+    @staticmethod
+    def weekday_averages(totals):
+        """
+        This function averages trip counts per day name, over the
+        dates with at least one trip.
+
+        Parameters
+        ----------
+        totals : dict
+            Weekly totals of a stat, see add_counts, with the day
+            name as key, Monday being 0, and the number of trips and
+            of dates as value
 
-        df_export = merged_df[['driver_lastname', 'driver_givenname', 'pickup_datetime',
-                               'dropoff_datetime', 'passenger_count', 'pickup_loc_name',
-                               'dropoff_loc_name', 'trip_distance', 'fare_amount']].copy()
+        Returns
+        -------
+        Dictionary with day name as key and average as value
 
-        return df_export
+        """
+        return {DAY_NAMES[weekday]: trips / days
+                for weekday, (trips, days) in sorted(totals.items())}
 
     def stat_trips(self, df_trips):
         """
@@ -720,26 +4200,8 @@ class SakayDB():
         Dictionary
 
         """
-        df_trips['pickup_datetime'] = pd.to_datetime(df_trips['pickup_datetime'],
-                                                     format='%H:%M:%S,%d-%m-%Y')
-
-        df_trips['pickup_date'] = df_trips['pickup_datetime']\
-            .dt.strftime('%Y-%m-%d')
-
-        df_trips['day_of_week'] = df_trips['pickup_datetime'].dt.day_name()
-        daily_trips = df_trips.groupby(['pickup_date'], as_index=False)\
-            .agg({'trip_id': 'count', 'day_of_week': 'first'})
-
-        per_day_df = daily_trips.groupby('day_of_week', as_index=False).mean()
-        per_day_df['day_of_week'] = pd.Categorical(
-            values=per_day_df['day_of_week'],
-            categories=['Monday', 'Tuesday', 'Wednesday',
-                        'Thursday', 'Friday', 'Saturday', 'Sunday'])
-
-        per_day_df.set_index('day_of_week',  inplace=True)
-        per_day_df = per_day_df.sort_values(by='day_of_week', ascending=True)
-        per_day_dict = per_day_df.to_dict()
-        return per_day_dict['trip_id']
+        stats = self.frame_stats(df_trips)
+        return self.weekday_averages(stats['weekly']['trip'])
 
     def stat_passenger(self, df_trips):
         """
@@ -762,12 +4224,7 @@ class SakayDB():
         Dictionary
 
         """
-        pass_dict = dict()
-        for val in df_trips['passenger_count'].unique():
-            df_trips_loop = df_trips[df_trips['passenger_count'] == val].copy()
-            pass_val = self.stat_trips(df_trips_loop)
-            pass_dict[val] = pass_val
-        return pass_dict
+        return self.stat_passenger_counts(self.frame_stats(df_trips))
 
     def stat_driver(self, df_trips):
         """
@@ -790,24 +4247,10 @@ class SakayDB():
         Dictionary
 
         """
-        fn = f'{self.data_dir}/drivers.csv'
-        cols = ['driver_id', 'given_name', 'last_name']
-
-        self.check_create_file(fn, cols)
-        df_driver = pd.read_csv(fn)
-
-        df_driver['driver_name'] = df_driver['last_name'] + \
-            ', ' + df_driver['given_name']
-        df_driver = df_driver[['driver_id', 'driver_name']]
-
-        df_trips = df_trips.merge(df_driver, on='driver_id', how='left')
-        drv_dict = dict()
-        for name in df_trips['driver_name'].unique():
-            df_trips_loop = df_trips[df_trips['driver_name'] == name].copy()
-            drv_val = self.stat_trips(df_trips_loop)
-            drv_dict[name] = drv_val
-        return drv_dict
+        return self.stat_driver_counts(self.frame_stats(df_trips))
 
+    @instrumented('aggregate')
+    @cached_result
     def generate_statistics(self, stat):
         """
         This method returns a dictionary of
@@ -836,32 +4279,103 @@ class SakayDB():
         Dictionary
 
         """
-        fn = f'{self.data_dir}/trips.csv'
-        cols = ['trip_id', 'driver_id', 'pickup_datetime',
-                'dropoff_datetime', 'passenger_count', 'pickup_loc_id',
-                'dropoff_loc_id', 'trip_distance', 'fare_amount']
-
-        self.check_create_file(fn, cols)
-        df_trips = pd.read_csv(fn)
-
-        stats_list = ['trip', 'passenger', 'driver', 'all']
-
-        if stat not in stats_list:
-            raise SakayDBError('Unknown stat input')
-        else:
-            if stat == 'trip':
-                return self.stat_trips(df_trips)
-            elif stat == 'passenger':
-                return self.stat_passenger(df_trips)
-            elif stat == 'driver':
-                return self.stat_driver(df_trips)
-            elif stat == 'all':
-                all_dict = dict()
-                all_dict['trip'] = self.stat_trips(df_trips)
-                all_dict['passenger'] = self.stat_passenger(df_trips)
-                all_dict['driver'] = self.stat_driver(df_trips)
-                return all_dict
+        self.check_create_table('trips')
+        stats = self.trip_stats()
+
+        stats_list = ['trip', 'passenger', 'driver', 'all']
+
+        if stat not in stats_list:
+            raise SakayDBError('Unknown stat input')
+        else:
+            if stat == 'trip':
+                return self.weekday_averages(stats['weekly']['trip'])
+            elif stat == 'passenger':
+                return self.stat_passenger_counts(stats)
+            elif stat == 'driver':
+                return self.stat_driver_counts(stats)
+            elif stat == 'all':
+                all_dict = dict()
+                all_dict['trip'] = self.weekday_averages(
+                    stats['weekly']['trip'])
+                all_dict['passenger'] = self.stat_passenger_counts(stats)
+                all_dict['driver'] = self.stat_driver_counts(stats)
+                return all_dict
+
+    def stat_passenger_counts(self, stats):
+        """
+        This function computes the passenger stats of
+        generate_statistics from the weekly totals of trip_stats.
+        Passenger counts are ordered by their first trip, as in
+        stat_passenger.
+
+        Parameters
+        ----------
+        stats : dict
+            Result of trip_stats
+
+        Returns
+        -------
+        Dictionary
+
+        """
+        weekly = stats['weekly']['passenger']
+        first = stats['first_passenger']
+        return {np.int64(pc): self.weekday_averages(weekly.get(pc, dict()))
+                for pc in sorted(first, key=first.get)}
+
+    def stat_driver_counts(self, stats):
+        """
+        This function computes the driver stats of
+        generate_statistics from the weekly totals of trip_stats.
+        Drivers are ordered by their first trip, as in stat_driver.
+        Drivers sharing a name are averaged together, from their
+        daily trip counts.
+
+        Parameters
+        ----------
+        stats : dict
+            Result of trip_stats
+
+        Returns
+        -------
+        Dictionary
+
+        """
+        self.check_create_table('drivers')
+        df_driver = self.read_table('drivers')
+        df_driver = df_driver[~df_driver['driver_id'].duplicated()]
+        names = pd.Series((df_driver['last_name'].astype(object) + ', ' +
+                           df_driver['given_name'].astype(object)).values,
+                          index=df_driver['driver_id'].values)
+        shared = names[names.duplicated(keep=False) & names.notnull()]
+        shared_names = set(shared)
+
+        weekly = stats['weekly']['driver']
+        first = stats['first_driver']
+        order = sorted(first, key=first.get)
+        drv_dict = dict()
+        for driver_id, name in zip(order, names.reindex(order).tolist()):
+            if not isinstance(name, str):
+                name = np.nan
+            if name in drv_dict:
+                continue
+
+            if name is np.nan:
+                totals = dict()
+            elif name in shared_names:
+                ids = {int(x) for x in shared.index[shared == name]}
+                days = dict()
+                for (day, value), n in stats['counts']['driver'].items():
+                    if value in ids:
+                        days[day] = days.get(day, 0) + n
+                totals = self.new_stats(None, {'trip': days})['weekly'][
+                    'trip']
+            else:
+                totals = weekly.get(driver_id, dict())
+            drv_dict[name] = self.weekday_averages(totals)
+        return drv_dict
 
+    @instrumented('aggregate')
     def plot_statistics(self, stat):
         """
         This method plots summary statistics for
@@ -888,13 +4402,7 @@ class SakayDB():
         Figure or axes
 
         """
-        fn = f'{self.data_dir}/trips.csv'
-        cols = ['trip_id', 'driver_id', 'pickup_datetime',
-                'dropoff_datetime', 'passenger_count', 'pickup_loc_id',
-                'dropoff_loc_id', 'trip_distance', 'fare_amount']
-
-        self.check_create_file(fn, cols)
-        df_trips = pd.read_csv(fn)
+        self.check_create_table('trips')
 
         stats_list = ['trip', 'passenger', 'driver']
 
@@ -943,6 +4451,302 @@ class SakayDB():
                 plt.show()
                 return fig
 
+    def od_positions(self, df, loc_ids):
+        """
+        This function returns the pickup day and the positions of
+        the pickup and dropoff locations in loc_ids of each trip.
+        Trips with a location that is not in loc_ids are left out.
+
+        Parameters
+        ----------
+        df : DataFrame
+            Rows of the trips table
+
+        loc_ids : ndarray
+            Sorted location ids
+
+        Returns
+        -------
+        Tuple of three arrays: days since 1970-01-01, pickup
+        positions and dropoff positions
+
+        """
+        days = df['pickup_datetime'].to_numpy(dtype='int64') // 86400
+        valid = np.full(len(df), len(loc_ids) > 0)
+        positions = []
+        for col in ['pickup_loc_id', 'dropoff_loc_id']:
+            ids = df[col].to_numpy(dtype='float64', na_value=np.nan)
+            valid &= ~np.isnan(ids)
+            pos = np.searchsorted(loc_ids, np.nan_to_num(ids))
+            pos = np.minimum(pos, max(len(loc_ids) - 1, 0))
+            if len(loc_ids) > 0:
+                valid &= loc_ids[pos] == ids
+            positions.append(pos)
+        return days[valid], positions[0][valid], positions[1][valid]
+
+    def od_store(self):
+        """
+        This function returns the OD counts of the trips table from
+        od_cache, counting them again when the trips or locations
+        table on disk has changed.
+
+        Returns
+        -------
+        Dictionary with the following keys
+
+            * signature - table_signature of trips when counted
+            * locations - table_signature of locations when counted
+            * loc_ids - sorted location ids
+            * days - sorted pickup days that have trips, in days
+                     since 1970-01-01, one per slice of counts
+            * counts - array of trip counts with shape (days,
+                       locations, locations), indexed by position
+                       in days, pickup location and dropoff location
+
+        """
+        if self.od_current():
+            return self.od_cache
+
+        signature = self.table_signature('trips')
+        locations = self.table_signature('locations')
+
+        loc_ids = np.unique(self.read_table('locations', copy=False)
+                            ['location_id'].to_numpy(dtype='int64'))
+        if self.table_cached('trips'):
+            trips = self.read_table('trips', copy=False)
+        else:
+            trips = self.read_table('trips', copy=False, columns=[
+                'pickup_datetime', 'pickup_loc_id', 'dropoff_loc_id'])
+        self.record_io(rows_scanned=len(trips))
+        days, pickup, dropoff = self.od_positions(trips, loc_ids)
+
+        n = len(loc_ids)
+        if len(days) > 0:
+            parts = self.day_partitions(days)
+            day_lists = [np.unique(days[pos]) for _, _, pos in parts]
+            counts = np.concatenate(self.map_workers(
+                self.od_partition,
+                [days[pos] for _, _, pos in parts],
+                [pickup[pos] for _, _, pos in parts],
+                [dropoff[pos] for _, _, pos in parts],
+                day_lists,
+                [n] * len(parts)))
+            days = np.concatenate(day_lists)
+        else:
+            days = np.zeros(0, dtype='int64')
+            counts = np.zeros((0, n, n), dtype='int32')
+
+        self.od_cache = {
+            'signature': signature,
+            'locations': locations,
+            'loc_ids': loc_ids,
+            'days': days,
+            'counts': counts
+        }
+        return self.od_cache
+
+    def od_current(self):
+        """
+        This function returns whether od_cache holds the OD counts
+        of the trips and locations tables on disk.
+
+        Returns
+        -------
+        bool
+
+        """
+        store = self.od_cache
+        return (store is not None and
+                store['signature'] == self.table_signature('trips') and
+                store['locations'] == self.table_signature('locations'))
+
+    @staticmethod
+    def od_partition(days, pickup, dropoff, day_list, n):
+        """
+        This function counts trips per pickup day, pickup location
+        and dropoff location, for a range of pickup days. It runs in
+        the worker processes.
+
+        Parameters
+        ----------
+        days, pickup, dropoff : ndarray
+            Results of od_positions for the trips in range
+
+        day_list : ndarray
+            Sorted pickup days to count, which include all of days
+
+        n : int
+            Number of locations
+
+        Returns
+        -------
+        Array of trip counts with shape (len(day_list), n, n)
+
+        """
+        keys = (np.searchsorted(day_list, days) * n + pickup) * n + dropoff
+        counts = np.bincount(keys, minlength=len(day_list) * n * n)
+        return counts.astype('int32').reshape(len(day_list), n, n)
+
+    def update_od(self, df, sign, signature):
+        """
+        This function adds trips to, or removes them from, the OD
+        counts after a write to the trips table. The counts are only
+        updated if they matched the table before the write; they are
+        otherwise counted again by the next od_store.
+
+        Parameters
+        ----------
+        df : DataFrame
+            Rows of the trips table that were written
+
+        sign : int
+            1 if the rows were added, -1 if they were deleted
+
+        signature : tuple
+            table_signature of trips before the write
+
+        Returns
+        -------
+        None
+
+        """
+        store = self.od_cache
+        if store is None or store['signature'] != signature:
+            self.od_cache = None
+            return
+
+        days, pickup, dropoff = self.od_positions(df, store['loc_ids'])
+        if len(days) > 0:
+            counts = store['counts']
+            day_list = np.union1d(store['days'], days)
+            if len(day_list) > len(store['days']):
+                grown = np.zeros((len(day_list),) + counts.shape[1:],
+                                 dtype=counts.dtype)
+                grown[np.searchsorted(day_list, store['days'])] = counts
+                store['counts'] = counts = grown
+                store['days'] = day_list
+
+            np.add.at(counts, (np.searchsorted(day_list, days), pickup,
+                               dropoff), sign)
+
+        store['signature'] = self.table_signature('trips')
+
+    def od_days(self, start=None, end=None, include_start=True):
+        """
+        This function returns the OD counts of each day with
+        pickups between start and end. Days that are only partly in
+        range are counted from the trips in range.
+
+        Parameters
+        ----------
+        start : int or None
+            Lower bound of pickup_datetime, in seconds since
+            1970-01-01. Defaults to None, for no lower bound
+
+        end : int or None
+            Upper bound, inclusive, of pickup_datetime. Defaults to
+            None, for no upper bound
+
+        include_start : bool
+            Whether the lower bound is inclusive. Defaults to True
+
+        Returns
+        -------
+        Tuple of the sorted pickup days with trips in range, in days
+        since 1970-01-01, and an array of counts with shape (days,
+        locations, locations)
+
+        """
+        store = self.od_store()
+        counts = store['counts']
+        day_list = store['days']
+
+        if start is not None and not include_start:
+            start += 1
+        i = 0 if start is None else np.searchsorted(day_list, start // 86400)
+        j = len(day_list) if end is None else np.searchsorted(
+            day_list, end // 86400, side='right')
+        day_list = day_list[i:j]
+        block = counts[i:j]
+
+        partial = set()
+        if len(day_list) > 0:
+            lo, hi = int(day_list[0]), int(day_list[-1])
+            if start is not None and start > lo * 86400:
+                partial.add(0)
+            if end is not None and end < hi * 86400 + 86399:
+                partial.add(len(day_list) - 1)
+
+        if partial:
+            block = block.copy()
+            trips = self.read_table('trips', copy=False)
+            n = len(store['loc_ids'])
+            for k in partial:
+                day = int(day_list[k])
+                rows = self.sorted_rows(
+                    'pickup_datetime',
+                    day * 86400 if start is None else max(start, day * 86400),
+                    day * 86400 + 86399 if end is None else
+                    min(end, day * 86400 + 86399))
+                self.record_io(rows_scanned=len(rows))
+                days, pickup, dropoff = self.od_positions(
+                    trips.iloc[rows], store['loc_ids'])
+                block[k] = np.bincount(
+                    pickup * n + dropoff, minlength=n * n).reshape(n, n)
+
+        return day_list, block
+
+    def od_range(self, start=None, end=None, include_start=True):
+        """
+        This function counts the OD trips of each day with pickups
+        between start and end from the partitions of the trips
+        table in range, without reading the other partitions or
+        counting the whole table into od_cache.
+
+        Parameters
+        ----------
+        start : int or None
+            Lower bound of pickup_datetime, in seconds since
+            1970-01-01. Defaults to None, for no lower bound
+
+        end : int or None
+            Upper bound, inclusive, of pickup_datetime. Defaults to
+            None, for no upper bound
+
+        include_start : bool
+            Whether the lower bound is inclusive. Defaults to True
+
+        Returns
+        -------
+        Tuple of the sorted location ids, and an array of counts
+        with shape (days, locations, locations)
+
+        """
+        loc_ids = np.unique(self.read_table('locations', copy=False)
+                            ['location_id'].to_numpy(dtype='int64'))
+        if start is not None and not include_start:
+            start += 1
+
+        trips = self.read_partitions(start, end, columns=[
+            'trip_id', 'pickup_datetime', 'pickup_loc_id', 'dropoff_loc_id'])
+        self.record_io(rows_scanned=len(trips))
+        seconds = trips['pickup_datetime'].to_numpy()
+        in_range = np.ones(len(trips), dtype=bool)
+        if start is not None:
+            in_range &= seconds >= start
+        if end is not None:
+            in_range &= seconds <= end
+
+        days, pickup, dropoff = self.od_positions(trips[in_range], loc_ids)
+        n = len(loc_ids)
+        if len(days) == 0:
+            return loc_ids, np.zeros((0, n, n), dtype='int32')
+
+        return loc_ids, self.od_partition(days, pickup, dropoff,
+                                          np.unique(days), n)
+
+    @instrumented('aggregate')
+    @cached_result
     def generate_odmatrix(self, date_range=None):
         """
         This method creates a dataframe that maps
@@ -956,7 +4760,9 @@ class SakayDB():
             A range search that takes a tuple of
             datetime strings, and filters trips
             based on pickup_datetime. Defaults to None,
-            in which case all dates are included
+            in which case all dates are included. With
+            partitioned trips, only the partitions in
+            range are read until the OD counts are cached
 
         Note: Tuple inputs can follow any of the
         following cases
@@ -982,23 +4788,10 @@ class SakayDB():
             If date_range input is invalid
 
         """
-        loc_fn = f'{self.data_dir}/locations.csv'
-        tr_fn = f'{self.data_dir}/trips.csv'
-
-        loc_cols = ['location_id', 'loc_name']
-        tr_cols = ['trip_id', 'driver_id', 'pickup_datetime',
-                   'dropoff_datetime', 'passenger_count', 'pickup_loc_id',
-                   'dropoff_loc_id', 'trip_distance', 'fare_amount']
-
-        self.check_create_file(loc_fn, loc_cols)
-        self.check_create_file(tr_fn, tr_cols)
-
-        locations = pd.read_csv(loc_fn)
-        trips = pd.read_csv(tr_fn)
+        self.check_create_table('locations')
+        self.check_create_table('trips')
 
-        trips['pickup_datetime'] = pd.to_datetime(
-            trips['pickup_datetime'], format='%H:%M:%S,%d-%m-%Y')
-        trips['count'] = 1
+        locations = self.read_table('locations')
 
         try:
             if len(date_range) > 2:
@@ -1008,71 +4801,670 @@ class SakayDB():
             pass
 
         if date_range is None:
-            trips = trips.copy()
+            days, block = self.od_days()
+            loc_ids = self.od_cache['loc_ids']
+
+        else:
+            if date_range[1] is None:
+                bounds = [date_range[0], None]
+            elif date_range[0] is None:
+                bounds = [None, date_range[1]]
+            else:
+                bounds = [date_range[0], date_range[1]]
 
-        elif date_range[1] is None:
             try:
-                p_datetime = pd.to_datetime(
-                    date_range[0], format='%H:%M:%S,%d-%m-%Y')
+                start, end = [None if x is None else self.to_epoch(x)
+                              for x in bounds]
             except:
                 raise SakayDBError('Invalid date_range input')
 
-            date_range = [pd.to_datetime(
-                x, format='%H:%M:%S,%d-%m-%Y') for x in date_range]
-            trips = trips[trips['pickup_datetime'] >= date_range[0]]
+            include_start = start is None or end is None
+            if self.partition is not None and not self.od_current():
+                loc_ids, block = self.od_range(start, end, include_start)
+            else:
+                days, block = self.od_days(start, end, include_start)
+                loc_ids = self.od_cache['loc_ids']
+
+        locations = locations[~locations['location_id'].duplicated()]
+        names = pd.Series(locations['loc_name'].values,
+                          index=locations['location_id'].values)\
+            .reindex(loc_ids).to_numpy()
 
-        elif date_range[0] is None:
-            try:
-                p_datetime = pd.to_datetime(
-                    date_range[1], format='%H:%M:%S,%d-%m-%Y')
-            except:
-                raise SakayDBError('Invalid date_range input')
+        return self.od_frame(block, names)
+
+    def od_frame(self, block, names):
+        """
+        This function builds the dataframe of generate_odmatrix from
+        OD counts per day. Trips are grouped by location name, and
+        each pair of names is averaged over the days it has trips.
+        Like pivot_table, a column holds integers when all of its
+        averages are whole numbers.
+
+        Parameters
+        ----------
+        block : ndarray
+            Trip counts with shape (days, locations, locations),
+            indexed by day, pickup location and dropoff location
+
+        names : ndarray
+            Location name of each location position
+
+        Returns
+        -------
+        DataFrame with dropoff location names as index and pickup
+        location names as columns
+
+        """
+        valid = pd.notnull(names)
+        labels = np.unique(names[valid])
+        codes = np.full(len(names), -1)
+        codes[valid] = np.searchsorted(labels, names[valid])
+        n = len(labels)
+
+        days, pickup, dropoff = np.nonzero(block)
+        counts = block[days, pickup, dropoff]
+        pickup, dropoff = codes[pickup], codes[dropoff]
+        keep = (pickup >= 0) & (dropoff >= 0)
+
+        keys = ((pickup[keep] * n + dropoff[keep]).astype('int64') *
+                len(block) + days[keep])
+        keys, inverse = np.unique(keys, return_inverse=True)
+        pairs = keys // max(len(block), 1)
+        total = np.bincount(pairs, weights=np.bincount(
+            inverse, weights=counts[keep]), minlength=n * n).reshape(n, n)
+        active = np.bincount(pairs, minlength=n * n).reshape(n, n)
+
+        means = np.divide(total, active, out=np.zeros((n, n)),
+                          where=active > 0)
+        cols = np.flatnonzero(active.any(axis=1))
+        rows = np.flatnonzero(active.any(axis=0))
+
+        od_matrix = dict()
+        for col in cols:
+            values = means[col, rows]
+            whole = values.round()
+            if np.allclose(whole, values, rtol=0):
+                values = whole.astype('int64')
+            od_matrix[labels[col]] = values
+
+        return pd.DataFrame(od_matrix,
+                            index=pd.Index(labels[rows], dtype='object',
+                                           name='dropoff_loc_name'),
+                            columns=pd.Index(labels[cols], dtype='object'))
+
+
+class SakayDBError(ValueError):
+    def __init__(self, exception):
+        super().__init__(exception)
+
+
+class AsyncSakayDB():
+    def __init__(self, data_dir, max_workers=2, **kwargs):
+        """
+        This class initializer accepts a string data_dir, like
+        SakayDB, and exposes its main functions as awaitables for
+        use with asyncio.
+
+        Calls run on a pool of max_workers threads, so the event
+        loop is never blocked. Each thread keeps its own SakayDB,
+        created with the remaining keyword arguments (e.g.,
+        storage), so tables held in memory are repeated per thread.
+
+        Calls are ordered per table in the order they are made: a
+        call that reads a table waits for the earlier calls that
+        write it, and a call that writes a table waits for all the
+        earlier calls that use it. Calls on the same table that only
+        read it may run at the same time. Cancelling a call that has
+        started does not stop its thread, so the calls after it still
+        wait for it to finish.
+
+        """
+        self.data_dir = data_dir
+        self.options = kwargs
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.local = threading.local()
+        self.databases = []
+        self.last_write = dict()
+        self.reads = dict()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
 
-            date_range = [pd.to_datetime(
-                x, format='%H:%M:%S,%d-%m-%Y') for x in date_range]
-            trips = trips[trips['pickup_datetime'] <= date_range[1]]
+    def close(self):
+        """
+        This method waits for running calls, stops the threads and
+        closes the SakayDB of each thread.
+
+        Returns
+        -------
+        None
+
+        """
+        self.executor.shutdown(wait=True)
+        for db in self.databases:
+            db.close()
+
+    def database(self):
+        """
+        This function returns the SakayDB of the current thread,
+        creating it on first use.
+
+        Returns
+        -------
+        SakayDB
+
+        """
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = self.local.db = SakayDB(self.data_dir, **self.options)
+            self.databases.append(db)
+        return db
+
+    def submit(self, name, writes, reads, *args, **kwargs):
+        """
+        This function schedules a call to a method of SakayDB after
+        the earlier calls it depends on, see AsyncSakayDB.
 
-        elif date_range[0] is not None and date_range[1] is not None:
+        Parameters
+        ----------
+        name : str
+            Name of the SakayDB method
+
+        writes : list
+            Tables the method writes
+
+        reads : list
+            Tables the method only reads
+
+        *args, **kwargs
+            Arguments of the method
+
+        Returns
+        -------
+        Awaitable with the result of the method
+
+        """
+        loop = asyncio.get_running_loop()
+        done = loop.create_future()
+
+        waits = set()
+        for table in writes:
+            waits.add(self.last_write.get(table))
+            waits.update(self.reads.get(table, set()))
+            self.last_write[table] = done
+            self.reads[table] = set()
+        for table in reads:
+            waits.add(self.last_write.get(table))
+            self.reads.setdefault(table, set()).add(done)
+        waits.discard(None)
+
+        def call():
+            return getattr(self.database(), name)(*args, **kwargs)
+
+        def release():
+            if done.done():
+                return
+            done.set_result(None)
+            for table in writes:
+                if self.last_write.get(table) is done:
+                    del self.last_write[table]
+            for table in reads:
+                self.reads.get(table, set()).discard(done)
+
+        async def run():
             try:
-                p1_datetime = pd.to_datetime(
-                    date_range[0], format='%H:%M:%S,%d-%m-%Y')
-                p2_datetime = pd.to_datetime(
-                    date_range[1], format='%H:%M:%S,%d-%m-%Y')
-            except:
-                raise SakayDBError('Invalid date_range input')
+                if waits:
+                    await asyncio.wait(waits)
+            except asyncio.CancelledError:
+                release()
+                raise
+            # The call is only released once it has finished in its
+            # thread, even if this task is cancelled while it runs.
+            future = self.executor.submit(call)
+            future.add_done_callback(
+                lambda f: loop.call_soon_threadsafe(release))
+            return await asyncio.wrap_future(future)
+
+        return asyncio.ensure_future(run())
+
+    def add_trip(self, *args, **kwargs):
+        """
+        This method is the awaitable counterpart of
+        SakayDB.add_trip.
 
-            date_range = [pd.to_datetime(
-                x, format='%H:%M:%S,%d-%m-%Y') for x in date_range]
-            trips = trips[(trips['pickup_datetime'] > date_range[0]) &
-                          (trips['pickup_datetime'] <= date_range[1])]
+        """
+        return self.submit('add_trip', ['trips', 'drivers'],
+                           ['locations'], *args, **kwargs)
 
-        trips = trips.merge(locations, left_on='pickup_loc_id',
-                            right_on='location_id', how='left')\
-            .rename(columns={'loc_name': 'pickup_loc_name'})
+    def add_trips(self, *args, **kwargs):
+        """
+        This method is the awaitable counterpart of
+        SakayDB.add_trips.
 
-        trips = trips.merge(locations, left_on='dropoff_loc_id',
-                            right_on='location_id', how='left')\
-            .rename(columns={'loc_name': 'dropoff_loc_name'})
+        """
+        return self.submit('add_trips', ['trips', 'drivers'],
+                           ['locations'], *args, **kwargs)
+
+    def delete_trip(self, *args, **kwargs):
+        """
+        This method is the awaitable counterpart of
+        SakayDB.delete_trip.
 
-        trips = trips.drop(columns=['location_id_x', 'location_id_y',
-                                    'pickup_loc_id', 'dropoff_loc_id'])
+        """
+        return self.submit('delete_trip', ['trips'], [], *args, **kwargs)
+
+    def search_trips(self, *args, **kwargs):
+        """
+        This method is the awaitable counterpart of
+        SakayDB.search_trips.
 
-        trips = trips[['count', 'pickup_loc_name',
-                       'dropoff_loc_name', 'pickup_datetime']].copy()
+        """
+        return self.submit('search_trips', [], ['trips'], *args, **kwargs)
 
-        trips['pickup_date'] = trips['pickup_datetime'].dt.strftime('%Y-%m-%d')
-        trips.drop(columns='pickup_datetime', inplace=True)
+    def export_data(self, *args, **kwargs):
+        """
+        This method is the awaitable counterpart of
+        SakayDB.export_data.
 
-        od_matrix = trips.groupby(['pickup_loc_name', 'dropoff_loc_name', 'pickup_date'],
-                                  as_index=False).sum()
+        """
+        return self.submit('export_data', [],
+                           ['trips', 'drivers', 'locations'],
+                           *args, **kwargs)
 
-        od_matrix = od_matrix.pivot_table(columns='pickup_loc_name',
-                                          index='dropoff_loc_name', aggfunc='mean', fill_value=0)
+    def generate_statistics(self, *args, **kwargs):
+        """
+        This method is the awaitable counterpart of
+        SakayDB.generate_statistics.
 
-        od_matrix.columns = [x[1] for x in od_matrix.columns]
-        return od_matrix
+        """
+        return self.submit('generate_statistics', [],
+                           ['trips', 'drivers'], *args, **kwargs)
 
+    def generate_odmatrix(self, *args, **kwargs):
+        """
+        This method is the awaitable counterpart of
+        SakayDB.generate_odmatrix.
 
-class SakayDBError(ValueError):
-    def __init__(self, exception):
-        super().__init__(exception)
+        """
+        return self.submit('generate_odmatrix', [],
+                           ['trips', 'locations'], *args, **kwargs)
+
+
+class SakayDBServer():
+    def __init__(self, data_dir, host='127.0.0.1', port=SERVER_PORT,
+                 token=None, **kwargs):
+        """
+        This class initializer accepts a string data_dir, like
+        SakayDB, and serves the methods in SERVER_METHODS over HTTP
+        at host and port, so that short-lived scripts can query the
+        data through sakaydb_client.SakayDBClient without importing
+        pandas or reading the tables themselves.
+
+        The server keeps one SakayDB, created with the remaining
+        keyword arguments (e.g., storage or result_cache_size), in
+        the db attribute, so the tables, indexes and statistics it
+        caches stay in memory between requests. Requests are handled
+        one at a time. Tables changed on disk by other processes are
+        read again as in SakayDB.
+
+        Every request must carry the token of the server in the
+        X-SakayDB-Token header. The token is generated unless given,
+        and is written to server.token in data_dir, readable only by
+        the user running the server, while the server is open.
+
+        A call is a POST to /call/<method> with Content-Type
+        application/json and a body holding args and kwargs, where
+        tuples are written as {"__tuple__": [...]}. The result is
+        returned as JSON, see encode_result; a SakayDBError or other
+        error raised by the call is returned with status 400 or 500.
+        export_data takes no path and returns the CSV text instead.
+        GET /health returns the data_dir and SERVER_METHODS.
+
+        """
+        self.db = SakayDB(data_dir, **kwargs)
+        self.lock = threading.Lock()
+        self.token = token if token is not None else secrets.token_hex(32)
+        self.token_file = f'{data_dir}/server.token'
+        fd = os.open(self.token_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                     0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(f'{self.token}\n')
+        self.httpd = ThreadingHTTPServer((host, port), SakayDBRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.sakaydb = self
+        self.address = self.httpd.server_address[:2]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def warm(self):
+        """
+        This method reads the tables and trip statistics into the
+        caches of db, so that the first requests do not have to.
+
+        Returns
+        -------
+        None
+
+        """
+        with self.lock:
+            for table in ['drivers', 'locations', 'trips']:
+                self.db.check_create_table(table)
+                self.db.read_table(table, copy=False)
+            self.db.trip_stats()
+
+    def serve_forever(self):
+        """
+        This method handles requests until shutdown is called.
+
+        Returns
+        -------
+        None
+
+        """
+        self.httpd.serve_forever()
+
+    def shutdown(self):
+        """
+        This method stops serve_forever, from another thread.
+
+        Returns
+        -------
+        None
+
+        """
+        self.httpd.shutdown()
+
+    def close(self):
+        """
+        This method closes the socket of the server and db, and
+        removes its token file.
+
+        Returns
+        -------
+        None
+
+        """
+        self.httpd.server_close()
+        self.db.close()
+        try:
+            with open(self.token_file, encoding='utf-8') as f:
+                if f.read().strip() == self.token:
+                    os.remove(self.token_file)
+        except OSError:
+            pass
+
+    def authorized(self, headers):
+        """
+        This function checks the token header of a request.
+
+        Parameters
+        ----------
+        headers : Message
+            Headers of the request
+
+        Returns
+        -------
+        bool
+
+        """
+        token = headers.get('X-SakayDB-Token', '')
+        return hmac.compare_digest(token.encode('utf-8'),
+                                   self.token.encode('utf-8'))
+
+    def call(self, name, body):
+        """
+        This function calls a method of db for a request.
+
+        Parameters
+        ----------
+        name : str
+            Name of the method, one of SERVER_METHODS
+
+        body : bytes
+            JSON object with the args list and kwargs dictionary
+            of the method
+
+        Returns
+        -------
+        Tuple of the HTTP status and response body
+
+        """
+        if name not in SERVER_METHODS:
+            return self.error(404, LookupError(f'Unknown method {name}'))
+        try:
+            request = json.loads(body or b'{}', object_hook=from_json)
+            args = request.get('args', [])
+            kwargs = request.get('kwargs', {})
+            if name == 'export_data':
+                if args or set(kwargs) - {'chunksize'}:
+                    raise SakayDBError('export_data takes no path on the '
+                                       'server')
+                buf = io.StringIO()
+                with self.lock:
+                    self.db.export_data(buf, **kwargs)
+                result = buf.getvalue()
+            else:
+                with self.lock:
+                    result = getattr(self.db, name)(*args, **kwargs)
+            body = json.dumps(encode_result(result))
+        except SakayDBError as e:
+            return self.error(400, e)
+        except Exception as e:
+            return self.error(500, e)
+        return 200, body.encode('utf-8')
+
+    def error(self, status, exception):
+        """
+        This function returns the response for a failed request.
+
+        Parameters
+        ----------
+        status : int
+            HTTP status of the response
+
+        exception : Exception
+            Error to report
+
+        Returns
+        -------
+        Tuple of the HTTP status and response body
+
+        """
+        body = json.dumps({'error': type(exception).__name__,
+                           'message': str(exception)})
+        return status, body.encode('utf-8')
+
+
+def from_json(obj):
+    """
+    This function turns the {"__tuple__": [...]} objects of a
+    server request back into tuples, see SakayDBServer.
+
+    Parameters
+    ----------
+    obj : dict
+        Decoded JSON object
+
+    Returns
+    -------
+    Tuple or dict
+
+    """
+    if list(obj) == ['__tuple__']:
+        return tuple(obj['__tuple__'])
+    return obj
+
+
+def encode_result(value):
+    """
+    This function converts the result of a SakayDB method to an
+    object that can be written as JSON for sakaydb_client, which
+    reads it back with sakaydb_client.decode_result. Dictionaries
+    are written as {"__dict__": [[key, value], ...]} to keep keys
+    that are not strings, tuples as {"__tuple__": [...]}, and
+    dataframes as {"__frame__": {...}} with their index, columns,
+    dtypes and values.
+
+    Parameters
+    ----------
+    value : object
+        Result of a SakayDB method
+
+    Returns
+    -------
+    Object that can be written as JSON
+
+    """
+    if isinstance(value, pd.DataFrame):
+        return {'__frame__': {
+            'index': value.index.tolist(),
+            'index_dtype': str(value.index.dtype),
+            'index_name': value.index.name,
+            'columns': value.columns.tolist(),
+            'dtypes': [str(dtype) for dtype in value.dtypes],
+            'data': [value.iloc[:, i].tolist()
+                     for i in range(value.shape[1])]
+        }}
+    if isinstance(value, dict):
+        return {'__dict__': [[encode_result(k), encode_result(v)]
+                             for k, v in value.items()]}
+    if isinstance(value, tuple):
+        return {'__tuple__': [encode_result(v) for v in value]}
+    if isinstance(value, list):
+        return [encode_result(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class SakayDBRequestHandler(BaseHTTPRequestHandler):
+    """
+    This class handles the HTTP requests of a SakayDBServer, which
+    is kept in the sakaydb attribute of the HTTP server.
+
+    """
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server.sakaydb
+        if not server.authorized(self.headers):
+            self.respond(*server.error(
+                403, PermissionError('Missing or wrong token')))
+        elif self.path != '/health':
+            self.respond(*server.error(
+                404, LookupError(f'Unknown path {self.path}')))
+        else:
+            body = json.dumps({'data_dir': server.db.data_dir,
+                               'methods': SERVER_METHODS})
+            self.respond(200, body.encode('utf-8'))
+
+    def do_POST(self):
+        server = self.server.sakaydb
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        content_type = self.headers.get('Content-Type', '')
+        if not server.authorized(self.headers):
+            self.respond(*server.error(
+                403, PermissionError('Missing or wrong token')))
+        elif content_type.split(';')[0].strip() != 'application/json':
+            self.respond(*server.error(
+                415, ValueError('Content-Type must be application/json')))
+        elif not self.path.startswith('/call/'):
+            self.respond(*server.error(
+                404, LookupError(f'Unknown path {self.path}')))
+        else:
+            name = self.path[len('/call/'):]
+            self.respond(*server.call(name, body))
+
+    def respond(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    """
+    This function is the command line entry point of the module.
+
+    * migrate - copies the tables of a data directory to another
+                storage format or partitioning of trips, e.g.,
+                python sakaydb.py migrate data parquet
+                python sakaydb.py migrate data csv --partition month
+    * serve - serves a data directory to sakaydb_client until
+              interrupted, see SakayDBServer, e.g.,
+              python sakaydb.py serve data --port 8765
+              With --instrument, metrics reports the calls served.
+
+    """
+    parser = argparse.ArgumentParser(
+        description='Manage a SakayDB data directory.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    migrate = commands.add_parser(
+        'migrate', help='copy the tables to another storage format')
+    migrate.add_argument('data_dir')
+    migrate.add_argument('storage', choices=STORAGE_FORMATS)
+    migrate.add_argument('--source', choices=STORAGE_FORMATS, default='csv',
+                         help='current storage format (default: csv)')
+    migrate.add_argument('--partition', choices=list(TRIP_PARTITIONS),
+                         help='partition trips by month or day')
+    migrate.add_argument('--source-partition', choices=list(TRIP_PARTITIONS),
+                         help='current partitioning of trips (default: '
+                              'none)')
+
+    serve = commands.add_parser(
+        'serve', help='serve the tables to sakaydb_client')
+    serve.add_argument('data_dir')
+    serve.add_argument('--host', default='127.0.0.1',
+                       help='address to listen on (default: 127.0.0.1)')
+    serve.add_argument('--port', type=int, default=SERVER_PORT,
+                       help=f'port to listen on (default: {SERVER_PORT})')
+    serve.add_argument('--storage', choices=STORAGE_FORMATS, default='csv',
+                       help='storage format of the tables (default: csv)')
+    serve.add_argument('--partition', choices=list(TRIP_PARTITIONS),
+                       help='partitioning of trips (default: none)')
+    serve.add_argument('--result-cache-size', type=int, default=128,
+                       help='query results to keep (default: 128)')
+    serve.add_argument('--instrument', action='store_true',
+                       help='time the calls, for the metrics method')
+
+    args = parser.parse_args()
+    if args.command == 'migrate':
+        SakayDB(args.data_dir, storage=args.source,
+                partition=args.source_partition)\
+            .migrate_storage(args.storage, args.partition)
+    elif args.command == 'serve':
+        with SakayDBServer(args.data_dir, host=args.host, port=args.port,
+                           storage=args.storage, partition=args.partition,
+                           result_cache_size=args.result_cache_size,
+                           instrument=args.instrument) as server:
+            server.warm()
+            print('Serving {} on http://{}:{}, token in {}'.format(
+                args.data_dir, *server.address, server.token_file),
+                flush=True)
+
+            def stop(signum, frame):
+                raise KeyboardInterrupt
+
+            signal.signal(signal.SIGTERM, stop)
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,331 @@
+"""
+This module is a thin client for a SakayDB server, started with
+python sakaydb.py serve DATA_DIR. It only uses the standard library,
+so scripts using it start without importing pandas or reading the
+tables; pandas is imported when a result holding a dataframe is
+received.
+
+
+Classes
+-------
+
+    SakayDBClient
+    SakayDBError
+
+
+Main Functions
+-------
+
+    add_trip
+    add_trips
+    delete_trip
+    search_trips
+    export_data
+    generate_statistics
+    generate_odmatrix
+    metrics
+
+"""
+
+import http.client
+import json
+
+
+SERVER_PORT = 8765
+
+
+class SakayDBError(ValueError):
+    """
+    This class is raised for a SakayDBError raised by the server.
+
+    """
+    def __init__(self, exception):
+        super().__init__(exception)
+
+
+class SakayDBClient():
+    def __init__(self, host='127.0.0.1', port=SERVER_PORT, token=None,
+                 data_dir=None, timeout=None):
+        """
+        This class initializer accepts the host and port of a
+        SakayDB server (see sakaydb.SakayDBServer) and forwards the
+        main functions of SakayDB to it over one kept-alive HTTP
+        connection.
+
+        The token of the server is either given, or read from the
+        server.token file that the server writes to data_dir.
+
+        Results are returned as SakayDB returns them, except that
+        export_data receives the CSV text from the server and writes
+        it to path_or_buf on the client side, or returns it when
+        path_or_buf is None.
+
+        """
+        if token is None:
+            if data_dir is None:
+                raise ValueError('Either token or data_dir is required')
+            with open(f'{data_dir}/server.token', encoding='utf-8') as f:
+                token = f.read().strip()
+        self.host = host
+        self.port = port
+        self.token = token
+        self.timeout = timeout
+        self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        This method closes the connection to the server.
+
+        Returns
+        -------
+        None
+
+        """
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def request(self, method, path, body=None):
+        """
+        This function sends a request to the server, connecting
+        again once if a kept-alive connection was closed by it.
+
+        Parameters
+        ----------
+        method : str
+            Either GET or POST
+
+        path : str
+            Path of the request
+
+        body : bytes or None
+            Body of the request
+
+        Returns
+        -------
+        Tuple of the response status and body
+
+        """
+        headers = {'Content-Type': 'application/json',
+                   'X-SakayDB-Token': self.token}
+        for attempt in range(2):
+            reused = self.conn is not None
+            if not reused:
+                self.conn = http.client.HTTPConnection(
+                    self.host, self.port, timeout=self.timeout)
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError,
+                    ConnectionResetError):
+                self.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            except Exception:
+                self.close()
+                raise
+            return response.status, data
+
+    def call(self, name, *args, **kwargs):
+        """
+        This function calls a method of SakayDB on the server.
+
+        Parameters
+        ----------
+        name : str
+            Name of the method
+
+        *args, **kwargs
+            Arguments of the method
+
+        Returns
+        -------
+        The result of the method
+
+        Raises
+        -------
+        SakayDBError
+            If the method raises a SakayDBError
+
+        RuntimeError
+            If the method or the server fails otherwise
+
+        """
+        body = json.dumps({'args': to_json(list(args)),
+                           'kwargs': to_json(kwargs)}).encode('utf-8')
+        status, data = self.request('POST', f'/call/{name}', body)
+        if status == 200:
+            return decode_result(json.loads(data))
+        try:
+            error = json.loads(data)
+        except ValueError:
+            raise RuntimeError(f'Server returned status {status}')
+        if error.get('error') == 'SakayDBError':
+            raise SakayDBError(error['message'])
+        raise RuntimeError('{}: {}'.format(error.get('error'),
+                                           error.get('message')))
+
+    def health(self):
+        """
+        This method returns the data_dir and methods of the server.
+
+        Returns
+        -------
+        Dictionary
+
+        """
+        status, data = self.request('GET', '/health')
+        if status != 200:
+            raise RuntimeError(f'Server returned status {status}')
+        return json.loads(data)
+
+    def add_trip(self, *args, **kwargs):
+        """
+        This method forwards a call to SakayDB.add_trip.
+
+        """
+        return self.call('add_trip', *args, **kwargs)
+
+    def add_trips(self, *args, **kwargs):
+        """
+        This method forwards a call to SakayDB.add_trips.
+
+        """
+        return self.call('add_trips', *args, **kwargs)
+
+    def delete_trip(self, *args, **kwargs):
+        """
+        This method forwards a call to SakayDB.delete_trip.
+
+        """
+        return self.call('delete_trip', *args, **kwargs)
+
+    def search_trips(self, *args, **kwargs):
+        """
+        This method forwards a call to SakayDB.search_trips.
+
+        """
+        return self.call('search_trips', *args, **kwargs)
+
+    def export_data(self, path_or_buf=None, chunksize=100000):
+        """
+        This method forwards a call to SakayDB.export_data, which
+        returns the CSV text of the export.
+
+        Parameters
+        ----------
+        path_or_buf : str, path object, file-like object or None
+            Where to write the CSV text. Defaults to None, in which
+            case the text is returned
+
+        chunksize : int
+            Number of trips the server exports at a time. Defaults
+            to 100000
+
+        Returns
+        -------
+        None if path_or_buf is given, otherwise the CSV text
+
+        """
+        text = self.call('export_data', chunksize=chunksize)
+        if path_or_buf is None:
+            return text
+        if hasattr(path_or_buf, 'write'):
+            path_or_buf.write(text)
+        else:
+            with open(path_or_buf, 'w', encoding='utf-8', newline='') as f:
+                f.write(text)
+        return None
+
+    def generate_statistics(self, *args, **kwargs):
+        """
+        This method forwards a call to SakayDB.generate_statistics.
+
+        """
+        return self.call('generate_statistics', *args, **kwargs)
+
+    def generate_odmatrix(self, *args, **kwargs):
+        """
+        This method forwards a call to SakayDB.generate_odmatrix.
+
+        """
+        return self.call('generate_odmatrix', *args, **kwargs)
+
+    def metrics(self, *args, **kwargs):
+        """
+        This method forwards a call to SakayDB.metrics. Calls are
+        only timed when the server runs with --instrument.
+
+        """
+        return self.call('metrics', *args, **kwargs)
+
+
+def to_json(value):
+    """
+    This function writes the tuples in the arguments of a call as
+    {"__tuple__": [...]} objects, which the server reads back as
+    tuples.
+
+    Parameters
+    ----------
+    value : object
+        Argument of a call
+
+    Returns
+    -------
+    Object that can be written as JSON
+
+    """
+    if isinstance(value, tuple):
+        return {'__tuple__': [to_json(v) for v in value]}
+    if isinstance(value, list):
+        return [to_json(v) for v in value]
+    if isinstance(value, dict):
+        return {k: to_json(v) for k, v in value.items()}
+    return value
+
+
+def decode_result(value):
+    """
+    This function converts a result read from the JSON written by
+    sakaydb.encode_result back into dictionaries, tuples and
+    dataframes.
+
+    Parameters
+    ----------
+    value : object
+        Decoded JSON of a result
+
+    Returns
+    -------
+    The result of the method
+
+    """
+    if isinstance(value, list):
+        return [decode_result(v) for v in value]
+    if not isinstance(value, dict):
+        return value
+    if '__dict__' in value:
+        return {decode_result(k): decode_result(v)
+                for k, v in value['__dict__']}
+    if '__tuple__' in value:
+        return tuple(decode_result(v) for v in value['__tuple__'])
+
+    import pandas as pd
+
+    frame = value['__frame__']
+    index = pd.Index(frame['index'], dtype=frame['index_dtype'],
+                     name=frame['index_name'])
+    return pd.DataFrame(
+        {col: pd.Series(data, index=index, dtype=dtype)
+         for col, dtype, data in zip(frame['columns'], frame['dtypes'],
+                                     frame['data'])},
+        index=index, columns=pd.Index(frame['columns'], dtype='object'))
@@ -0,0 +1,94 @@
+import io
+import os
+import random
+import sys
+
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from sakaydb import SakayDB  # noqa: E402
+
+
+LOCATIONS = ['Pine View', 'Legazpi Village', 'Salcedo Village', 'Poblacion']
+DRIVERS = ['Dela Cruz, Juan', 'Santos, Maria', 'Reyes, Jose', 'Garcia, Ana']
+
+
+def random_trip(rnd, day):
+    """
+    This function returns the arguments of add_trip for a random
+    trip picked up on the given day of 2020.
+
+    """
+    pickup = (pd.Timestamp('2020-01-01') + pd.Timedelta(days=day) +
+              pd.Timedelta(seconds=rnd.randrange(86400)))
+    dropoff = pickup + pd.Timedelta(minutes=rnd.randrange(5, 90))
+    return {
+        'driver': rnd.choice(DRIVERS),
+        'pickup_datetime': pickup.strftime('%H:%M:%S,%d-%m-%Y'),
+        'dropoff_datetime': dropoff.strftime('%H:%M:%S,%d-%m-%Y'),
+        'passenger_count': rnd.randint(1, 4),
+        'pickup_loc_name': rnd.choice(LOCATIONS),
+        'dropoff_loc_name': rnd.choice(LOCATIONS),
+        'trip_distance': round(rnd.uniform(500, 20000), 2),
+        'fare_amount': round(rnd.uniform(40, 900), 2)
+    }
+
+
+def assert_same_output(db, ref):
+    """
+    This function checks that two SakayDB instances on the same
+    trips return the same exports, searches, statistics and OD
+    matrix.
+
+    """
+    assert_frame_equal(db.export_data(), ref.export_data())
+    buf, ref_buf = io.StringIO(), io.StringIO()
+    db.export_data(buf, chunksize=7)
+    ref.export_data(ref_buf, chunksize=7)
+    assert buf.getvalue() == ref_buf.getvalue()
+
+    for kwargs in [
+            {'pickup_datetime': ('00:00:00,10-01-2020',
+                                 '23:59:59,20-01-2020')},
+            {'pickup_datetime': ('00:00:00,01-02-2020', None),
+             'passenger_count': (2, None)},
+            {'driver_id': 2}]:
+        assert_frame_equal(db.search_trips(**kwargs),
+                           ref.search_trips(**kwargs))
+        assert_frame_equal(
+            pd.concat(db.iter_search_trips(chunksize=9, **kwargs)
+                      ).sort_index(),
+            pd.concat(ref.iter_search_trips(chunksize=9, **kwargs)
+                      ).sort_index())
+
+    assert db.generate_statistics('all') == ref.generate_statistics('all')
+    assert_frame_equal(db.generate_odmatrix(), ref.generate_odmatrix())
+
+
+@pytest.fixture
+def make_trip():
+    """
+    This fixture returns random_trip, for tests that add trips.
+
+    """
+    return random_trip
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    """
+    This fixture returns a data_dir holding 80 trips over two
+    months, added in random pickup order.
+
+    """
+    pd.DataFrame({'location_id': range(1, len(LOCATIONS) + 1),
+                  'loc_name': LOCATIONS}).to_csv(
+        tmp_path / 'locations.csv', index=False)
+    rnd = random.Random(0)
+    SakayDB(str(tmp_path)).add_trips(
+        [random_trip(rnd, rnd.randrange(60)) for _ in range(80)])
+    return str(tmp_path)
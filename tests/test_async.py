@@ -0,0 +1,68 @@
+import asyncio
+import random
+import time
+
+import pytest
+from pandas.testing import assert_frame_equal
+
+from sakaydb import AsyncSakayDB, SakayDB, SakayDBError
+
+
+def test_calls_see_earlier_writes(data_dir, make_trip):
+    rnd = random.Random(7)
+    trips = [make_trip(rnd, rnd.randrange(60)) for _ in range(3)]
+
+    async def run():
+        async with AsyncSakayDB(data_dir, max_workers=4) as db:
+            return await asyncio.gather(
+                db.add_trips(trips[:2]),
+                db.search_trips(driver_id=(1, 10)),
+                db.delete_trip(81),
+                db.add_trip(**trips[2]),
+                db.search_trips(driver_id=(1, 10)),
+                db.generate_statistics('all'),
+                db.export_data())
+
+    added, before, _, trip_id, after, stats, export = asyncio.run(run())
+    assert added == [81, 82] and trip_id == 83
+    assert sorted(before['trip_id']) == list(range(1, 83))
+    assert 81 not in after['trip_id'].tolist()
+    assert len(after) == 82
+
+    ref = SakayDB(data_dir)
+    assert stats == ref.generate_statistics('all')
+    assert_frame_equal(export, ref.export_data())
+
+
+def test_writes_wait_for_earlier_reads(data_dir, make_trip, monkeypatch):
+    events = []
+    search_trips = SakayDB.search_trips
+
+    def slow_search(self, **kwargs):
+        time.sleep(0.2)
+        events.append('search')
+        return search_trips(self, **kwargs)
+
+    monkeypatch.setattr(SakayDB, 'search_trips', slow_search)
+    trip = make_trip(random.Random(8), 5)
+
+    async def run():
+        async with AsyncSakayDB(data_dir, max_workers=2) as db:
+            search = db.search_trips(driver_id=1)
+            trip_id = await db.add_trip(**trip)
+            events.append('add')
+            return await search, trip_id
+
+    found, trip_id = asyncio.run(run())
+    assert events == ['search', 'add']
+    assert trip_id not in found['trip_id'].tolist()
+
+
+def test_errors_are_raised_by_await(data_dir):
+    async def run():
+        async with AsyncSakayDB(data_dir) as db:
+            with pytest.raises(SakayDBError):
+                await db.delete_trip(1000)
+            return await db.search_trips(driver_id=1)
+
+    assert len(asyncio.run(run())) > 0
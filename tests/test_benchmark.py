@@ -0,0 +1,88 @@
+import json
+import os
+import subprocess
+import sys
+
+from pandas.testing import assert_frame_equal
+
+from benchmark import generate_data, run_benchmarks
+from sakaydb import SakayDB
+
+FILES = ['drivers.csv', 'locations.csv', 'trips.csv']
+
+
+def read_files(data_dir):
+    """
+    This function returns the contents of the tables in data_dir.
+
+    """
+    contents = []
+    for fn in FILES:
+        with open(f'{data_dir}/{fn}', 'rb') as f:
+            contents.append(f.read())
+    return contents
+
+
+def test_generate_data_is_reproducible(tmp_path):
+    params = generate_data(str(tmp_path / 'a'), 3000, locations=20,
+                           days=30, chunksize=1000)
+    generate_data(str(tmp_path / 'b'), 3000, locations=20, days=30,
+                  chunksize=1000)
+    generate_data(str(tmp_path / 'c'), 3000, locations=20, days=30,
+                  chunksize=1000, seed=1)
+    generate_data(str(tmp_path / 'd'), 3000, locations=20, days=30,
+                  chunksize=1000, text_datetimes=True)
+
+    assert params['drivers'] == 100
+    assert read_files(tmp_path / 'a') == read_files(tmp_path / 'b')
+    assert read_files(tmp_path / 'a')[2] != read_files(tmp_path / 'c')[2]
+
+    db = SakayDB(str(tmp_path / 'a'))
+    trips = db.read_table('trips')
+    assert trips['trip_id'].tolist() == list(range(1, 3001))
+    assert trips['driver_id'].between(1, 100).all()
+    assert trips['pickup_loc_id'].between(1, 20).all()
+    assert (trips['pickup_datetime'] // 86400).nunique() == 30
+    assert_frame_equal(SakayDB(str(tmp_path / 'd')).export_data(),
+                       db.export_data())
+
+
+def test_run_benchmarks_times_every_method(tmp_path):
+    data_dir = str(tmp_path / 'data')
+    generate_data(data_dir, 2000, locations=10, days=20)
+    before = read_files(data_dir)
+
+    report = run_benchmarks(data_dir, repeat=1)
+    assert read_files(data_dir) == before
+    assert {r['method'] for r in report['results']} == {
+        'search_trips', 'export_data', 'generate_statistics',
+        'generate_odmatrix', 'add_trip', 'add_trips', 'delete_trip'}
+    assert {r['variant'] for r in report['results']
+            if r['method'] == 'generate_statistics'} == {
+        'trip', 'passenger', 'driver', 'all'}
+    for result in report['results']:
+        assert result['calls'] == 1
+        assert result['latency_seconds']['mean'] > 0
+        assert result['peak_memory_bytes'] > 0
+    export = [r for r in report['results'] if r['method'] == 'export_data']
+    assert export[0]['rows'] == 2000
+    assert set(report['table_bytes']) == {'drivers', 'locations', 'trips'}
+
+
+def test_benchmark_command_line(tmp_path):
+    data_dir = str(tmp_path / 'data')
+    output = str(tmp_path / 'results.json')
+    script = os.path.join(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))), 'benchmark.py')
+    subprocess.run([sys.executable, script, 'generate', data_dir,
+                    '--trips', '500', '--days', '10'], check=True)
+    subprocess.run([sys.executable, script, 'run', data_dir, '--repeat',
+                    '0', '--only', 'generate_statistics', '--no-memory',
+                    '--output', output], check=True,
+                   stderr=subprocess.DEVNULL)
+
+    with open(output, encoding='utf-8') as f:
+        report = json.load(f)
+    assert report['data']['trips'] == 500
+    assert len(report['results']) == 4
+    assert all(r['peak_memory_bytes'] is None for r in report['results'])
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from sakaydb import SakayDB
+
+
+def test_compact_table_narrows_only_exact_columns(tmp_path):
+    db = SakayDB(str(tmp_path))
+    df = pd.DataFrame({
+        'trip_id': np.array([1, 2, 3], dtype='int64'),
+        'driver_id': np.array([1, 2, 2 ** 40], dtype='int64'),
+        'passenger_count': np.array([1, 2, 300], dtype='int64'),
+        'trip_distance': np.array([1.5, 2.25, 1000.0]),
+        'fare_amount': np.array([10.1, 20.0, 30.0]),
+    })
+    compact = db.compact_table('trips', df.copy())
+    assert compact.dtypes.astype(str).to_dict() == {
+        'trip_id': 'int32', 'driver_id': 'int64',
+        'passenger_count': 'int64', 'trip_distance': 'float32',
+        'fare_amount': 'float64'}
+    assert_frame_equal(db.widen_table('trips', compact), df)
+
+    names = pd.DataFrame({'location_id': [1, 2],
+                          'loc_name': ['Pine View', 'Poblacion']})
+    compact = db.compact_table('locations', names.copy())
+    assert str(compact['loc_name'].dtype) == 'category'
+    assert_frame_equal(db.widen_table('locations', compact), names)
+
+
+def test_results_keep_pandas_default_types(data_dir):
+    db = SakayDB(data_dir)
+    trips = db.read_table('trips')
+    assert str(trips['passenger_count'].dtype) == 'uint8'
+
+    found = db.search_trips(driver_id=1)
+    assert found.dtypes.astype(str).tolist() == [
+        'int64', 'int64', 'object', 'object', 'int64', 'int64', 'int64',
+        'float64', 'float64']
+    export = db.export_data()
+    assert export['driver_lastname'].dtype == object
+    assert export['passenger_count'].dtype == 'int64'
+
+
+def test_memory_usage_reports_cached_columns(data_dir):
+    db = SakayDB(data_dir)
+    assert len(db.memory_usage()) == 0
+
+    db.read_table('trips', copy=False)
+    usage = db.memory_usage()
+    trips = usage.loc['trips']
+    assert trips.loc['trip_id', 'dtype'] == 'int32'
+    assert trips.loc['trip_id', 'rows'] == 80
+    assert trips.loc['trip_id', 'bytes'] == 80 * 4
+    wide = db.widen_table('trips', db.read_table('trips'))
+    assert trips['bytes'].sum() < wide.memory_usage(index=False).sum()
@@ -0,0 +1,69 @@
+import random
+
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from sakaydb import SakayDB
+
+
+@pytest.fixture
+def legacy_dir(data_dir, tmp_path_factory):
+    """
+    This fixture returns a copy of data_dir whose trips.csv holds
+    datetimes as "hh:mm:ss,DD-MM-YYYY" strings, as written before
+    they were stored as seconds.
+
+    """
+    path = tmp_path_factory.mktemp('legacy')
+    for table in ['drivers', 'locations']:
+        pd.read_csv(f'{data_dir}/{table}.csv').to_csv(
+            path / f'{table}.csv', index=False)
+    trips = pd.read_csv(f'{data_dir}/trips.csv')
+    for col in ['pickup_datetime', 'dropoff_datetime']:
+        trips[col] = pd.to_datetime(trips[col], unit='s').dt.strftime(
+            '%H:%M:%S,%d-%m-%Y')
+    trips.to_csv(path / 'trips.csv', index=False)
+    return str(path)
+
+
+def test_datetimes_stored_as_seconds(data_dir):
+    trips = pd.read_csv(f'{data_dir}/trips.csv')
+    assert trips['pickup_datetime'].dtype == 'int64'
+    assert trips['dropoff_datetime'].dtype == 'int64'
+
+
+def test_legacy_datetimes_read_without_rewrite(data_dir, legacy_dir):
+    with open(f'{legacy_dir}/trips.csv', encoding='utf-8') as f:
+        text = f.read()
+
+    db, ref = SakayDB(legacy_dir), SakayDB(data_dir)
+    assert_frame_equal(db.export_data(), ref.export_data())
+    kwargs = {'pickup_datetime': ('00:00:00,10-01-2020', None)}
+    assert_frame_equal(db.search_trips(**kwargs), ref.search_trips(**kwargs))
+    assert db.generate_statistics('all') == ref.generate_statistics('all')
+
+    with open(f'{legacy_dir}/trips.csv', encoding='utf-8') as f:
+        assert f.read() == text
+
+
+def test_legacy_datetimes_rewritten_by_next_write(legacy_dir, make_trip):
+    db = SakayDB(legacy_dir)
+    before = db.read_table('trips')
+    trip_id = db.add_trip(**make_trip(random.Random(4), 12))
+
+    trips = pd.read_csv(f'{legacy_dir}/trips.csv')
+    assert trips['pickup_datetime'].dtype == 'int64'
+    assert trips['trip_id'].tolist() == before['trip_id'].tolist() + [
+        trip_id]
+    assert_frame_equal(SakayDB(legacy_dir).read_table('trips').iloc[:-1],
+                       before)
+
+
+def test_legacy_datetimes_rewritten_by_migrate(legacy_dir):
+    before = SakayDB(legacy_dir).read_table('trips')
+    SakayDB(legacy_dir).migrate_storage('csv')
+
+    trips = pd.read_csv(f'{legacy_dir}/trips.csv')
+    assert trips['pickup_datetime'].dtype == 'int64'
+    assert_frame_equal(SakayDB(legacy_dir).read_table('trips'), before)
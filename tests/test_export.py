@@ -0,0 +1,34 @@
+import io
+import random
+
+import pandas as pd
+
+from sakaydb import EXPORT_COLUMNS, SakayDB
+
+
+def test_export_to_file_matches_dataframe(data_dir, make_trip, tmp_path):
+    db = SakayDB(data_dir)
+    trip = make_trip(random.Random(5), 20)
+    trip['driver'] = 'Peñaflor, Niño'
+    db.add_trip(**trip)
+    db.delete_trip(4)
+    expected = db.export_data().to_csv(index=False)
+
+    fn = tmp_path / 'export.csv'
+    streamed = SakayDB(data_dir)
+    streamed.export_data(str(fn), chunksize=9)
+    assert 'trips' not in streamed.table_cache
+    assert fn.read_bytes() == expected.encode('utf-8')
+
+    buf = io.StringIO()
+    SakayDB(data_dir).export_data(buf, chunksize=1000)
+    assert buf.getvalue() == expected
+    assert 'Peñaflor' in buf.getvalue()
+
+
+def test_export_empty_table(tmp_path):
+    pd.DataFrame({'location_id': [1], 'loc_name': ['Poblacion']}).to_csv(
+        tmp_path / 'locations.csv', index=False)
+    buf = io.StringIO()
+    SakayDB(str(tmp_path)).export_data(buf)
+    assert buf.getvalue() == ','.join(EXPORT_COLUMNS) + '\n'
@@ -0,0 +1,34 @@
+import os
+import random
+
+from sakaydb import SakayDB
+
+
+def test_ids_not_reused_after_delete(data_dir, make_trip):
+    db = SakayDB(data_dir)
+    last = db.read_table('trips')['trip_id'].max()
+    db.delete_trip(last)
+    rnd = random.Random(1)
+    assert db.add_trip(**make_trip(rnd, 3)) == last + 1
+
+    db.delete_trip(last + 1)
+    os.remove(f'{data_dir}/trips.seq')
+    assert SakayDB(data_dir).add_trip(**make_trip(rnd, 3)) == last + 2
+
+    db.delete_trip(last + 2)
+    db.compact(0)
+    assert (db.read_table('trips')['trip_id'] < last).all()
+    assert SakayDB(data_dir).add_trip(**make_trip(rnd, 4)) == last + 3
+    assert db.add_trips([make_trip(rnd, 5), make_trip(rnd, 6)]) == [
+        last + 4, last + 5]
+
+
+def test_new_drivers_get_next_id(data_dir, make_trip):
+    db = SakayDB(data_dir)
+    trip = make_trip(random.Random(2), 8)
+    trip['driver'] = 'Mendoza, Luis'
+    db.add_trip(**trip)
+
+    drivers = SakayDB(data_dir).read_table('drivers')
+    assert drivers['driver_id'].tolist() == [1, 2, 3, 4, 5]
+    assert SakayDB(data_dir).get_driver_id('Mendoza, Luis') == 5
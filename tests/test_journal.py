@@ -0,0 +1,63 @@
+import json
+import multiprocessing
+import random
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from conftest import random_trip
+from sakaydb import SakayDB
+
+
+def add_batch(data_dir, seed):
+    """
+    This function adds 25 trips from a separate process.
+
+    """
+    rnd = random.Random(seed)
+    return SakayDB(data_dir).add_trips(
+        [random_trip(rnd, rnd.randrange(60)) for _ in range(25)])
+
+
+def test_journal_replayed_after_crash(data_dir):
+    db = SakayDB(data_dir)
+    before = db.read_table('trips')
+    rows = pd.DataFrame([[len(before) + 1, 1, 1579000000, 1579001800, 2,
+                          1, 2, 1234.5, 150.0]],
+                        columns=before.columns)
+    text = rows.to_csv(index=False, header=False)
+    with open(f'{data_dir}/trips.journal', 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'op': 'append', 'rows': text}))
+    with open(f'{data_dir}/trips.csv', 'a', encoding='utf-8') as f:
+        f.write(text[:10])
+
+    after = SakayDB(data_dir).read_table('trips')
+    assert len(after) == len(before) + 1
+    assert after['trip_id'].tolist()[-1] == len(before) + 1
+    assert after['fare_amount'].tolist()[-1] == 150.0
+
+    with open(f'{data_dir}/trips.journal', 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'op': 'append', 'rows': text}))
+    again = SakayDB(data_dir).read_table('trips')
+    assert_frame_equal(again, after)
+
+
+def test_deletes_replayed_after_crash(data_dir):
+    with open(f'{data_dir}/trips.journal', 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'op': 'tombstones', 'trip_ids': [3, 7]}))
+
+    trips = SakayDB(data_dir).read_table('trips')
+    assert len(trips) == 78
+    assert not trips['trip_id'].isin([3, 7]).any()
+
+
+def test_processes_write_without_losing_rows(data_dir):
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(3) as pool:
+        ids = pool.starmap(add_batch, [(data_dir, seed)
+                                       for seed in range(10, 13)])
+
+    ids = [x for batch in ids for x in batch]
+    assert sorted(ids) == list(range(81, 156))
+    trips = SakayDB(data_dir).read_table('trips')
+    assert trips['trip_id'].tolist() == list(range(1, 156))
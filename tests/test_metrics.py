@@ -0,0 +1,60 @@
+import io
+import os
+import random
+
+import pytest
+
+from sakaydb import METRIC_PHASES, SakayDB, SakayDBError
+
+
+def test_metrics_off_by_default(data_dir):
+    db = SakayDB(data_dir)
+    db.search_trips(driver_id=1)
+    db.generate_statistics('all')
+    assert db.metrics() == {}
+
+
+def test_metrics_record_calls(data_dir, make_trip):
+    size = os.path.getsize(f'{data_dir}/trips.csv')
+    db = SakayDB(data_dir, instrument=True)
+    found = db.search_trips(driver_id=(1, 2))
+    db.search_trips(passenger_count=3)
+    trip_id = db.add_trip(**make_trip(random.Random(9), 4))
+    with pytest.raises(SakayDBError):
+        db.delete_trip(1000)
+    db.export_data(io.StringIO(), chunksize=10)
+
+    metrics = db.metrics()
+    search = metrics['search_trips']
+    assert search['calls'] == 2 and search['errors'] == 0
+    assert search['rows_scanned'] == 160
+    assert search['rows_returned'] >= len(found)
+    assert search['bytes_read'] >= size
+    assert search['mean_seconds'] == search['seconds'] / 2
+    assert set(search['phases']) == set(METRIC_PHASES)
+    assert sum(search['phases'].values()) <= search['seconds'] + 1e-6
+
+    add = metrics['add_trip']
+    assert add['rows_returned'] == 1 and add['bytes_written'] > 0
+    assert metrics['delete_trip']['calls'] == 1
+    assert metrics['delete_trip']['errors'] == 1
+    assert metrics['export_data']['rows_returned'] == trip_id
+    assert 'read_table' not in metrics
+
+    assert db.metrics(reset=True) == metrics
+    assert db.metrics() == {}
+
+
+def test_metrics_callback(data_dir):
+    records = []
+    db = SakayDB(data_dir, metrics_callback=records.append)
+    db.generate_statistics('trip')
+    with pytest.raises(SakayDBError):
+        db.generate_statistics('x')
+
+    assert [r['method'] for r in records] == ['generate_statistics'] * 2
+    assert records[0]['error'] is None
+    assert records[0]['rows_returned'] == len(
+        db.generate_statistics('trip'))
+    assert records[1]['error'] == 'SakayDBError'
+    assert db.metrics()['generate_statistics']['calls'] == 3
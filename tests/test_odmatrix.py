@@ -0,0 +1,90 @@
+import random
+import shutil
+
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from sakaydb import SakayDB, SakayDBError
+
+RANGES = [
+    None,
+    ('00:00:00,10-01-2020', None),
+    (None, '12:00:00,05-02-2020'),
+    ('06:00:00,15-01-2020', '18:00:00,15-02-2020')
+]
+
+
+def test_od_store_follows_writes(data_dir, make_trip):
+    db = SakayDB(data_dir)
+    db.generate_odmatrix()
+    store = db.od_cache
+
+    def fail(*args):
+        raise AssertionError('OD counted again')
+
+    db.map_workers = fail
+    rnd = random.Random(6)
+    db.add_trips([make_trip(rnd, rnd.randrange(70)) for _ in range(8)])
+    db.add_trip(**make_trip(rnd, 90))
+    for trip_id in [2, 30, 85]:
+        db.delete_trip(trip_id)
+    db.compact(0)
+
+    ref_dir = f'{data_dir}_ref'
+    shutil.copytree(data_dir, ref_dir)
+    ref = SakayDB(ref_dir)
+    for date_range in RANGES:
+        assert_frame_equal(db.generate_odmatrix(date_range),
+                           ref.generate_odmatrix(date_range))
+    assert db.od_cache is store
+    assert store['counts'].sum() == len(db.read_table('trips'))
+
+
+def pivot_odmatrix(db, date_range=None):
+    """
+    This function computes generate_odmatrix the way it was first
+    written, on location names and formatted dates with
+    pivot_table.
+
+    """
+    trips = db.export_data()
+    pickup = pd.to_datetime(trips['pickup_datetime'],
+                            format='%H:%M:%S,%d-%m-%Y')
+    if date_range is not None:
+        start, end = [None if x is None else
+                      pd.to_datetime(x, format='%H:%M:%S,%d-%m-%Y')
+                      for x in date_range]
+        keep = pd.Series(True, index=trips.index)
+        if start is not None:
+            keep &= pickup > start if end is not None else pickup >= start
+        if end is not None:
+            keep &= pickup <= end
+        trips, pickup = trips[keep], pickup[keep]
+
+    trips = pd.DataFrame({'count': 1,
+                          'pickup_loc_name': trips['pickup_loc_name'],
+                          'dropoff_loc_name': trips['dropoff_loc_name'],
+                          'pickup_date': pickup.dt.strftime('%Y-%m-%d')})
+    od_matrix = trips.groupby(['pickup_loc_name', 'dropoff_loc_name',
+                               'pickup_date'], as_index=False).sum()
+    od_matrix = od_matrix.pivot_table(columns='pickup_loc_name',
+                                      index='dropoff_loc_name',
+                                      aggfunc='mean', fill_value=0)
+    od_matrix.columns = [x[1] for x in od_matrix.columns]
+    return od_matrix
+
+
+@pytest.mark.parametrize('date_range', RANGES)
+def test_odmatrix_matches_pivot_table(data_dir, date_range):
+    db = SakayDB(data_dir)
+    assert_frame_equal(db.generate_odmatrix(date_range),
+                       pivot_odmatrix(db, date_range))
+
+
+def test_odmatrix_checks_date_range(data_dir):
+    db = SakayDB(data_dir)
+    for date_range in [('2020-01-01', None), (None, 'x'),
+                       ('00:00:00,01-01-2020', '01-02-2020')]:
+        with pytest.raises(SakayDBError):
+            db.generate_odmatrix(date_range)
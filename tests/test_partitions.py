@@ -0,0 +1,57 @@
+import os
+import random
+import shutil
+
+import pytest
+
+from conftest import assert_same_output
+from sakaydb import SakayDB
+
+
+@pytest.mark.parametrize('storage, partition', [
+    ('csv', 'month'), ('csv', 'day'), ('parquet', 'month'),
+    ('feather', 'day')])
+def test_partitioned_trips_give_same_output(data_dir, make_trip, storage,
+                                            partition):
+    if storage != 'csv':
+        pytest.importorskip('pyarrow')
+    rnd = random.Random(3)
+    SakayDB(data_dir).delete_trip(5)
+    SakayDB(data_dir).add_trips(
+        [make_trip(rnd, rnd.randrange(60)) for _ in range(5)])
+    shutil.copytree(data_dir, f'{data_dir}_ref')
+    ref = SakayDB(f'{data_dir}_ref')
+    SakayDB(data_dir).migrate_storage(storage, partition)
+
+    for db in [SakayDB(data_dir, storage=storage, partition=partition),
+               SakayDB(data_dir, storage=storage, partition=partition)]:
+        assert_same_output(db, ref)
+
+    db = SakayDB(data_dir, storage=storage, partition=partition)
+    batch = [make_trip(rnd, rnd.randrange(60)) for _ in range(6)]
+    for x in [db, ref]:
+        x.add_trips(batch)
+        x.delete_trip(12)
+    assert_same_output(SakayDB(data_dir, storage=storage,
+                               partition=partition), ref)
+
+
+def test_search_reads_only_partitions_in_range(data_dir):
+    SakayDB(data_dir).migrate_storage('csv', 'month')
+    db = SakayDB(data_dir, partition='month')
+    assert sorted(os.listdir(db.table_path('trips'))) == [
+        '2020-01.csv', '2020-02.csv']
+
+    read = []
+    load_table = db.load_table
+
+    def spy(table, columns=None, files=None):
+        read.append(files)
+        return load_table(table, columns=columns, files=files)
+
+    db.load_table = spy
+    found = db.search_trips(pickup_datetime=('00:00:00,05-01-2020',
+                                             '23:59:59,09-01-2020'))
+    assert len(found) > 0
+    assert [os.path.basename(fn) for fn in read[0]] == ['2020-01.csv']
+    assert not db.table_cached('trips')
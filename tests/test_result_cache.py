@@ -0,0 +1,51 @@
+import random
+
+import pytest
+from pandas.testing import assert_frame_equal
+
+from conftest import DRIVERS
+from sakaydb import SakayDB, SakayDBError
+
+
+def test_result_cache_invalidated_by_writes(data_dir, make_trip):
+    db = SakayDB(data_dir, result_cache_size=8)
+    found = db.search_trips(driver_id=1)
+    stats = db.generate_statistics('trip')
+
+    trip = make_trip(random.Random(2), 10)
+    trip['driver'] = DRIVERS[0]
+    trip_id = db.add_trip(**trip)
+    added = db.search_trips(driver_id=1)
+    assert len(added) == len(found) + 1
+    assert db.generate_statistics('trip') != stats
+
+    db.delete_trip(trip_id)
+    assert_frame_equal(db.search_trips(driver_id=1), found)
+    assert db.generate_statistics('trip') == stats
+
+
+def test_result_cache_keeps_argument_types_apart(data_dir):
+    db = SakayDB(data_dir, result_cache_size=8)
+    db.search_trips(driver_id=3)
+    with pytest.raises(SakayDBError):
+        db.search_trips(driver_id=3.0)
+    db.search_trips(trip_distance=(1000, None))
+    with pytest.raises(SakayDBError):
+        db.search_trips(trip_distance=[1000, None])
+
+
+def test_result_cache_keeps_keyword_order(data_dir):
+    db = SakayDB(data_dir, result_cache_size=4)
+    uncached = SakayDB(data_dir)
+    for kwargs in [{'fare_amount': (100.0, 800.0), 'driver_id': (1, 10)},
+                   {'driver_id': (1, 10), 'fare_amount': (100.0, 800.0)}]:
+        assert_frame_equal(db.search_trips(**kwargs),
+                           uncached.search_trips(**kwargs))
+    assert db.result_cache_misses == 2
+
+
+def test_result_cache_evicts_least_recently_used(data_dir):
+    db = SakayDB(data_dir, result_cache_size=2)
+    for driver_id in [1, 2, 1, 3, 1, 2]:
+        db.search_trips(driver_id=driver_id)
+    assert (db.result_cache_hits, db.result_cache_misses) == (2, 4)
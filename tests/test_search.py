@@ -0,0 +1,44 @@
+import random
+
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from sakaydb import SakayDB, SakayDBError
+
+SEARCHES = [
+    {'driver_id': 3},
+    {'passenger_count': (2, 3)},
+    {'fare_amount': (None, 300)},
+    {'pickup_datetime': ('00:00:00,15-01-2020', '23:59:59,31-01-2020'),
+     'trip_distance': (1000, None)},
+    {'dropoff_datetime': ('12:00:00,01-02-2020', None),
+     'driver_id': (1, 2)}
+]
+
+
+@pytest.mark.parametrize('kwargs', SEARCHES)
+def test_iter_search_matches_search(data_dir, make_trip, kwargs):
+    db = SakayDB(data_dir)
+    rnd = random.Random(4)
+    db.add_trips([make_trip(rnd, rnd.randrange(60)) for _ in range(5)])
+    db.delete_trip(10)
+    db.delete_trip(50)
+
+    expected = db.search_trips(**kwargs)
+    streamed = SakayDB(data_dir)
+    batches = list(streamed.iter_search_trips(chunksize=7, **kwargs))
+    assert 'trips' not in streamed.table_cache
+    assert all(0 < len(batch) <= 7 for batch in batches)
+    assert_frame_equal(pd.concat(batches).sort_index(),
+                       expected.sort_index())
+
+
+def test_iter_search_checks_input(data_dir):
+    db = SakayDB(data_dir)
+    with pytest.raises(SakayDBError):
+        db.iter_search_trips()
+    with pytest.raises(SakayDBError):
+        db.iter_search_trips(trip_id=1)
+    with pytest.raises(SakayDBError):
+        next(db.iter_search_trips(passenger_count=(3, 'x')))
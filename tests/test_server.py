@@ -0,0 +1,76 @@
+import io
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+from pandas.testing import assert_frame_equal
+
+from sakaydb import SakayDB, SakayDBServer
+from sakaydb_client import SakayDBClient, SakayDBError
+
+
+@pytest.fixture
+def server(data_dir):
+    """
+    This fixture serves data_dir on a free port in a thread.
+
+    """
+    with SakayDBServer(data_dir, port=0, result_cache_size=8) as server:
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        yield server
+        server.shutdown()
+        thread.join()
+
+
+def test_client_gets_same_results(server, data_dir):
+    db = SakayDB(data_dir)
+    with SakayDBClient(*server.address, data_dir=data_dir) as client:
+        kwargs = {'pickup_datetime': ('00:00:00,10-01-2020', None),
+                  'driver_id': (2, 3)}
+        assert_frame_equal(client.search_trips(**kwargs),
+                           db.search_trips(**kwargs))
+        assert (client.generate_statistics('all') ==
+                db.generate_statistics('all'))
+        assert_frame_equal(client.generate_odmatrix(),
+                           db.generate_odmatrix())
+
+        buf = io.StringIO()
+        db.export_data(buf)
+        assert client.export_data() == buf.getvalue()
+
+        trip_id = client.add_trip(
+            'Santos, Maria', '10:00:00,05-01-2020', '10:30:00,05-01-2020',
+            2, 'Pine View', 'Poblacion', 1500.0, 120.0)
+        assert SakayDB(data_dir).read_table('trips')['trip_id'].max() \
+            == trip_id
+        with pytest.raises(SakayDBError):
+            client.delete_trip(trip_id + 100)
+
+
+def test_requests_need_token(server, data_dir):
+    with SakayDBClient(*server.address, token='0' * 64) as client:
+        with pytest.raises(RuntimeError, match='token'):
+            client.search_trips(driver_id=1)
+    assert os.stat(f'{data_dir}/server.token').st_mode & 0o777 == 0o600
+
+
+def test_serve_command_reports_metrics(data_dir):
+    proc = subprocess.Popen(
+        [sys.executable, 'sakaydb.py', 'serve', data_dir, '--port', '0',
+         '--instrument'],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        stdout=subprocess.PIPE, text=True)
+    try:
+        line = proc.stdout.readline()
+        host, port = line.split('http://')[1].split(',')[0].split(':')
+        with SakayDBClient(host, int(port), data_dir=data_dir) as client:
+            client.search_trips(driver_id=1)
+            metrics = client.metrics()
+        assert metrics['search_trips']['calls'] == 1
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+    assert not os.path.exists(f'{data_dir}/server.token')
@@ -0,0 +1,94 @@
+import glob
+import os
+import random
+import shutil
+
+import pandas as pd
+
+from sakaydb import DAY_NAMES, SakayDB
+
+
+def rebuilt_stats(data_dir):
+    """
+    This function returns generate_statistics('all') counted from
+    a copy of the trips table, without trips.stats.
+
+    """
+    ref_dir = f'{data_dir}_ref'
+    shutil.rmtree(ref_dir, ignore_errors=True)
+    shutil.copytree(data_dir, ref_dir)
+    for fn in glob.glob(f'{ref_dir}/trips.stats*'):
+        os.remove(fn)
+    return SakayDB(ref_dir).generate_statistics('all')
+
+
+def test_stats_follow_writes(data_dir, make_trip):
+    db = SakayDB(data_dir)
+    db.generate_statistics('all')
+
+    rnd = random.Random(3)
+    db.add_trips([make_trip(rnd, rnd.randrange(60)) for _ in range(10)])
+    other = SakayDB(data_dir)
+    other.add_trip(**make_trip(rnd, 61))
+    for trip_id in [1, 2, 40, 85]:
+        other.delete_trip(trip_id)
+    db.delete_trip(86)
+
+    expected = rebuilt_stats(data_dir)
+    assert db.generate_statistics('all') == expected
+    assert other.generate_statistics('all') == expected
+    assert SakayDB(data_dir).generate_statistics('all') == expected
+
+    trips = db.read_table('trips')
+    daily = (trips['pickup_datetime'] // 86400).value_counts()
+    weekday = (daily.index + 3) % 7
+    assert expected['trip'] == {DAY_NAMES[day]: avg for day, avg in
+                                daily.groupby(weekday).mean().items()}
+
+
+def test_stats_shared_driver_name(data_dir):
+    drivers = pd.read_csv(f'{data_dir}/drivers.csv')
+    drivers.loc[1, ['last_name', 'given_name']] = drivers.loc[
+        0, ['last_name', 'given_name']].values
+    drivers.to_csv(f'{data_dir}/drivers.csv', index=False)
+
+    db = SakayDB(data_dir)
+    trips = db.read_table('trips')
+    trips = trips[trips['driver_id'].isin([1, 2])]
+    daily = (trips['pickup_datetime'] // 86400).value_counts()
+    weekday = (daily.index + 3) % 7
+
+    stats = db.generate_statistics('driver')
+    assert len(stats) == 3
+    name = ', '.join(drivers.loc[0, ['last_name', 'given_name']])
+    assert stats[name] == {DAY_NAMES[day]: avg for day, avg in
+                           daily.groupby(weekday).mean().items()}
+
+
+def test_stats_loaded_after_moving_data_dir(data_dir, tmp_path_factory,
+                                            monkeypatch):
+    expected = SakayDB(data_dir).generate_statistics('all')
+    moved = str(tmp_path_factory.mktemp('moved') / 'data')
+    shutil.move(data_dir, moved)
+
+    def fail(self, df):
+        raise AssertionError('trips counted again')
+
+    monkeypatch.setattr(SakayDB, 'partition_stats', fail)
+    assert SakayDB(moved).generate_statistics('all') == expected
+
+
+def test_stat_methods_match_generate_statistics(data_dir):
+    db = SakayDB(data_dir)
+    expected = db.generate_statistics('all')
+    trips = db.read_table('trips')
+    dated = trips.assign(pickup_datetime=pd.to_datetime(
+        trips['pickup_datetime'], unit='s'))
+
+    for df in [trips, dated]:
+        assert db.stat_trips(df.copy()) == expected['trip']
+        assert db.stat_passenger(df.copy()) == expected['passenger']
+        assert db.stat_driver(df.copy()) == expected['driver']
+        assert list(db.stat_passenger(df)) == list(expected['passenger'])
+        assert list(db.stat_driver(df)) == list(expected['driver'])
+    assert (db.pickup_days(trips) == db.pickup_days(dated)).all()
@@ -0,0 +1,44 @@
+import importlib.util
+import os
+import random
+import shutil
+
+import pytest
+
+from conftest import assert_same_output
+from sakaydb import SakayDB, SakayDBError
+
+
+@pytest.mark.parametrize('storage', ['parquet', 'feather'])
+def test_columnar_storage_gives_same_output(data_dir, make_trip, storage):
+    pytest.importorskip('pyarrow')
+    rnd = random.Random(3)
+    SakayDB(data_dir).delete_trip(5)
+    SakayDB(data_dir).add_trips(
+        [make_trip(rnd, rnd.randrange(60)) for _ in range(5)])
+    shutil.copytree(data_dir, f'{data_dir}_ref')
+    ref = SakayDB(f'{data_dir}_ref')
+    SakayDB(data_dir).migrate_storage(storage)
+    assert os.path.isdir(f'{data_dir}/trips.{storage}')
+
+    db = SakayDB(data_dir, storage=storage)
+    assert_same_output(db, ref)
+
+    trip = make_trip(rnd, 20)
+    for x in [db, ref]:
+        x.add_trip(**trip)
+        x.delete_trip(9)
+    assert_same_output(SakayDB(data_dir, storage=storage), ref)
+
+
+def test_unknown_storage_rejected(data_dir):
+    with pytest.raises(SakayDBError):
+        SakayDB(data_dir, storage='orc')
+
+
+def test_columnar_storage_requires_pyarrow(data_dir, monkeypatch):
+    find_spec = importlib.util.find_spec
+    monkeypatch.setattr(importlib.util, 'find_spec', lambda name: (
+        None if name == 'pyarrow' else find_spec(name)))
+    with pytest.raises(SakayDBError, match='requires pyarrow'):
+        SakayDB(data_dir, storage='parquet')
@@ -0,0 +1,54 @@
+import os
+import random
+
+import sakaydb
+from sakaydb import SakayDB
+
+
+def test_delete_only_appends_tombstones(data_dir):
+    db = SakayDB(data_dir, compact_threshold=0.01)
+    with open(f'{data_dir}/trips.csv', 'rb') as f:
+        before = f.read()
+
+    for trip_id in [3, 7, 11]:
+        db.delete_trip(trip_id)
+
+    with open(f'{data_dir}/trips.csv', 'rb') as f:
+        assert f.read() == before
+    with open(f'{data_dir}/trips.tombstones', encoding='utf-8') as f:
+        assert f.read() == '3\n7\n11\n'
+    for other in [db, SakayDB(data_dir)]:
+        trip_ids = other.read_table('trips')['trip_id'].tolist()
+        assert not {3, 7, 11} & set(trip_ids)
+        assert len(trip_ids) == 77
+
+
+def test_compact_checks_threshold(data_dir):
+    db = SakayDB(data_dir, compact_threshold=0.5)
+    db.delete_trip(5)
+    assert not db.compact()
+    assert os.path.exists(f'{data_dir}/trips.tombstones')
+
+    assert db.compact(0.01)
+    assert not os.path.exists(f'{data_dir}/trips.tombstones')
+    trip_ids = SakayDB(data_dir).read_table('trips')['trip_id'].tolist()
+    assert 5 not in trip_ids and len(trip_ids) == 79
+
+
+def test_data_synced_before_journal_cleared(data_dir, make_trip,
+                                            monkeypatch):
+    calls = []
+    fsync = os.fsync
+    monkeypatch.setattr(sakaydb.os, 'fsync',
+                        lambda fd: calls.append('fsync') or fsync(fd))
+    clear_journal = SakayDB.clear_journal
+    monkeypatch.setattr(SakayDB, 'clear_journal', lambda self, table: (
+        calls.append('clear'), clear_journal(self, table)))
+
+    db = SakayDB(data_dir)
+    db.add_trip(**make_trip(random.Random(1), 3))
+    assert calls == ['fsync', 'fsync', 'clear']
+
+    calls.clear()
+    db.delete_trip(1)
+    assert calls == ['fsync', 'fsync', 'clear']
@@ -0,0 +1,42 @@
+import glob
+import os
+import shutil
+
+import numpy as np
+from pandas.testing import assert_frame_equal
+
+from sakaydb import SakayDB
+
+
+def test_workers_match_single_process(data_dir):
+    ref_dir = f'{data_dir}_ref'
+    shutil.copytree(data_dir, ref_dir)
+    ref = SakayDB(ref_dir)
+
+    with SakayDB(data_dir, workers=2) as db:
+        calls = []
+        map_workers = db.map_workers
+
+        def spy(func, *iterables):
+            calls.append([x for args in iterables for x in args])
+            return map_workers(func, *iterables)
+
+        db.map_workers = spy
+        assert db.generate_statistics('all') == ref.generate_statistics(
+            'all')
+        assert_frame_equal(db.generate_odmatrix(),
+                           ref.generate_odmatrix())
+        pool = db.pool
+        assert pool is not None
+
+        for fn in glob.glob(f'{data_dir}/trips.stats*'):
+            os.remove(fn)
+        db.stats_cache = db.od_cache = None
+        assert db.generate_statistics('all') == ref.generate_statistics(
+            'all')
+        assert db.pool is pool
+
+    assert db.pool is None
+    assert len(calls) == 3
+    assert all(isinstance(x, (np.ndarray, int)) for args in calls
+               for x in args)